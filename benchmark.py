@@ -0,0 +1,213 @@
+'''performance benchmarks script'''
+
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarking.distributed_crawl import run_distributed_crawl
+from benchmarking.extraction_benchmark import run_extraction_benchmark
+from benchmarking.mock_server import MockRedditSettings
+from benchmarking.search_benchmark import generate_queries, run_search_benchmark
+from benchmarking.suite import run_suite
+from benchmarking.text_cleaning_benchmark import run_text_cleaning_benchmark
+from indexing.query_engine import load_queries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script for measuring crawled pages processing speed.',
+    )
+
+    parser.add_argument(
+        '--input_path',
+        type=str,
+        default=os.path.join('.', 'posts'),
+        help=('path where crawled pages stored'),
+    )
+
+    parser.add_argument(
+        '--pages',
+        type=int,
+        default=200,
+        help=('number of pages (first by filename) used for benchmark'),
+    )
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help=('how many times pages are processed, best run is reported'),
+    )
+
+    parser.add_argument(
+        '--index_path',
+        type=str,
+        help=('path of index built by index.py, if given search is benchmarked over it '
+              'instead of benchmarking pages from input_path'),
+    )
+
+    parser.add_argument(
+        '--queries_path',
+        type=str,
+        help=('query log with one query per line used for search benchmark, '
+              'by default queries are made of random index terms'),
+    )
+
+    parser.add_argument(
+        '--queries',
+        type=int,
+        default=1000,
+        help=('number of random queries made when there is no query log'),
+    )
+
+    parser.add_argument(
+        '--suite',
+        action='store_true',
+        help=('runs offline suite on generated pages and mock old.reddit '
+              'instead of benchmarking pages from input_path'),
+    )
+
+    parser.add_argument(
+        '--distributed',
+        action='store_true',
+        help=('crawls mock old.reddit by coordinator and --nodes crawl.py nodes, '
+              'kills one node and checks that the whole range is crawled anyway'),
+    )
+
+    parser.add_argument(
+        '--nodes',
+        type=int,
+        default=3,
+        help=('number of crawl.py nodes in distributed crawl'),
+    )
+
+    parser.add_argument(
+        '--results_path',
+        type=str,
+        default=os.path.join('.', 'benchmark_results.jsonl'),
+        help=('file suite results are appended to'),
+    )
+
+    parser.add_argument(
+        '--crawl_posts',
+        type=int,
+        default=2000,
+        help=('number of post ids crawled from mock old.reddit in suite '
+              'and in distributed crawl'),
+    )
+
+    parser.add_argument(
+        '--mock_latency',
+        type=float,
+        default=0.05,
+        help=('seconds mock old.reddit waits before every response'),
+    )
+
+    parser.add_argument(
+        '--mock_error_rate',
+        type=float,
+        default=0.01,
+        help=('share of mock old.reddit responses with 503 status'),
+    )
+
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=2,
+        help=('number of parse.py processes in suite'),
+    )
+
+    args = parser.parse_args()
+
+    if args.suite:
+        suite_results = run_suite(
+            results_path=args.results_path,
+            pages_count=args.pages,
+            crawl_posts_count=args.crawl_posts,
+            workers_count=args.workers,
+            settings=MockRedditSettings(
+                latency=args.mock_latency,
+                error_rate=args.mock_error_rate,
+            ),
+        )
+        for result in suite_results:
+            name = result['benchmark']
+            if 'discovery' in result:
+                name = f'{name} ({result["discovery"]})'
+            if 'queries_per_second' in result:
+                print(f'{name}: {result["queries_per_second"]:.1f} queries/s, '
+                      f'p50 {result["p50_ms"]:.2f} ms, p99 {result["p99_ms"]:.2f} ms')
+            else:
+                print(f'{name}: {result["pages_per_second"]:.1f} pages/s')
+        print(f'Results appended to {args.results_path}')
+        sys.exit(0)
+
+    if args.distributed:
+        with tempfile.TemporaryDirectory() as work_dir:
+            crawl_results = run_distributed_crawl(
+                work_dir,
+                MockRedditSettings(
+                    latency=args.mock_latency,
+                    error_rate=args.mock_error_rate,
+                ),
+                posts_count=args.crawl_posts,
+                nodes_count=args.nodes,
+            )
+        print(f'Nodes: {crawl_results["nodes"]}, killed: {crawl_results["killed_nodes"]}')
+        print(f'Distributed crawl: {crawl_results["pages_per_second"]:.1f} pages/s')
+        print(f'Post numbers left out of journal: {crawl_results["remaining"]}')
+        print(f'Existing posts not fetched by any node: {crawl_results["not_fetched"]}')
+        sys.exit(0 if crawl_results['remaining'] == 0 and crawl_results['not_fetched'] == 0 else 1)
+
+    if args.index_path is not None:
+        if args.queries_path is not None:
+            queries = load_queries(args.queries_path)
+        else:
+            queries = generate_queries(args.index_path, queries_count=args.queries)
+
+        search_results = run_search_benchmark(args.index_path, queries)
+        if search_results is None:
+            print('No queries to run')
+            sys.exit(0)
+
+        print(f'Queries: {search_results["queries"]}, top {search_results["k"]}')
+        for mode in ('pruned', 'exhaustive'):
+            stats = search_results[mode]
+            print(f'{mode.capitalize()} search: p50 {stats["p50_ms"]:.2f} ms, '
+                  f'p99 {stats["p99_ms"]:.2f} ms, {stats["queries_per_second"]:.1f} queries/s')
+        print(f'Batch search: {search_results["batch_queries_per_second"]:.1f} queries/s')
+        print(f'Queries with different results: {search_results["mismatches"]}')
+        sys.exit(0)
+
+    results = run_extraction_benchmark(
+        root_dir=args.input_path,
+        pages_count=args.pages,
+        repeat=args.repeat,
+    )
+
+    if results is None:
+        print(f'No pages found in {args.input_path}')
+    else:
+        print(f'Pages: {results["pages"]}')
+        print('Per field parsing: '
+              f'{results["per_field_pages_per_second"]:.1f} pages/s')
+        print('Single pass parsing: '
+              f'{results["single_pass_pages_per_second"]:.1f} pages/s')
+        print(f'Speedup: {results["speedup"]:.2f}x')
+        print(f'Pages with different output: {results["mismatches"]}')
+
+        cleaning_results = run_text_cleaning_benchmark(
+            root_dir=args.input_path,
+            pages_count=args.pages,
+            repeat=args.repeat,
+        )
+        if cleaning_results is not None:
+            print(f'Post texts: {cleaning_results["texts"]}')
+            print('Sequential text cleaning: '
+                  f'{cleaning_results["sequential_texts_per_second"]:.1f} texts/s')
+            print('Text cleaning engine: '
+                  f'{cleaning_results["engine_texts_per_second"]:.1f} texts/s')
+            print(f'Speedup: {cleaning_results["speedup"]:.2f}x')
+            print(f'Texts with different output: {cleaning_results["mismatches"]}')
@@ -0,0 +1,147 @@
+'''distributed crawl of mock old.reddit by coordinator and several crawl.py nodes on localhost'''
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import numpy as np
+
+from benchmarking.mock_server import MockRedditServer, MockRedditSettings
+from benchmarking.page_generator import page_rng
+from crawling.checkpoint_journal import CheckpointJournal
+from crawling.coordinator import CoordinatorServer, LeaseCoordinator
+from crawling.post_bitmap import PostBitmap
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_node(node_root, node_id, address, proxies_path, start, end, workers_count, concurrency):
+    os.makedirs(node_root, exist_ok=True)
+    with open(os.path.join(node_root, 'node.log'), 'wb') as output:
+        return subprocess.Popen(
+            [
+                sys.executable, os.path.join(PROJECT_ROOT, 'crawl.py'),
+                '--coordinator', address,
+                '--node_id', node_id,
+                '--base_url', 'http://old.reddit.com',
+                '--proxies_path', proxies_path,
+                '--proxy_rate', '0',
+                '--beginning_post', str(end),
+                '--ending_post', str(start),
+                '--save_path', os.path.join(node_root, 'posts'),
+                '-w', str(workers_count),
+                '-c', str(concurrency),
+                '--stats_interval', '1',
+            ],
+            # logs and stats of every node go to its own directory
+            cwd=node_root,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            # node is killed together with its worker processes
+            start_new_session=True,
+        )
+
+
+def _kill_node(node: subprocess.Popen):
+    try:
+        os.killpg(node.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    node.wait()
+
+
+def run_distributed_crawl(
+    work_dir,
+    settings: MockRedditSettings,
+    posts_count=2000,
+    nodes_count=3,
+    workers_count=2,
+    concurrency=8,
+    batch_size=250,
+    lease_ttl=6.0,
+    kill_after=5.0,
+    timeout=600.0,
+):
+    '''crawls posts from mock old.reddit by nodes_count crawl.py nodes leasing ranges
+    from coordinator, kills the first node with its workers after kill_after seconds.
+    checks that coordinator journal covers the whole range and that every post
+    which mock old.reddit has was fetched by some node'''
+    start = 1000000 + posts_count
+    end = 1000000
+
+    with MockRedditServer(settings) as server:
+        proxies_path = os.path.join(work_dir, 'proxy.cache')
+        with open(proxies_path, 'w', encoding='UTF-8') as cache_file:
+            for proxy in server.proxies:
+                # checked now, so nodes don't validate them against real old.reddit
+                proxy.checked_at = time.time()
+                proxy.latency = settings.latency
+                cache_file.write(f'{json.dumps(proxy.to_json())}\n')
+
+        journal = CheckpointJournal(os.path.join(work_dir, 'coordinator.journal'))
+        journal.begin(start)
+        coordinator = LeaseCoordinator(
+            journal, end, batch_size=batch_size, lease_ttl=lease_ttl)
+        coordinator_server = CoordinatorServer(coordinator)
+        coordinator_server.start()
+        address = f'127.0.0.1:{coordinator_server.server_address[1]}'
+
+        node_roots = [os.path.join(work_dir, f'node-{node}') for node in range(nodes_count)]
+        started = time.perf_counter()
+        nodes = [
+            _start_node(
+                node_root,
+                f'node-{node}',
+                address,
+                proxies_path,
+                start,
+                end,
+                workers_count,
+                concurrency,
+            )
+            for node, node_root in enumerate(node_roots)
+        ]
+        try:
+            time.sleep(kill_after)
+            _kill_node(nodes[0])
+            for node in nodes[1:]:
+                node.wait(timeout=max(timeout - (time.perf_counter() - started), 1.0))
+        finally:
+            for node in nodes:
+                _kill_node(node)
+            coordinator_server.stop()
+        elapsed = time.perf_counter() - started
+
+    remaining = CheckpointJournal(journal.path).remaining_ranges(start, end)
+
+    bitmaps = []
+    for node_root in node_roots:
+        bitmap_path = os.path.join(node_root, 'posts', 'fetched.bitmap')
+        if os.path.exists(bitmap_path):
+            bitmaps.append(PostBitmap(bitmap_path, start + 1))
+    not_fetched = 0
+    for number in range(start, end, -1):
+        post_uid = np.base_repr(number, 36).lower()
+        # the same draw mock old.reddit makes to answer 404
+        if page_rng(post_uid, settings.seed).random() < settings.missing_rate:
+            continue
+        if not any(number in bitmap for bitmap in bitmaps):
+            not_fetched += 1
+    for bitmap in bitmaps:
+        bitmap.close()
+
+    return {
+        'benchmark': 'distributed_crawl',
+        'pages': posts_count,
+        'seconds': elapsed,
+        'pages_per_second': posts_count / elapsed,
+        'nodes': nodes_count,
+        'killed_nodes': 1,
+        'remaining': sum(range_start - range_end for range_start, range_end in remaining),
+        'not_fetched': not_fetched,
+        'latency': settings.latency,
+        'error_rate': settings.error_rate,
+    }
@@ -0,0 +1,81 @@
+'''compares post extraction approaches on a fixed set of pages'''
+
+import os
+import time
+
+from parsing.data_extractor import (
+    extract_post_fields,
+    parse_awards,
+    parse_comments_count,
+    parse_post_score,
+    parse_post_text,
+    parse_post_title,
+    parse_submission_time_utc,
+)
+
+
+def extract_post_fields_per_field(markup: str):
+    '''extracts post fields parsing html page once per field'''
+    return {
+        'title': parse_post_title(markup),
+        'text': parse_post_text(markup),
+        'score': parse_post_score(markup),
+        'submission_time': parse_submission_time_utc(markup),
+        'comments_count': parse_comments_count(markup),
+        'awards': parse_awards(markup),
+    }
+
+
+def load_fixed_pages(root_dir, pages_count=200):
+    '''reads first pages from directory in filename order'''
+    names = sorted(
+        name for name in os.listdir(root_dir) if name.endswith('.html')
+    )[:pages_count]
+
+    markups = []
+    for name in names:
+        with open(os.path.join(root_dir, name), 'r', encoding='UTF-8') as page_file:
+            markups.append(page_file.read())
+    return markups
+
+
+def measure_pages_per_second(extractor, markups, repeat=3):
+    '''runs extractor over pages and returns best pages per second rate'''
+    best_elapsed = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for markup in markups:
+            extractor(markup)
+        elapsed = time.perf_counter() - started
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed = elapsed
+
+    return len(markups) / best_elapsed if best_elapsed else 0.0
+
+
+def count_mismatches(markups):
+    '''counts pages on which extractors produce different output'''
+    return sum(
+        1 for markup in markups
+        if extract_post_fields(markup) != extract_post_fields_per_field(markup)
+    )
+
+
+def run_extraction_benchmark(root_dir, pages_count=200, repeat=3):
+    '''benchmarks single pass extractor against per field parsing'''
+    markups = load_fixed_pages(root_dir, pages_count)
+    if len(markups) == 0:
+        return None
+
+    per_field_rate = measure_pages_per_second(
+        extract_post_fields_per_field, markups, repeat)
+    single_pass_rate = measure_pages_per_second(
+        extract_post_fields, markups, repeat)
+
+    return {
+        'pages': len(markups),
+        'per_field_pages_per_second': per_field_rate,
+        'single_pass_pages_per_second': single_pass_rate,
+        'speedup': single_pass_rate / per_field_rate if per_field_rate else 0.0,
+        'mismatches': count_mismatches(markups),
+    }
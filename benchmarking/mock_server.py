@@ -0,0 +1,183 @@
+'''local http server which plays old.reddit and a set of http proxies to it'''
+
+import gzip
+import json
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from benchmarking.page_generator import generate_post_page, page_rng
+from parsing.data_extractor import extract_post_fields, extract_raw_post_text
+from util.proxy_address import ProxyAddress
+
+
+class MockRedditSettings:
+    '''behaviour of mock server'''
+
+    def __init__(
+        self,
+        proxies_count=8,
+        latency=0.05,
+        jitter=0.02,
+        error_rate=0.01,
+        missing_rate=0.3,
+        long_share=0.3,
+        score_growth=0.0,
+        seed=0,
+    ):
+        self.proxies_count = proxies_count
+        # seconds every response is delayed by, plus or minus jitter
+        self.latency = latency
+        self.jitter = jitter
+        # share of requests answered with 503
+        self.error_rate = error_rate
+        # share of post ids answered with 404
+        self.missing_rate = missing_rate
+        # share of existing posts which are long enough to be saved
+        self.long_share = long_share
+        # points every post score grows by per second of server run, shown in by_id listings
+        self.score_growth = score_growth
+        self.seed = seed
+
+
+def _make_handler(settings: MockRedditSettings):
+    started = time.time()
+
+    class MockRedditHandler(BaseHTTPRequestHandler):
+        '''answers both proxied (absolute url) and direct requests'''
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self, status, body, content_type='text/html', headers=None):
+            data = body.encode('UTF-8')
+            self.send_response(status)
+            self.send_header('Content-Type', f'{content_type}; charset=UTF-8')
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                data = gzip.compress(data, 1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            delay = settings.latency + random.uniform(-settings.jitter, settings.jitter)
+            time.sleep(max(delay, 0.0))
+
+            if random.random() < settings.error_rate:
+                self._respond(503, '<html><body>overloaded</body></html>')
+                return
+
+            path = urlsplit(self.path).path
+            if path.startswith('/by_id/'):
+                listing = self._by_id_listing(path)
+                etag = f'"{zlib.crc32(listing.encode("UTF-8")):08x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._respond(200, listing, 'application/json', {'ETag': etag})
+                return
+
+            post_uid = path.strip('/')
+            if post_uid == '' or not post_uid.isalnum():
+                self._respond(200, '<html><body><div id="siteTable"></div></body></html>')
+                return
+
+            rng = page_rng(post_uid, settings.seed)
+            if rng.random() < settings.missing_rate:
+                self._respond(404, '<html><body>page not found</body></html>')
+                return
+
+            is_long = rng.random() < settings.long_share
+            self._respond(200, generate_post_page(post_uid, rng, is_long))
+
+        @staticmethod
+        def _by_id_listing(path):
+            # listing of existing posts, self text stands for markdown of post body
+            score_growth = int(settings.score_growth * (time.time() - started))
+            children = []
+            fullnames = path[len('/by_id/'):].split('.')[0].split(',')
+            for post_uid in (fullname.split('_')[-1] for fullname in fullnames):
+                rng = page_rng(post_uid, settings.seed)
+                if not post_uid.isalnum() or rng.random() < settings.missing_rate:
+                    continue
+                page = generate_post_page(post_uid, rng, rng.random() < settings.long_share)
+                post = extract_post_fields(page)
+                children.append({'kind': 't3', 'data': {
+                    'id': post_uid,
+                    'name': f't3_{post_uid}',
+                    'is_self': True,
+                    'selftext': extract_raw_post_text(page),
+                    'score': post['score'] + score_growth,
+                    'num_comments': post['comments_count'],
+                    'all_awardings': [
+                        {
+                            'name': name.capitalize(),
+                            'count': count,
+                            'icon_url': f'https://www.redditstatic.com/gold/awards/icon/{name}_32.png',
+                        }
+                        for name, count in post['awards'].items()
+                    ],
+                }})
+            return json.dumps({'kind': 'Listing', 'data': {'children': children}})
+
+        def log_message(self, *_):
+            pass
+
+    return MockRedditHandler
+
+
+def _serve(settings: MockRedditSettings, ports_queue):
+    handler = _make_handler(settings)
+    servers = [ThreadingHTTPServer(('127.0.0.1', 0), handler)
+               for _ in range(settings.proxies_count)]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    ports_queue.put([server.server_port for server in servers])
+    threading.Event().wait()
+
+
+class MockRedditServer:
+    '''runs mock servers in separate process so they don't compete with measured code for GIL.
+    every server port is a separate proxy'''
+
+    def __init__(self, settings: MockRedditSettings = MockRedditSettings()):
+        self.settings = settings
+        self.ports = []
+        self._process = None
+
+    def start(self):
+        '''starts servers and waits until they listen'''
+        ports_queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.settings, ports_queue), daemon=True)
+        self._process.start()
+        self.ports = ports_queue.get(timeout=30)
+
+    def stop(self):
+        '''kills servers process'''
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    @property
+    def proxies(self):
+        '''proxy addresses of mock servers'''
+        return [ProxyAddress('127.0.0.1', port, 'http') for port in self.ports]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
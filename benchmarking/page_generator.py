@@ -0,0 +1,111 @@
+'''synthetic old.reddit post pages matching selectors of parsing.data_extractor'''
+
+import os
+import random
+import numpy as np
+
+
+WORDS = (
+    'the of and to in is it that for you was with on as have but be they '
+    'reddit post thread edit update story year time people work friend family '
+    'really think know going would could because after before never always '
+    'don\'t can\'t it\'s well-known so-called self-made #1 100% $20 (yes) [serious]'
+).split()
+
+AWARDS = ('silver', 'gold', 'platinum', 'helpful', 'wholesome')
+
+
+def _sentence(rng: random.Random, with_markup=True):
+    words = []
+    for _ in range(rng.randint(6, 24)):
+        roll = rng.random() if with_markup else 1.0
+        if roll < 0.01:
+            words.append(f'<a href="https://example.com/{rng.randint(1, 999)}">'
+                         f'https://www.example.com/page?id={rng.randint(1, 999)}</a>')
+        elif roll < 0.02:
+            words.append(f'<a href="/r/sub{rng.randint(1, 50)}">r/sub{rng.randint(1, 50)}</a>')
+        elif roll < 0.025:
+            words.append('<code>print(x)</code>')
+        elif roll < 0.03:
+            words.append('see www.example.org/docs for details')
+        elif roll < 0.035:
+            words.append('&amp; caf&eacute; &nbsp; na&iuml;ve &mdash;')
+        else:
+            words.append(rng.choice(WORDS))
+    return ' '.join(words).capitalize() + rng.choice(('.', '!', '?', '...'))
+
+
+def _post_body(rng: random.Random, text_length: int):
+    paragraphs = []
+    length = 0
+    while length < text_length:
+        paragraph = ' '.join(_sentence(rng) for _ in range(rng.randint(1, 6)))
+        paragraphs.append(f'<p>{paragraph}</p>')
+        length += len(paragraph)
+
+    if rng.random() < 0.2:
+        paragraphs.insert(rng.randint(0, len(paragraphs)),
+                          '<table><tr><th>a</th></tr><tr><td>1</td></tr></table>')
+    if rng.random() < 0.2:
+        paragraphs.append('<pre><code>for item in items:\n    print(item)\n</code></pre>')
+    return '\n'.join(paragraphs)
+
+
+def _awards(rng: random.Random):
+    links = []
+    for award in rng.sample(AWARDS, rng.randint(0, 3)):
+        size = rng.choice((16, 32, 48, 64, 128))
+        links.append(
+            f'<a class="awarding-link" data-count="{rng.randint(1, 20)}" href="#">'
+            '<span class="awarding-icon-container">'
+            f'<img class="awarding-icon" src="https://www.redditstatic.com/gold/awards/icon/{award}_{size}.png"/>'
+            '</span></a>'
+        )
+    return ''.join(links)
+
+
+def generate_post_page(post_uid: str, rng: random.Random, is_long=True):
+    '''builds old.reddit post page, long posts have at least 2000 characters of text'''
+    text_length = rng.randint(2000, 12000) if is_long else rng.randint(0, 1500)
+    score = rng.randint(-10, 50000)
+    comments = rng.randint(0, 3000)
+    hour = rng.randint(0, 23)
+
+    return f'''<!doctype html><html lang="en"><head><title>post {post_uid}</title>
+<script>var config = {{"post": "{post_uid}"}};</script></head>
+<body class="listing-page comments-page">
+<div class="side"><div class="md"><p>{_sentence(rng)}</p></div></div>
+<div class="content" role="main">
+<div id="siteTable" class="sitetable linklisting">
+<div class="thing id-t3_{post_uid} odd link self" data-fullname="t3_{post_uid}">
+<div class="midcol unvoted"><div class="score unvoted" title="{score}">{score}</div></div>
+<div class="entry unvoted"><div class="top-matter">
+<p class="title"><a class="title may-blank" href="/r/sub/comments/{post_uid}/">{_sentence(rng, with_markup=False)}</a></p>
+<p class="tagline">submitted <time title="Mon May 2 {hour:02d}:00:00 2022 UTC" datetime="2022-05-02T{hour:02d}:00:00+00:00">3 hours ago</time> by <a href="/user/someone" class="author">someone</a>
+<span class="awardings-bar">{_awards(rng)}</span></p>
+</div>
+<div class="expando"><form action="#" class="usertext warn-on-unload">
+<div class="usertext-body may-blank-within md-container"><div class="md">{_post_body(rng, text_length)}</div></div>
+</form></div>
+<ul class="flat-list buttons"><li class="first"><a class="bylink comments may-blank">{comments} comments</a></li><li class="share"><a>share</a></li></ul>
+</div></div></div>
+<div class="commentarea"><div id="siteTable_t3_{post_uid}" class="sitetable nestedlisting">
+<div class="thing comment"><div class="entry"><form class="usertext"><div class="usertext-body"><div class="md"><p>{_sentence(rng)}</p></div></div></form></div></div>
+</div></div>
+</div></body></html>'''
+
+
+def page_rng(post_uid: str, seed=0):
+    '''random generator which gives the same page for the same post id and seed'''
+    return random.Random(f'{seed}-{post_uid}')
+
+
+def generate_corpus(root, pages_count=500, seed=0, long_share=0.5, first_number=1000000):
+    '''writes fixed set of <post_id>.html pages, same seed gives same corpus'''
+    os.makedirs(root, exist_ok=True)
+    for number in range(first_number, first_number + pages_count):
+        post_uid = np.base_repr(number, 36).lower()
+        rng = page_rng(post_uid, seed)
+        page = generate_post_page(post_uid, rng, is_long=rng.random() < long_share)
+        with open(os.path.join(root, f'{post_uid}.html'), 'w', encoding='UTF-8') as page_file:
+            page_file.write(page)
@@ -0,0 +1,73 @@
+'''measures query latency and throughput of query engine over query log'''
+
+import random
+import time
+import numpy as np
+
+from indexing.query_engine import QueryEngine
+
+
+def generate_queries(index_root, queries_count=1000, max_terms=4, seed=0):
+    '''makes query log of random index terms, terms are picked as often
+    as they occur in posts, like in queries of real users'''
+    rng = random.Random(seed)
+    with QueryEngine(index_root) as engine:
+        terms = []
+        weights = []
+        for segment in engine.index.segments:
+            terms += segment.terms
+            weights += segment.dictionary['doc_count'].tolist()
+
+    if len(terms) == 0:
+        return []
+    return [
+        ' '.join(rng.choices(terms, weights, k=rng.randint(1, max_terms)))
+        for _ in range(queries_count)
+    ]
+
+
+def measure_latencies(engine: QueryEngine, queries, k=10, prune=True):
+    '''seconds every query took'''
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        engine.search(query, k, prune)
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies)
+
+
+def _latency_stats(latencies):
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'queries_per_second': len(latencies) / latencies.sum() if latencies.sum() else 0.0,
+    }
+
+
+def run_search_benchmark(index_root, queries, k=10):
+    '''benchmarks top k search with maxscore pruning against exhaustive scoring
+    and batch api, reports queries which got different results'''
+    if len(queries) == 0:
+        return None
+
+    with QueryEngine(index_root) as engine:
+        pruned = measure_latencies(engine, queries, k, prune=True)
+        exhaustive = measure_latencies(engine, queries, k, prune=False)
+
+        started = time.perf_counter()
+        batch_results = engine.search_batch(queries, k)
+        batch_elapsed = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for query, results in zip(queries, batch_results)
+            if results != engine.search(query, k, prune=False)
+        )
+
+    return {
+        'queries': len(queries),
+        'k': k,
+        'pruned': _latency_stats(pruned),
+        'exhaustive': _latency_stats(exhaustive),
+        'batch_queries_per_second': len(queries) / batch_elapsed if batch_elapsed else 0.0,
+        'mismatches': mismatches,
+    }
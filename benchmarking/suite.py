@@ -0,0 +1,177 @@
+'''offline benchmark suite comparable between versions'''
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarking.extraction_benchmark import run_extraction_benchmark
+from benchmarking.mock_server import MockRedditServer, MockRedditSettings
+from benchmarking.page_generator import generate_corpus
+from benchmarking.search_benchmark import generate_queries, run_search_benchmark
+from benchmarking.text_cleaning_benchmark import run_text_cleaning_benchmark
+from crawling.crawl_options import CrawlOptions
+from crawling.crawler import crawl_posts_batch
+from indexing.index_builder import build_index
+from parsing.post_sink import iter_records
+from util.proxy_repository import ProxyRepository
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def current_revision():
+    '''short hash of checked out git commit or None outside of git repo'''
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_crawl_benchmark(
+    work_dir,
+    settings: MockRedditSettings,
+    posts_count=2000,
+    concurrency=64,
+    discovery='pages',
+):
+    '''crawls posts from mock old.reddit in current process'''
+    dataset_root = os.path.join(work_dir, f'crawled_{discovery}')
+    os.makedirs(dataset_root, exist_ok=True)
+
+    with MockRedditServer(settings) as server:
+        cache_path = os.path.join(work_dir, 'proxy.cache')
+        with open(cache_path, 'w', encoding='UTF-8') as cache_file:
+            for proxy in server.proxies:
+                cache_file.write(f'{json.dumps(proxy.to_json())}\n')
+
+        default_cache_path = ProxyRepository.cache_path
+        ProxyRepository.cache_path = cache_path
+        try:
+            start = 1000000 + posts_count
+            options = CrawlOptions(
+                base_url='http://old.reddit.com',
+                dataset_root=dataset_root,
+                concurrency=concurrency,
+                journal_path=os.path.join(dataset_root, 'crawl.journal'),
+                fetched_bitmap_path=os.path.join(dataset_root, 'fetched.bitmap'),
+                saved_bitmap_path=os.path.join(dataset_root, 'saved.bitmap'),
+                bitmap_size=start + 1,
+                discovery=discovery,
+            )
+            started = time.perf_counter()
+            posts_saved = crawl_posts_batch((start, start - posts_count, options))
+            elapsed = time.perf_counter() - started
+        finally:
+            ProxyRepository.cache_path = default_cache_path
+
+    return {
+        'benchmark': 'crawl_posts_batch',
+        'discovery': discovery,
+        'pages': posts_count,
+        'saved': posts_saved,
+        'seconds': elapsed,
+        'pages_per_second': posts_count / elapsed,
+        'concurrency': concurrency,
+        'latency': settings.latency,
+        'error_rate': settings.error_rate,
+        'proxies': settings.proxies_count,
+    }
+
+
+def run_parse_benchmark(corpus_root, work_dir, workers_count=2):
+    '''runs parse.py script over corpus'''
+    save_path = os.path.join(work_dir, 'parsed')
+    pages = len([name for name in os.listdir(corpus_root) if name.endswith('.html')])
+
+    started = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable, os.path.join(PROJECT_ROOT, 'parse.py'),
+            '--input_path', corpus_root,
+            '--save_path', save_path,
+            '--output_format', 'jsonl',
+            '--workers', str(workers_count),
+            '--failures_path', os.path.join(work_dir, 'parse_failures.log'),
+        ],
+        cwd=PROJECT_ROOT,
+        check=True,
+        capture_output=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    return {
+        'benchmark': 'parse.py',
+        'pages': pages,
+        'seconds': elapsed,
+        'pages_per_second': pages / elapsed,
+        'workers': workers_count,
+    }
+
+
+def run_suite(
+    results_path=os.path.join('.', 'benchmark_results.jsonl'),
+    work_dir=None,
+    pages_count=500,
+    crawl_posts_count=2000,
+    workers_count=2,
+    settings: MockRedditSettings = MockRedditSettings(),
+):
+    '''runs all benchmarks offline and appends results to results file'''
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        corpus_root = os.path.join(temp_dir, 'corpus')
+        generate_corpus(corpus_root, pages_count=pages_count, seed=settings.seed)
+
+        extraction = run_extraction_benchmark(corpus_root, pages_count=pages_count)
+        cleaning = run_text_cleaning_benchmark(corpus_root, pages_count=pages_count)
+        results = [
+            {
+                'benchmark': 'extract_post_data',
+                'pages': extraction['pages'],
+                'pages_per_second': extraction['single_pass_pages_per_second'],
+                'per_field_pages_per_second': extraction['per_field_pages_per_second'],
+                'mismatches': extraction['mismatches'],
+            },
+            {
+                'benchmark': 'clean_post_text',
+                'pages': cleaning['texts'],
+                'pages_per_second': cleaning['engine_texts_per_second'],
+                'sequential_pages_per_second': cleaning['sequential_texts_per_second'],
+                'mismatches': cleaning['mismatches'],
+            },
+            run_parse_benchmark(corpus_root, temp_dir, workers_count),
+            run_crawl_benchmark(temp_dir, settings, crawl_posts_count),
+            run_crawl_benchmark(temp_dir, settings, crawl_posts_count, discovery='by_id'),
+        ]
+
+        index_root = os.path.join(temp_dir, 'index')
+        build_index(iter_records(os.path.join(temp_dir, 'parsed')), index_root)
+        search = run_search_benchmark(
+            index_root, generate_queries(index_root, seed=settings.seed))
+        results.append({
+            'benchmark': 'search',
+            'queries': search['queries'],
+            'queries_per_second': search['pruned']['queries_per_second'],
+            'p50_ms': search['pruned']['p50_ms'],
+            'p99_ms': search['pruned']['p99_ms'],
+            'exhaustive_queries_per_second': search['exhaustive']['queries_per_second'],
+            'mismatches': search['mismatches'],
+        })
+
+    revision = current_revision()
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(results_path, 'a', encoding='UTF-8') as results_file:
+        for result in results:
+            result['revision'] = revision
+            result['timestamp'] = timestamp
+            results_file.write(f'{json.dumps(result)}\n')
+
+    return results
@@ -0,0 +1,66 @@
+'''compares text cleaning engine with sequential substitutions on real post bodies'''
+
+import re
+import time
+
+from benchmarking.extraction_benchmark import load_fixed_pages
+from parsing.data_extractor import extract_raw_post_text
+from parsing.text_cleaner import URL_PATTERN, TextCleaner
+
+
+def clean_post_text_sequential(post_text: str):
+    '''reference cleaning with uncompiled pattern and substitution per step'''
+    post_text = re.sub(URL_PATTERN, '', post_text)
+
+    post_text = re.sub(r'[\-]', ' ', post_text)
+    post_text = re.sub(r'[^\w\s]', '', post_text)
+    post_text = re.sub(r'[\s]+', ' ', post_text)
+
+    return post_text.strip()
+
+
+def clean_batch_sequential(texts):
+    '''reference cleaning of every text of iterable'''
+    return [clean_post_text_sequential(text) for text in texts]
+
+
+def measure_texts_per_second(cleaner, texts, repeat=3):
+    '''runs batch cleaner over texts and returns best texts per second rate'''
+    best_elapsed = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cleaner(texts)
+        elapsed = time.perf_counter() - started
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed = elapsed
+
+    return len(texts) / best_elapsed if best_elapsed else 0.0
+
+
+def run_text_cleaning_benchmark(root_dir, pages_count=200, repeat=3):
+    '''benchmarks text cleaning engine against sequential substitutions'''
+    texts = [
+        text for text in map(extract_raw_post_text, load_fixed_pages(root_dir, pages_count))
+        if len(text) != 0
+    ]
+    if len(texts) == 0:
+        return None
+
+    cleaner = TextCleaner()
+    sequential_rate = measure_texts_per_second(clean_batch_sequential, texts, repeat)
+    engine_rate = measure_texts_per_second(cleaner.clean_batch, texts, repeat)
+
+    expected = clean_batch_sequential(texts)
+    mismatches = sum(
+        1 for cleaned, reference in zip(cleaner.clean_batch(texts), expected)
+        if cleaned != reference
+    )
+
+    return {
+        'texts': len(texts),
+        'characters': sum(map(len, texts)),
+        'sequential_texts_per_second': sequential_rate,
+        'engine_texts_per_second': engine_rate,
+        'speedup': engine_rate / sequential_rate if sequential_rate else 0.0,
+        'mismatches': mismatches,
+    }
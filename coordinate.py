@@ -0,0 +1,110 @@
+'''distributed crawl coordinator script'''
+
+import argparse
+import os
+import time
+
+from crawling.checkpoint_journal import CheckpointJournal
+from crawling.coordinator import CoordinatorServer, LeaseCoordinator
+from crawling.crawler import setup_logger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=('Script for coordinating crawl of old reddit by several nodes. '
+                     'Nodes started with crawl.py --coordinator HOST:PORT lease ranges '
+                     'of post numbers from it over TCP. '
+                     'Crawled ranges are journaled to resume from where it stopped.'),
+    )
+    parser.add_argument(
+        '--beginning_post',
+        type=int,
+        # first post ever
+        default=295,
+        help='lower post number where crawling will end',
+    )
+    parser.add_argument(
+        '--ending_post',
+        type=int,
+        # hardcoded last post at the beginning of May 2022
+        default=1847556708,
+        help='higher post number where crawling will start, ignored if journal exists',
+    )
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='0.0.0.0',
+        help=('address coordinator listens on'),
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help=('port coordinator listens on'),
+    )
+    parser.add_argument(
+        '--journal_path',
+        type=str,
+        default=os.path.join('.', 'coordinator.journal'),
+        help=('journal of crawled ranges of all nodes'),
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=5000,
+        help=('number of post numbers in single lease'),
+    )
+    parser.add_argument(
+        '--lease_ttl',
+        type=float,
+        default=60.0,
+        help=('seconds after last heartbeat of node when its lease is given to another node'),
+    )
+    parser.add_argument(
+        '--max_attempts',
+        type=int,
+        default=3,
+        help=('number of leases which may stop at the same failing post '
+              'before it is given up and journaled as failed'),
+    )
+    parser.add_argument(
+        '--stats_interval',
+        type=float,
+        default=5.0,
+        help=('seconds between stats updates'),
+    )
+
+    args = parser.parse_args()
+
+    assert args.beginning_post < args.ending_post
+    assert args.batch_size > 0 and args.lease_ttl > 0 and args.max_attempts > 0
+
+    logger = setup_logger(filename='coordinator.log')
+
+    journal = CheckpointJournal(args.journal_path)
+    journal.begin(args.ending_post)
+    journal.compact()
+
+    coordinator = LeaseCoordinator(
+        journal,
+        args.beginning_post,
+        batch_size=args.batch_size,
+        lease_ttl=args.lease_ttl,
+        max_attempts=args.max_attempts,
+        logger=logger,
+    )
+    server = CoordinatorServer(coordinator, (args.host, args.port))
+    server.start()
+    print(f'Coordinator listens on {args.host}:{args.port}')
+
+    try:
+        while not coordinator.is_done():
+            stats = coordinator.stats()
+            print(f'\rremaining: {stats["remaining"]} post numbers; '
+                  f'failed: {stats["failed"]}; leases: {stats["leases"]}; nodes: {stats["nodes"]}',
+                  end='', flush=True)
+            time.sleep(args.stats_interval)
+        print('\nAll ranges are crawled')
+    except KeyboardInterrupt:
+        print('\nStopping coordinator, unfinished leases are given out again on restart')
+    server.stop()
@@ -8,7 +8,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Script for crawling old reddit.\n'
         'It goes from recent post to latter.\n'
-        'Also this script checks last saved post to start from there.',
+        'Crawled ranges are journaled to resume from where it stopped.',
     )
     parser.add_argument(
         '--beginning_post',
@@ -31,12 +31,130 @@ if __name__ == '__main__':
         default=min(8, (os.cpu_count() or 1)),
         help=('number of parsing workers'),
     )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        type=int,
+        default=64,
+        help=('number of requests in flight per worker'),
+    )
+    parser.add_argument(
+        '--global_rate',
+        type=float,
+        default=0.0,
+        help=('max requests per second of all workers together, 0 means no limit'),
+    )
+    parser.add_argument(
+        '--proxy_rate',
+        type=float,
+        default=1.0,
+        help=('max requests per second through single proxy, 0 means no limit'),
+    )
+    parser.add_argument(
+        '--request_timeout',
+        type=float,
+        default=15.0,
+        help=('seconds to wait for proxy response before trying another proxy'),
+    )
+    parser.add_argument(
+        '--proxy_pool_size',
+        type=int,
+        default=4,
+        help=('number of keep-alive connections kept open to every proxy'),
+    )
     parser.add_argument(
         '--save_path',
         type=str,
         default=os.path.join('.', 'posts'),
         help=('path for storing crawled pages'),
     )
+    parser.add_argument(
+        '--storage',
+        choices=['files', 'segments'],
+        default='files',
+        help=('files saves html file per post, '
+              'segments appends compressed pages to large indexed segment files'),
+    )
+    parser.add_argument(
+        '--page_content',
+        choices=['fragment', 'full'],
+        default='fragment',
+        help=('fragment saves only post part of page which parsing reads, '
+              'gzipped to <post_id>.html.gz in files storage, full saves whole page'),
+    )
+    parser.add_argument(
+        '--save_mode',
+        choices=['html', 'records', 'both'],
+        default='html',
+        help=('html saves crawled pages, records saves post data extracted at crawl time '
+              'to jsonl shards, both does both'),
+    )
+    parser.add_argument(
+        '--records_path',
+        type=str,
+        default=os.path.join('.', 'cleaned_posts'),
+        help=('path for storing extracted post records'),
+    )
+    parser.add_argument(
+        '--records_compression',
+        choices=['gzip', 'zstd'],
+        default=None,
+        help=('compression of records shards, zstd requires zstandard package'),
+    )
+    parser.add_argument(
+        '--dedup',
+        choices=['flag', 'drop'],
+        default=None,
+        help=('flag marks records of near duplicates of already saved posts '
+              'with duplicate_of field, drop doesn\'t save near duplicates'),
+    )
+    parser.add_argument(
+        '--dedup_path',
+        type=str,
+        default=os.path.join('.', 'near_duplicates.sqlite'),
+        help=('database of saved posts signatures used for near duplicates detection, '
+              'shared with parse.py'),
+    )
+    parser.add_argument(
+        '--discovery',
+        choices=['pages', 'by_id'],
+        default='pages',
+        help=('pages requests page of every post number, by_id requests listings '
+              'of 100 posts and fetches pages only of self posts which may be long enough'),
+    )
+    parser.add_argument(
+        '--coordinator',
+        type=str,
+        default=None,
+        help=('HOST:PORT of coordinator started with coordinate.py, '
+              'crawler leases ranges from it instead of using its own journal'),
+    )
+    parser.add_argument(
+        '--node_id',
+        type=str,
+        default=None,
+        help=('name of this node in coordinator logs, defaults to host name and process id'),
+    )
+    parser.add_argument(
+        '--base_url',
+        type=str,
+        default='https://old.reddit.com',
+        help=('address of old reddit, e.g. of local mock server of benchmarking suite'),
+    )
+    parser.add_argument(
+        '--proxies_path',
+        type=str,
+        default=os.path.join('.', 'proxy.cache'),
+        help=('cache of proxies, one json object per line, '
+              'filled with proxies from network if it is empty'),
+    )
+    parser.add_argument(
+        '--stats_interval',
+        type=float,
+        default=5.0,
+        help=('seconds between live stats updates, '
+              'full stats are written to logs/crawl_stats.json'),
+    )
     parser.add_argument(
         '--main_log_debug',
         action='store_true',
@@ -53,6 +171,8 @@ if __name__ == '__main__':
 
     assert args.beginning_post > 0 or args.ending_post > 0
     assert args.beginning_post < args.ending_post
+    assert args.concurrency > 0
+    assert args.global_rate >= 0 and args.proxy_rate >= 0
 
     print('Crawling begins. Please, check logs directory for crawling status')
 
@@ -61,6 +181,25 @@ if __name__ == '__main__':
         last_post_number=args.ending_post,
         dataset_root=args.save_path,
         workers_count=args.workers_count,
+        concurrency=args.concurrency,
+        request_timeout=args.request_timeout,
+        global_rate=args.global_rate,
+        proxy_rate=args.proxy_rate,
+        stats_interval=args.stats_interval,
+        on_stats=lambda summary: print(f'\r{summary:<120}', end='', flush=True),
+        proxy_pool_size=args.proxy_pool_size,
+        storage=args.storage,
+        page_content=args.page_content,
+        save_mode=args.save_mode,
+        records_root=args.records_path,
+        records_compression=args.records_compression,
+        dedup=args.dedup,
+        dedup_path=args.dedup_path,
+        discovery=args.discovery,
+        coordinator_address=args.coordinator,
+        node_id=args.node_id,
+        base_url=args.base_url,
+        proxies_path=args.proxies_path,
         is_root_logger_in_debug=args.main_log_debug,
         is_proc_loggers_in_debug=args.proc_logs_debug,
     )
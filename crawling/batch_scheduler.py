@@ -0,0 +1,173 @@
+'''bounded scheduling of crawl batches with adaptive sizes and work stealing'''
+
+import multiprocessing
+import time
+
+
+class SharedBatchSlots:
+    '''bounds of batches being crawled kept in shared memory.
+    every batch in flight has slot with its start, end, the lowest number
+    its worker took and its progress. worker takes numbers one by one through slot,
+    so main process can lower end of batch at any time and give cut off part
+    to another worker. stop event tells workers to finish numbers they took and return'''
+    # fields of every slot in shared array
+    _start, _end, _taken, _progress = range(4)
+    _fields_count = 4
+
+    def __init__(self, slots_count):
+        self.slots_count = slots_count
+        self._lock = multiprocessing.Lock()
+        self._slots = multiprocessing.RawArray('q', slots_count * self._fields_count)
+        self._stop_event = multiprocessing.Event()
+
+    def _get(self, slot, field):
+        return self._slots[slot * self._fields_count + field]
+
+    def _set(self, slot, field, value):
+        self._slots[slot * self._fields_count + field] = value
+
+    def assign(self, slot, start, end):
+        '''gives range(start, end, -1) to slot'''
+        with self._lock:
+            self._set(slot, self._start, start)
+            self._set(slot, self._end, end)
+            self._set(slot, self._taken, start + 1)
+            self._set(slot, self._progress, start)
+
+    def take(self, slot, number):
+        '''marks number as taken by worker of slot, False if it was cut off'''
+        with self._lock:
+            if number <= self._get(slot, self._end):
+                return False
+            self._set(slot, self._taken, number)
+            return True
+
+    def end(self, slot):
+        '''current end of batch of slot'''
+        with self._lock:
+            return self._get(slot, self._end)
+
+    def remaining(self, slot):
+        '''number of post numbers of slot which are not taken yet'''
+        with self._lock:
+            return self._get(slot, self._taken) - 1 - self._get(slot, self._end)
+
+    def record_progress(self, slot, next_number):
+        '''stores that every number of batch above next_number is crawled'''
+        with self._lock:
+            self._set(slot, self._progress, next_number)
+
+    def progress(self, slot):
+        '''number below the crawled top part of batch of slot'''
+        with self._lock:
+            return self._get(slot, self._progress)
+
+    def cancel(self, slot):
+        '''cuts off all numbers of slot which are not taken yet'''
+        with self._lock:
+            self._set(slot, self._end, self._get(slot, self._taken) - 1)
+
+    def split(self, slot, min_size):
+        '''cuts off lower half of numbers not taken yet and returns it as (start, end),
+        None if each half would be smaller than min_size'''
+        with self._lock:
+            end = self._get(slot, self._end)
+            remaining = self._get(slot, self._taken) - 1 - end
+            if remaining < 2 * min_size:
+                return None
+            split = end + remaining // 2
+            self._set(slot, self._end, split)
+            return split, end
+
+    def stop(self):
+        '''asks workers to stop taking numbers'''
+        self._stop_event.set()
+
+    def is_stopped(self):
+        '''whether workers were asked to stop'''
+        return self._stop_event.is_set()
+
+
+class BatchScheduler:
+    '''cuts remaining ranges into batches for at most slots_count workers at once.
+    batch size follows measured crawl rate, so batch takes about target_seconds.
+    when ranges are over, idle workers get lower half of the largest batch in flight'''
+
+    def __init__(
+        self,
+        ranges,
+        slots: SharedBatchSlots,
+        initial_batch_size=5000,
+        min_batch_size=500,
+        max_batch_size=100000,
+        target_seconds=120.0,
+    ):
+        # ranges are (start, end) pairs of range(start, end, -1), highest first
+        self.ranges = list(ranges)
+        self.slots = slots
+        self.batch_size = initial_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_seconds = target_seconds
+        # post numbers per second crawled by single worker
+        self.rate = None
+        self._free_slots = list(range(slots.slots_count - 1, -1, -1))
+        self._started = {}
+
+    def _next_range(self):
+        if len(self.ranges) != 0:
+            start, end = self.ranges[0]
+            batch_end = max(start - self.batch_size, end)
+            if batch_end == end:
+                self.ranges.pop(0)
+            else:
+                self.ranges[0] = (batch_end, end)
+            return start, batch_end
+
+        for slot in sorted(self._started, key=self.slots.remaining, reverse=True):
+            stolen = self.slots.split(slot, self.min_batch_size)
+            if stolen is not None:
+                return stolen
+        return None
+
+    def is_done(self):
+        '''whether every range was given out and every batch finished,
+        or workers were asked to stop'''
+        if self.slots.is_stopped():
+            return True
+        return len(self.ranges) == 0 and len(self._started) == 0
+
+    def next_batch(self):
+        '''(start, end, slot) of next batch or None if there is no free slot
+        or nothing left to give'''
+        if len(self._free_slots) == 0 or self.slots.is_stopped():
+            return None
+
+        batch = self._next_range()
+        if batch is None:
+            return None
+
+        start, end = batch
+        slot = self._free_slots.pop()
+        self.slots.assign(slot, start, end)
+        self._started[slot] = (start, time.monotonic())
+        return start, end, slot
+
+    def finish(self, slot):
+        '''frees slot of finished batch and adapts batch size to its crawl rate'''
+        start, started = self._started.pop(slot)
+        self._free_slots.append(slot)
+        if self.slots.is_stopped():
+            return
+
+        numbers = start - self.slots.end(slot)
+        elapsed = time.monotonic() - started
+        if numbers <= 0 or elapsed <= 0:
+            return
+
+        rate = numbers / elapsed
+        self.rate = rate if self.rate is None else 0.8 * self.rate + 0.2 * rate
+        self.batch_size = int(min(
+            max(self.rate * self.target_seconds, self.min_batch_size),
+            self.max_batch_size,
+        ))
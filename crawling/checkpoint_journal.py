@@ -0,0 +1,143 @@
+'''append-only journal of crawled post number ranges'''
+
+import os
+
+
+class ProgressWatermark:
+    '''tracks how far batch got when posts are completed out of order.
+    batch goes from start down, every number above next_number is completed'''
+
+    def __init__(self, start: int):
+        self.next_number = start
+        self._completed = set()
+
+    def complete(self, number: int):
+        '''marks post number as processed'''
+        self._completed.add(number)
+        while self.next_number in self._completed:
+            self._completed.remove(self.next_number)
+            self.next_number -= 1
+
+
+class JournalWriter:
+    '''appends progress and completed ranges to journal without reading it,
+    used by crawling processes. ranges are (start, end) pairs of range(start, end, -1)
+    which crawler walks. lines are small and appended with single write,
+    so processes can share the file'''
+
+    def __init__(self, path):
+        self.path = path
+
+    def _append(self, line):
+        with open(self.path, 'a', encoding='UTF-8') as journal_file:
+            journal_file.write(f'{line}\n')
+
+    def record_progress(self, start: int, end: int, next_number: int):
+        '''stores that every number of range above next_number is crawled'''
+        self._append(f'progress {start} {end} {next_number}')
+
+    def record_done(self, start: int, end: int):
+        '''stores that range is fully crawled'''
+        self._append(f'done {start} {end}')
+
+    def record_failed(self, number: int):
+        '''stores that post number is given up after it failed too many times'''
+        self._append(f'failed {number}')
+
+
+class CheckpointJournal(JournalWriter):
+    '''stores crawl top, completed ranges and progress of unfinished ranges.
+    whole journal is read on start, so it is opened once by main process'''
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.top = None
+        # post numbers given up, they count as crawled
+        self.failed = set()
+        self._done = set()
+        self._progress = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='UTF-8') as journal_file:
+            for line in journal_file:
+                fields = line.split()
+                # last line may be cut by crash
+                if len(fields) < 2 or not all(field.isdigit() for field in fields[1:]):
+                    continue
+                if fields[0] == 'range' and self.top is None:
+                    self.top = int(fields[1])
+                elif fields[0] == 'done' and len(fields) == 3:
+                    self._done.add((int(fields[1]), int(fields[2])))
+                elif fields[0] == 'failed' and len(fields) == 2:
+                    self.failed.add(int(fields[1]))
+                elif fields[0] == 'progress' and len(fields) == 4:
+                    key = (int(fields[1]), int(fields[2]))
+                    next_number = int(fields[3])
+                    self._progress[key] = min(next_number, self._progress.get(key, next_number))
+
+        for key in self._done:
+            self._progress.pop(key, None)
+        self._done.update((number, number - 1) for number in self.failed)
+
+    def record_failed(self, number: int):
+        super().record_failed(number)
+        self.failed.add(number)
+
+    def begin(self, top: int):
+        '''remembers the highest post number of the crawl'''
+        if self.top is None:
+            self.top = top
+            self._append(f'range {top}')
+
+    def _covered(self):
+        '''closed intervals of crawled numbers sorted by lower bound'''
+        intervals = [(end + 1, start) for start, end in self._done]
+        intervals += [(next_number + 1, start)
+                      for (start, _), next_number in self._progress.items()]
+        intervals.sort()
+
+        merged = []
+        for low, high in intervals:
+            if low > high:
+                continue
+            if len(merged) != 0 and low <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+            else:
+                merged.append((low, high))
+        return merged
+
+    def remaining_ranges(self, start: int, end: int):
+        '''ranges of range(start, end, -1) which are not crawled yet, highest first'''
+        remaining = []
+        high = start
+        for covered_low, covered_high in reversed(self._covered()):
+            if covered_high < end + 1 or covered_low > high:
+                continue
+            if covered_high < high:
+                remaining.append((high, covered_high))
+            high = min(high, covered_low - 1)
+        if high > end:
+            remaining.append((high, end))
+        return remaining
+
+    def crawled_count(self):
+        '''number of post numbers already crawled'''
+        return sum(high - low + 1 for low, high in self._covered())
+
+    def compact(self):
+        '''rewrites journal with merged ranges'''
+        lines = [] if self.top is None else [f'range {self.top}']
+        lines += [f'done {high} {low - 1}' for low, high in self._covered()]
+        lines += [f'failed {number}' for number in sorted(self.failed, reverse=True)]
+
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='UTF-8') as journal_file:
+            journal_file.write(''.join(f'{line}\n' for line in lines))
+        os.replace(temp_path, self.path)
+
+        self._done = {(high, low - 1) for low, high in self._covered()}
+        self._progress = {}
@@ -0,0 +1,341 @@
+'''coordination of crawling nodes through leases of post number ranges'''
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+from crawling.batch_scheduler import SharedBatchSlots
+from crawling.checkpoint_journal import CheckpointJournal
+
+
+def parse_address(address: str):
+    '''(host, port) of "host:port" string'''
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+class LeaseCoordinator:
+    '''gives ranges of post numbers to crawling nodes as leases.
+    lease lives for lease_ttl seconds and is extended by every heartbeat of its node,
+    part of range which expired lease didn't finish is given to the next node asking.
+    post number at which leases stopped max_attempts times is given up and journaled as failed,
+    so post which always fails doesn't keep crawl from finishing.
+    progress and completed ranges go to journal, so coordinator resumes after restart'''
+
+    def __init__(
+        self,
+        journal: CheckpointJournal,
+        end: int,
+        batch_size=5000,
+        lease_ttl=60.0,
+        max_attempts=3,
+        logger: logging.Logger = logging.getLogger(),
+    ):
+        self.journal = journal
+        self.top = journal.top
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.logger = logger
+
+        # ranges are (start, end) pairs of range(start, end, -1), highest first
+        self.ranges = journal.remaining_ranges(journal.top, end)
+        self.leases = {}
+        # number of leases which stopped at post number, by post number
+        self.attempts = {}
+        self._next_lease_id = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease['expires_at'] <= now:
+                del self.leases[lease_id]
+                if lease['next_number'] > lease['end']:
+                    self.ranges.insert(0, (lease['next_number'], lease['end']))
+                self.logger.info(
+                    'Lease %d of node %s expired at %d', lease_id, lease['node'], lease['next_number'])
+
+    def lease(self, node: str, now=None):
+        '''gives next batch to node, None if there is nothing to give right now'''
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if len(self.ranges) == 0:
+                return None
+
+            start, end = self.ranges[0]
+            batch_end = max(start - self.batch_size, end)
+            if batch_end == end:
+                self.ranges.pop(0)
+            else:
+                self.ranges[0] = (batch_end, end)
+
+            lease_id = self._next_lease_id
+            self._next_lease_id += 1
+            self.leases[lease_id] = {
+                'node': node,
+                'start': start,
+                'end': batch_end,
+                'next_number': start,
+                'expires_at': now + self.lease_ttl,
+            }
+            return {'lease': lease_id, 'start': start, 'end': batch_end, 'ttl': self.lease_ttl}
+
+    def heartbeat(self, lease_id: int, next_number: int, now=None):
+        '''extends lease and stores its progress, False if lease is lost'''
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            lease = self.leases.get(lease_id)
+            if lease is None:
+                return False
+
+            lease['expires_at'] = now + self.lease_ttl
+            if next_number < lease['next_number']:
+                lease['next_number'] = next_number
+                self.journal.record_progress(lease['start'], lease['end'], next_number)
+            return True
+
+    def complete(self, lease_id: int, next_number: int):
+        '''finishes lease, numbers of range below next_number are given out again.
+        False if lease is lost'''
+        with self._lock:
+            lease = self.leases.pop(lease_id, None)
+            if lease is None:
+                return False
+
+            start, end = lease['start'], lease['end']
+            if next_number > end:
+                attempts = self.attempts.pop(next_number, 0) + 1
+                if attempts < self.max_attempts:
+                    self.attempts[next_number] = attempts
+                else:
+                    self.logger.error(
+                        'Post number %d failed %d times, giving it up', next_number, attempts)
+                    self.journal.record_failed(next_number)
+                    next_number -= 1
+
+            if next_number <= end:
+                self.journal.record_done(start, end)
+            else:
+                if next_number < start:
+                    self.journal.record_progress(start, end, next_number)
+                self.ranges.insert(0, (min(next_number, start), end))
+            return True
+
+    def is_done(self):
+        '''whether every range is crawled'''
+        with self._lock:
+            return len(self.ranges) == 0 and len(self.leases) == 0
+
+    def stats(self):
+        '''remaining and given up post numbers, leases and nodes holding them'''
+        with self._lock:
+            return {
+                'remaining': sum(start - end for start, end in self.ranges)
+                + sum(lease['next_number'] - lease['end'] for lease in self.leases.values()),
+                'leases': len(self.leases),
+                'failed': len(self.journal.failed),
+                'nodes': len({lease['node'] for lease in self.leases.values()}),
+            }
+
+    def handle(self, request: dict):
+        '''answers request of node'''
+        operation = request.get('op')
+        if operation == 'info':
+            return {'top': self.top, 'lease_ttl': self.lease_ttl}
+        if operation == 'lease':
+            lease = self.lease(request['node'])
+            if lease is None:
+                return {'lease': None, 'done': self.is_done()}
+            return lease
+        if operation == 'heartbeat':
+            return {'ok': self.heartbeat(request['lease'], request['next_number'])}
+        if operation == 'complete':
+            return {'ok': self.complete(request['lease'], request['next_number'])}
+        return {'error': f'unknown operation: {operation}'}
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    '''json line requests and responses over single connection'''
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    response = self.server.coordinator.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    response = {'error': repr(error)}
+                self.wfile.write(f'{json.dumps(response)}\n'.encode('UTF-8'))
+        except ConnectionError:
+            # node died, its leases expire
+            pass
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    '''tcp server of lease coordinator, thread per node connection'''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, coordinator: LeaseCoordinator, address=('127.0.0.1', 0)):
+        self.coordinator = coordinator
+        super().__init__(address, _CoordinatorHandler)
+
+    def start(self):
+        '''serves requests in background thread'''
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        '''stops serving and closes socket'''
+        self.shutdown()
+        self.server_close()
+
+
+class CoordinatorClient:
+    '''connection of crawling node to coordinator, reconnects after errors'''
+
+    def __init__(self, address, timeout=30.0):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._socket = None
+        self._file = None
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address, timeout=self.timeout)
+        self._file = self._socket.makefile('rwb')
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = None
+            self._file = None
+
+    def request(self, **request):
+        '''sends request and waits for response, raises OSError if coordinator is unreachable'''
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._connect()
+                self._file.write(f'{json.dumps(request)}\n'.encode('UTF-8'))
+                self._file.flush()
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError('coordinator closed connection')
+                return json.loads(line)
+            except OSError:
+                self._disconnect()
+                raise
+
+    def close(self):
+        '''closes connection'''
+        with self._lock:
+            self._disconnect()
+
+
+class LeasedBatches:
+    '''source of batches for crawling node which leases them from coordinator,
+    used by crawl_reddit in place of batch scheduler.
+    background thread renews leases of batches in flight with their progress
+    and cancels batches whose leases were lost'''
+
+    def __init__(
+        self,
+        client: CoordinatorClient,
+        slots: SharedBatchSlots,
+        node: str,
+        heartbeat_interval=10.0,
+        logger: logging.Logger = logging.getLogger(),
+    ):
+        self.client = client
+        self.slots = slots
+        self.node = node
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = logger
+        # size of the last leased batch, coordinator decides it
+        self.batch_size = 0
+
+        self._lock = threading.Lock()
+        self._free_slots = list(range(slots.slots_count - 1, -1, -1))
+        self._leases = {}
+        self._is_crawl_done = False
+        self._closed = threading.Event()
+        threading.Thread(target=self._renew_leases, daemon=True).start()
+
+    def _renew_leases(self):
+        while not self._closed.wait(self.heartbeat_interval):
+            with self._lock:
+                leases = list(self._leases.items())
+            for slot, lease_id in leases:
+                if not self._holds(slot, lease_id):
+                    # batch finished while heartbeats of others were sent
+                    continue
+                try:
+                    response = self.client.request(
+                        op='heartbeat', lease=lease_id, next_number=self.slots.progress(slot))
+                except OSError as error:
+                    self.logger.error('Coordinator is unreachable: %s', error)
+                    break
+                if response.get('ok'):
+                    continue
+                with self._lock:
+                    # slot may have been given to batch of another lease in the meantime
+                    if self._leases.get(slot) == lease_id:
+                        self.logger.info('Lease %d is lost, cancelling its batch', lease_id)
+                        self.slots.cancel(slot)
+
+    def _holds(self, slot, lease_id):
+        with self._lock:
+            return self._leases.get(slot) == lease_id
+
+    def is_done(self):
+        '''whether coordinator has nothing left to give and every batch finished,
+        or workers were asked to stop'''
+        if self.slots.is_stopped():
+            return True
+        with self._lock:
+            return self._is_crawl_done and len(self._leases) == 0
+
+    def next_batch(self):
+        '''(start, end, slot) of leased batch or None if there is no free slot,
+        nothing to lease right now or coordinator is unreachable'''
+        if len(self._free_slots) == 0 or self.slots.is_stopped():
+            return None
+
+        try:
+            response = self.client.request(op='lease', node=self.node)
+        except OSError as error:
+            self.logger.error('Coordinator is unreachable: %s', error)
+            return None
+        if response.get('lease') is None:
+            self._is_crawl_done = response.get('done', False)
+            return None
+
+        slot = self._free_slots.pop()
+        with self._lock:
+            self.slots.assign(slot, response['start'], response['end'])
+            self._leases[slot] = response['lease']
+        self.batch_size = response['start'] - response['end']
+        return response['start'], response['end'], slot
+
+    def finish(self, slot):
+        '''reports progress of finished batch to coordinator and frees its slot'''
+        with self._lock:
+            lease_id = self._leases.pop(slot)
+        self._free_slots.append(slot)
+        try:
+            self.client.request(op='complete', lease=lease_id, next_number=self.slots.progress(slot))
+        except OSError as error:
+            # lease expires and coordinator gives the whole range out again
+            self.logger.error('Coordinator is unreachable: %s', error)
+
+    def close(self):
+        '''stops renewing leases and closes connection'''
+        self._closed.set()
+        self.client.close()
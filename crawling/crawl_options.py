@@ -0,0 +1,61 @@
+'''settings shared by crawling processes'''
+
+import os
+
+
+class CrawlOptions:
+    '''settings passed to every crawling process along with its batch'''
+
+    def __init__(
+        self,
+        dataset_root=os.path.join('.', 'posts'),
+        is_logger_in_debug=False,
+        concurrency=64,
+        request_timeout=15.0,
+        proxy_pool_size=4,
+        journal_path=os.path.join('.', 'posts', 'crawl.journal'),
+        checkpoint_interval=500,
+        fetched_bitmap_path=os.path.join('.', 'posts', 'fetched.bitmap'),
+        saved_bitmap_path=os.path.join('.', 'posts', 'saved.bitmap'),
+        bitmap_size=1847556708 + 1,
+        storage='files',
+        save_mode='html',
+        records_root=os.path.join('.', 'cleaned_posts'),
+        records_compression=None,
+        base_url='https://old.reddit.com',
+        dedup=None,
+        dedup_path=os.path.join('.', 'near_duplicates.sqlite'),
+        discovery='pages',
+        by_id_batch_size=100,
+        page_content='fragment',
+    ):
+        self.dataset_root = dataset_root
+        self.is_logger_in_debug = is_logger_in_debug
+        self.concurrency = concurrency
+        self.request_timeout = request_timeout
+        self.proxy_pool_size = proxy_pool_size
+        # None when progress goes to coordinator of distributed crawl
+        self.journal_path = journal_path
+        # how many post numbers are crawled between progress records
+        self.checkpoint_interval = checkpoint_interval
+        self.fetched_bitmap_path = fetched_bitmap_path
+        self.saved_bitmap_path = saved_bitmap_path
+        # number of bits in bitmaps, must be greater than any crawled post number
+        self.bitmap_size = bitmap_size
+        # "files" for html file per post or "segments" for packed segments
+        self.storage = storage
+        # "html" saves pages, "records" saves extracted post data, "both" does both
+        self.save_mode = save_mode
+        self.records_root = records_root
+        self.records_compression = records_compression
+        self.base_url = base_url
+        # None, "flag" marks near duplicate records, "drop" doesn't save near duplicates
+        self.dedup = dedup
+        self.dedup_path = dedup_path
+        # "pages" fetches page of every post number, "by_id" looks post numbers up
+        # in listings of by_id_batch_size posts and fetches pages of long self posts only
+        self.discovery = discovery
+        self.by_id_batch_size = by_id_batch_size
+        # "fragment" saves only #siteTable part of page, gzipped in files storage,
+        # "full" saves whole page
+        self.page_content = page_content
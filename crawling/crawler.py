@@ -2,14 +2,38 @@
 
 import re
 import os
+import json
 import logging
 import signal
+import socket
+import time
 import uuid
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import numpy as np
 from parsel import Selector
-from parsing.data_extractor import parse_post_text
-from util.proxied_request_executor import ProxiedRequestExecutor
+from crawling.batch_scheduler import BatchScheduler, SharedBatchSlots
+from crawling.checkpoint_journal import CheckpointJournal, JournalWriter, ProgressWatermark
+from crawling.coordinator import CoordinatorClient, LeasedBatches
+from crawling.crawl_options import CrawlOptions
+from crawling.post_bitmap import PostBitmap
+from parsing.data_extractor import could_be_long_post, extract_fields, page_fragment
+from parsing.near_duplicates import DROP_DUPLICATES, FLAG_DUPLICATES, NearDuplicateIndex
+from parsing.post_sink import JsonlShardSink
+from util.page_store import is_page_file, open_page_store, page_id_from_name
+from util.crawl_metrics import CrawlMetrics, MetricsAggregator, format_summary
+from util.proxied_request_executor import MISSING_PAGE, ProxiedRequestExecutor
+from util.proxy_repository import ProxyRepository
+from util.proxy_scheduler import ProxyScheduler, SharedProxyScheduler
+from util.rate_limiter import SharedRateLimiter
+
+
+# objects shared by all crawling processes, set up by init_worker
+_worker_state = {}
+
+# every post number is fetched as post page
+PAGES_DISCOVERY = 'pages'
+# post numbers are looked up in by_id listings, only long self posts are fetched
+BY_ID_DISCOVERY = 'by_id'
 
 
 def get_id_from_thing(thing):
@@ -41,29 +65,73 @@ def get_items_batch(executor: ProxiedRequestExecutor, after=None, url='https://o
     return []
 
 
-def generate_process_args(
-    batch_count=20000,
-    start=0,
-    end=0,
-    is_logger_in_debug=False,
-    dataset_root=os.path.join('.', 'posts')
+def get_by_id_link(post_uids, base_url='https://old.reddit.com'):
+    '''link to json listing of posts previews by their ids'''
+    fullnames = ','.join(f't3_{post_uid}' for post_uid in post_uids)
+    # raw_json keeps markdown of self text unescaped, so its length is not inflated
+    return f'{base_url}/by_id/{fullnames}.json?limit={len(post_uids)}&raw_json=1'
+
+
+def get_long_post_candidates(listing: str, min_length=2000):
+    '''ids of listed posts and ids of listed self posts whose markdown is long enough
+    to hold min_length characters of text, None if listing can't be read.
+    text rendered from markdown is not longer than markdown itself,
+    so posts with shorter markdown can't be long. deleted posts and posts
+    which don't exist are not listed at all'''
+    try:
+        children = json.loads(listing)['data']['children']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    listed = set()
+    candidates = set()
+    for child in children:
+        post = child.get('data', {})
+        if 'id' not in post:
+            continue
+        listed.add(post['id'])
+        if post.get('is_self') and len(post.get('selftext') or '') >= min_length:
+            candidates.add(post['id'])
+    return listed, candidates
+
+
+def maybe_save(
+    markup,
+    post_uid,
+    page_store,
+    logger: logging.Logger,
+    record_sink=None,
+    min_length=2000,
+    duplicates: NearDuplicateIndex = None,
+    dedup_mode=FLAG_DUPLICATES,
+    fragment_only=False,
 ):
-    '''generate starting and ending points, provides debug flag'''
-    for batch_start in range(start, end-1, -batch_count-1):
-        batch_end = batch_start - batch_count
-        batch_end = batch_end if batch_end > end else end
-
-        yield (batch_start, batch_end, is_logger_in_debug, dataset_root)
-
-
-def maybe_save(markup, save_path, logger: logging.Logger):
-    '''saves html markup if content length is long enough'''
-    post_text = parse_post_text(markup)
-    if len(post_text) >= 2000:
-        with open(save_path, 'w', encoding='UTF-8') as file:
-            file.write(markup)
-            logger.info('Saved new big post to %s', save_path)
-            return True
+    '''saves html markup and/or extracted post record if content length is long enough.
+    with duplicates index near duplicates of seen posts are flagged or not saved.
+    with fragment_only only #siteTable part of page is saved'''
+    if not could_be_long_post(markup, min_length):
+        return False
+
+    selector = Selector(text=markup)
+    if page_store is not None and fragment_only:
+        # cut before fields are extracted, extraction cuts links and images out of the tree
+        markup = page_fragment(selector) or markup
+
+    post = extract_fields(selector)
+    if len(post['text']) >= min_length:
+        if duplicates is not None:
+            duplicate_of = duplicates.check_and_add(post_uid, post['text'])
+            if duplicate_of is not None:
+                logger.info('Post %s is near duplicate of %s', post_uid, duplicate_of)
+                if dedup_mode == DROP_DUPLICATES:
+                    return False
+                post['duplicate_of'] = duplicate_of
+        if page_store is not None:
+            page_store.save(post_uid, markup)
+        if record_sink is not None:
+            record_sink.write({'id': post_uid, **post})
+        logger.info('Saved new big post %s', post_uid)
+        return True
     return False
 
 
@@ -86,30 +154,229 @@ def setup_logger(
     return logging.getLogger()
 
 
+def log_proxy_stats(executor: ProxiedRequestExecutor, logger: logging.Logger):
+    '''logs summary of proxies health, per proxy stats go to debug level'''
+    stats = executor.proxy_stats()
+    available = [proxy for proxy in stats if proxy['available']]
+    logger.info(
+        'proxies available: %d of %d; mean latency: %.2fs',
+        len(available),
+        len(stats),
+        sum(proxy['latency'] for proxy in available) / max(len(available), 1),
+    )
+    for proxy in stats:
+        logger.debug('proxy stats: %s', proxy)
+
+
+def init_worker(
+    rate_limiter: SharedRateLimiter = None,
+    stats_dir=None,
+    proxy_scheduler: SharedProxyScheduler = None,
+    batch_slots: SharedBatchSlots = None,
+):
+    '''stores objects shared between crawling processes in worker process'''
+    # interrupt is handled by main process which asks workers to stop through batch slots
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_state['rate_limiter'] = rate_limiter
+    _worker_state['proxy_scheduler'] = proxy_scheduler
+    _worker_state['metrics'] = CrawlMetrics(stats_dir) if stats_dir is not None else None
+    _worker_state['batch_slots'] = batch_slots
+
+
 def crawl_posts_batch(args: tuple):
-    '''crawls and saves a batch of posts'''
+    '''crawls and saves a batch of posts.
+    batch given with slot of shared batch slots may be cut short by scheduler
+    or stopped before its end'''
 
-    start, end, is_logger_in_debug, dataset_root = args
+    start, end, options = args[:3]
+    slot = args[3] if len(args) > 3 else None
+    batch_slots = _worker_state.get('batch_slots') if slot is not None else None
 
     logger = setup_logger(
-        level=logging.DEBUG if is_logger_in_debug else logging.INFO,
+        level=logging.DEBUG if options.is_logger_in_debug else logging.INFO,
         log_dir=os.path.join('.', 'logs', 'processes'),
     )
     executor = ProxiedRequestExecutor(
         logger=logger,
+        timeout=(min(5.0, options.request_timeout), options.request_timeout),
+        pool_size=options.proxy_pool_size,
+        rate_limiter=_worker_state.get('rate_limiter'),
+        metrics=_worker_state.get('metrics'),
+        scheduler=_worker_state.get('proxy_scheduler'),
     )
+    metrics = _worker_state.get('metrics')
+
+    # workers only append to journal, reading it is left to main process,
+    # nodes of distributed crawl report progress to coordinator instead
+    journal = JournalWriter(options.journal_path) if options.journal_path is not None else None
+    watermark = ProgressWatermark(start)
+    reported_number = start
+
+    fetched = PostBitmap(options.fetched_bitmap_path, options.bitmap_size)
+    saved = PostBitmap(options.saved_bitmap_path, options.bitmap_size)
+    page_store = None
+    if options.save_mode in ('html', 'both'):
+        page_store = open_page_store(
+            options.storage,
+            options.dataset_root,
+            compress_files=options.page_content == 'fragment',
+        )
+    record_sink = None
+    if options.save_mode in ('records', 'both'):
+        record_sink = JsonlShardSink(
+            options.records_root,
+            prefix=f'crawled-{os.getpid()}',
+            compression=options.records_compression,
+        )
+    duplicates = None
+    if options.dedup is not None:
+        duplicates = NearDuplicateIndex(options.dedup_path)
 
     files_saved = 0
 
-    for number in range(start, end, -1):
-        post_uid = np.base_repr(number=number, base=36).lower()
-
-        post_link = f'https://old.reddit.com/{post_uid}'
-        post = executor.get(post_link)
-        if post is not None:
-            save_path = os.path.join(dataset_root, f'{post_uid}.html')
-            if maybe_save(post, save_path, logger):
+    def complete(number):
+        nonlocal reported_number
+        watermark.complete(number)
+        if metrics is not None:
+            metrics.set_current_number(watermark.next_number)
+        if reported_number - watermark.next_number >= options.checkpoint_interval:
+            reported_number = watermark.next_number
+            if journal is not None:
+                journal.record_progress(start, end, reported_number)
+            if batch_slots is not None:
+                batch_slots.record_progress(slot, reported_number)
+
+    def generate_numbers():
+        for number in range(start, end, -1):
+            if batch_slots is not None and (
+                batch_slots.is_stopped() or not batch_slots.take(slot, number)
+            ):
+                break
+            if number in fetched:
+                # page was fetched by previous or overlapping run
+                complete(number)
+                continue
+            yield number
+
+    def post_uid_of(number):
+        return np.base_repr(number=number, base=36).lower()
+
+    def generate_links():
+        for number in generate_numbers():
+            yield f'{options.base_url}/{post_uid_of(number)}'
+
+    listed_numbers = {}
+
+    def list_numbers(numbers):
+        link = get_by_id_link([post_uid_of(number) for number in numbers], options.base_url)
+        listed_numbers[link] = numbers
+        return link
+
+    def generate_listing_links():
+        numbers = []
+        for number in generate_numbers():
+            numbers.append(number)
+            if len(numbers) == options.by_id_batch_size:
+                yield list_numbers(numbers)
+                numbers = []
+        if len(numbers) != 0:
+            yield list_numbers(numbers)
+
+    def generate_candidate_links():
+        # few listings in flight are enough to keep post pages requests busy
+        listings = executor.get_many(
+            generate_listing_links(), max(1, options.concurrency // 8))
+        for listing_link, listing in listings:
+            numbers = listed_numbers.pop(listing_link)
+            posts = None
+            if listing is not None:
+                posts = get_long_post_candidates(listing)
+            if posts is None:
+                # listing failed, every post of it is fetched as page
+                logger.debug('listing failed: %s', listing_link)
+                posts = (set(), {post_uid_of(number) for number in numbers})
+
+            listed, candidates = posts
+            for number in numbers:
+                post_uid = post_uid_of(number)
+                if post_uid in candidates:
+                    yield f'{options.base_url}/{post_uid}'
+                    continue
+                if post_uid in listed:
+                    # post exists and is short or not self post, like fetched short page
+                    fetched.add(number)
+                # posts which are deleted or don't exist yet are not marked,
+                # like missing pages, so later runs look them up again
+                complete(number)
+
+    if options.discovery == BY_ID_DISCOVERY:
+        links = generate_candidate_links()
+    else:
+        links = generate_links()
+
+    def store(link, post):
+        nonlocal files_saved
+        post_uid = link.rsplit('/', 1)[-1]
+        number = int(post_uid, 36)
+        if post is not MISSING_PAGE:
+            if maybe_save(
+                post,
+                post_uid,
+                page_store,
+                logger,
+                record_sink,
+                duplicates=duplicates,
+                dedup_mode=options.dedup,
+                fragment_only=options.page_content == 'fragment',
+            ):
+                saved.add(number)
                 files_saved += 1
+                if metrics is not None:
+                    metrics.record_save()
+            fetched.add(number)
+
+        complete(number)
+
+    failed_links = []
+    for link, post in executor.get_many(links, options.concurrency, executor.get_page):
+        if post is None:
+            failed_links.append(link)
+        else:
+            store(link, post)
+
+    # failed posts are retried once, the ones which failed again are not completed,
+    # so watermark stays above them and they are crawled on resume
+    if len(failed_links) != 0 and not (batch_slots is not None and batch_slots.is_stopped()):
+        logger.info('Retrying %d failed posts', len(failed_links))
+        retried_links, failed_links = failed_links, []
+        for link, post in executor.get_many(retried_links, options.concurrency, executor.get_page):
+            if post is None:
+                failed_links.append(link)
+            else:
+                store(link, post)
+    if len(failed_links) != 0:
+        logger.error('%d posts failed, batch stops at %s', len(failed_links), watermark.next_number)
+
+    if batch_slots is not None:
+        end = batch_slots.end(slot)
+        batch_slots.record_progress(slot, watermark.next_number)
+    if journal is not None:
+        if watermark.next_number == end:
+            journal.record_done(start, end)
+        elif watermark.next_number != start:
+            journal.record_progress(start, end, watermark.next_number)
+    log_proxy_stats(executor, logger)
+    executor.close()
+    if page_store is not None:
+        page_store.close()
+    if record_sink is not None:
+        record_sink.close()
+    if duplicates is not None:
+        duplicates.close()
+    fetched.close()
+    saved.close()
+    if metrics is not None:
+        metrics.flush()
     return files_saved
 
 
@@ -117,22 +384,26 @@ def check_already_crawled(dataset_root):
     '''checks crawled posts count and returns id of the last'''
     post_ids = []
     for file in os.scandir(dataset_root):
-        if file.name.endswith('.html'):
-            post_ids.append(file.name.split('.')[0])
+        if is_page_file(file.name):
+            post_ids.append(page_id_from_name(file.name))
 
     last_parsed_id = None
 
     if len(post_ids) != 0:
-        post_ids.sort()
-        last_parsed_id = post_ids[0]
+        # base36 ids of different length can't be compared as strings
+        last_parsed_id = min(post_ids, key=lambda post_id: int(post_id, 36))
 
     return len(post_ids), last_parsed_id
 
 
-def specify_last_reddit_post_id(last_if_not_found):
+def specify_last_reddit_post_id(
+    last_if_not_found,
+    base_url='https://old.reddit.com',
+    scheduler: ProxyScheduler = None,
+):
     '''finds id of recent post on reddit or returns specified id if not found'''
-    executor = ProxiedRequestExecutor()
-    batch = get_items_batch(executor, url='https://old.reddit.com/new')
+    executor = ProxiedRequestExecutor(scheduler=scheduler)
+    batch = get_items_batch(executor, url=f'{base_url}/new')
 
     last_post_dirty_id = get_id_from_thing(batch[0]).split('_')
     last_post_id = None
@@ -144,13 +415,44 @@ def specify_last_reddit_post_id(last_if_not_found):
     return last_post_id if last_post_id is not None else last_id_if_none
 
 
-def is_available(url):
+def is_available(url, scheduler: ProxyScheduler = None):
     '''checks if website isnt down'''
-    executor = ProxiedRequestExecutor()
+    executor = ProxiedRequestExecutor(scheduler=scheduler)
     page = executor.get(url)
     return page is not None
 
 
+def find_crawl_top(
+    dataset_root,
+    last_post_number,
+    logger: logging.Logger,
+    base_url='https://old.reddit.com',
+    scheduler: ProxyScheduler = None,
+):
+    '''finds post number to start crawling from when there is no journal'''
+    crawled_count, last_crawled_id = check_already_crawled(dataset_root)
+
+    logger.info('%d posts already crawled', crawled_count)
+
+    if last_crawled_id is None:
+        last_crawled_id = specify_last_reddit_post_id(
+            last_if_not_found=last_post_number,
+            base_url=base_url,
+            scheduler=scheduler,
+        )
+        logger.info(
+            'Starting crawling after hardcoded last post: %s',
+            last_crawled_id,
+        )
+    else:
+        logger.info(
+            'Starting crawling after last saved post: %s',
+            last_crawled_id,
+        )
+
+    return int(last_crawled_id, 36)
+
+
 def crawl_reddit(
     first_post_number: int,
     last_post_number: int,
@@ -158,12 +460,38 @@ def crawl_reddit(
     workers_count: int = 1,
     is_root_logger_in_debug=False,
     is_proc_loggers_in_debug=False,
+    concurrency=64,
+    request_timeout=15.0,
+    proxy_pool_size=4,
+    storage='files',
+    save_mode='html',
+    records_root=os.path.join('.', 'cleaned_posts'),
+    records_compression=None,
+    dedup=None,
+    dedup_path=os.path.join('.', 'near_duplicates.sqlite'),
+    discovery=PAGES_DISCOVERY,
+    page_content='fragment',
+    global_rate=0.0,
+    proxy_rate=1.0,
+    stats_interval=5.0,
+    on_stats=None,
+    coordinator_address=None,
+    node_id=None,
+    base_url='https://old.reddit.com',
+    proxies_path=None,
 ):
-    '''crawl old.reddit.com in concurrent manner'''
+    '''crawl old.reddit.com in concurrent manner.
+    every stats_interval seconds workers stats are aggregated to logs/crawl_stats.json
+    and passed to on_stats as one line summary.
+    with coordinator_address ("host:port") crawler works as node of distributed crawl
+    and crawls ranges leased from coordinator instead of ranges of its own journal.
+    base_url and proxies_path (proxies cache file) point crawler to another site,
+    e.g. to local mock old.reddit'''
 
     if not os.path.exists(dataset_root):
         os.makedirs(dataset_root)
 
+    # size of first batches, the next ones are sized by measured crawl rate
     batch_size = 5000
     logger = setup_logger(
         filename='crawler.log',
@@ -172,47 +500,149 @@ def crawl_reddit(
 
     reddit_first_post_ever = first_post_number
 
-    crawled_count, last_crawled_id = check_already_crawled(dataset_root)
-
-    logger.info('%d posts already crawled', crawled_count)
+    # validates stale cached proxies before workers start and keeps cache fresh,
+    # workers get proxies from it through shared proxy scheduler
+    proxy_repository = ProxyRepository(
+        logger=logger,
+        refresh=True,
+        test_url=base_url,
+        cache_path=proxies_path,
+    )
 
-    if last_crawled_id is None:
-        last_crawled_id = specify_last_reddit_post_id(
-            last_if_not_found=last_post_number
-        )
-        logger.info(
-            'Starting crawling after hardcoded last post: %s',
-            last_crawled_id,
-        )
+    journal = None
+    if coordinator_address is not None:
+        client = CoordinatorClient(coordinator_address)
+        coordinator_info = client.request(op='info')
+        crawl_top = coordinator_info['top']
+        logger.info('Crawling ranges leased from coordinator %s', coordinator_address)
     else:
-        logger.info(
-            'Starting crawling after last saved post: %s',
-            last_crawled_id,
+        journal = CheckpointJournal(os.path.join(dataset_root, 'crawl.journal'))
+        if journal.top is None:
+            journal.begin(find_crawl_top(
+                dataset_root,
+                last_post_number,
+                logger,
+                base_url=base_url,
+                scheduler=ProxyScheduler(proxy_repository.proxies),
+            ))
+        else:
+            logger.info(
+                'Resuming crawling from journal, %d post numbers already crawled',
+                journal.crawled_count(),
+            )
+        journal.compact()
+        crawl_top = journal.top
+
+        remaining_ranges = journal.remaining_ranges(
+            journal.top, reddit_first_post_ever)
+
+    if is_available(base_url, ProxyScheduler(proxy_repository.proxies)):
+        rate_limiter = SharedRateLimiter(
+            global_rate=global_rate,
+            proxy_rate=proxy_rate,
         )
-
-    if is_available(url='https://old.reddit.com'):
-        with ProcessPoolExecutor(max_workers=workers_count) as pool:
-            try:
-                args_generator = generate_process_args(
-                    batch_count=batch_size,
-                    start=int(last_crawled_id, 36),
-                    end=reddit_first_post_ever,
-                    is_logger_in_debug=is_proc_loggers_in_debug,
-                    dataset_root=dataset_root,
-                )
-
-                futures_buffer = [pool.submit(crawl_posts_batch, args)
-                                  for args in args_generator]
-
-                for future in as_completed(futures_buffer):
-                    posts_saved = future.result()
-                    logger.info(
-                        '%d posts total saved from process',
-                        posts_saved,
+        stats_dir = os.path.join('.', 'logs', 'stats')
+        aggregator = MetricsAggregator(
+            stats_dir=stats_dir,
+            summary_path=os.path.join('.', 'logs', 'crawl_stats.json'),
+        )
+        # one batch per worker is in flight, so worker which got idle
+        # takes part of batch of straggling one instead of waiting in queue
+        batch_slots = SharedBatchSlots(workers_count)
+        if coordinator_address is not None:
+            scheduler = LeasedBatches(
+                client,
+                batch_slots,
+                node_id if node_id is not None else f'{socket.gethostname()}-{os.getpid()}',
+                # several heartbeats fit into lease ttl, so single lost one doesn't lose lease
+                heartbeat_interval=min(10.0, coordinator_info['lease_ttl'] / 3),
+                logger=logger,
+            )
+        else:
+            scheduler = BatchScheduler(
+                remaining_ranges,
+                batch_slots,
+                initial_batch_size=batch_size,
+            )
+        proxy_scheduler = SharedProxyScheduler(proxy_repository.proxies)
+        # background refresh and refills of repository reach workers through shared pool
+        proxy_repository.serve(proxy_scheduler)
+        with ProcessPoolExecutor(
+            max_workers=workers_count,
+            initializer=init_worker,
+            initargs=(
+                rate_limiter,
+                stats_dir,
+                proxy_scheduler,
+                batch_slots,
+            ),
+        ) as pool:
+            options = CrawlOptions(
+                dataset_root=dataset_root,
+                is_logger_in_debug=is_proc_loggers_in_debug,
+                concurrency=concurrency,
+                request_timeout=request_timeout,
+                proxy_pool_size=proxy_pool_size,
+                journal_path=journal.path if journal is not None else None,
+                fetched_bitmap_path=os.path.join(dataset_root, 'fetched.bitmap'),
+                saved_bitmap_path=os.path.join(dataset_root, 'saved.bitmap'),
+                bitmap_size=max(crawl_top, last_post_number) + 1,
+                storage=storage,
+                save_mode=save_mode,
+                records_root=records_root,
+                records_compression=records_compression,
+                dedup=dedup,
+                dedup_path=dedup_path,
+                discovery=discovery,
+                page_content=page_content,
+                base_url=base_url,
+            )
+
+            futures_buffer = {}
+            while True:
+                try:
+                    batch = scheduler.next_batch()
+                    while batch is not None:
+                        batch_start, batch_end, slot = batch
+                        future = pool.submit(
+                            crawl_posts_batch, (batch_start, batch_end, options, slot))
+                        futures_buffer[future] = slot
+                        batch = scheduler.next_batch()
+
+                    if len(futures_buffer) == 0:
+                        if scheduler.is_done():
+                            break
+                        # the rest is leased by other nodes, leases of dead ones expire
+                        time.sleep(stats_interval)
+                        continue
+
+                    done, _ = wait(
+                        futures_buffer,
+                        timeout=stats_interval,
+                        return_when=FIRST_COMPLETED,
                     )
-
-            except KeyboardInterrupt:
-                for pid in pool._processes:
-                    os.kill(pid, signal.SIGKILL)
+                    for future in done:
+                        posts_saved = future.result()
+                        scheduler.finish(futures_buffer.pop(future))
+                        logger.info(
+                            '%d posts total saved from process',
+                            posts_saved,
+                        )
+                        logger.debug('batch size: %d', scheduler.batch_size)
+
+                    summary = format_summary(aggregator.aggregate())
+                    logger.debug('stats: %s', summary)
+                    if on_stats is not None:
+                        on_stats(summary)
+
+                except KeyboardInterrupt:
+                    # workers finish requests in flight and journal their progress
+                    logger.info('Stopping crawling, waiting for workers to finish')
+                    batch_slots.stop()
+
+        if coordinator_address is not None:
+            scheduler.close()
     else:
         logger.error('old.reddit is not available')
+
+    proxy_repository.stop_refreshing()
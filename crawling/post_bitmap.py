@@ -0,0 +1,82 @@
+'''memory-mapped bitsets over post numbers'''
+
+import fcntl
+import mmap
+import os
+
+
+class PostBitmap:
+    '''bit per post number stored in memory-mapped file shared by crawling processes.
+    reads are lock-free, setting a bit locks its byte in file,
+    so processes setting neighbouring numbers don't lose each other's bits.
+    file grows when number above size is added, other processes map grown part
+    when they look such number up'''
+    # bits file grows by at once, 128 KB
+    growth_step = 1 << 20
+
+    def __init__(self, path, size: int):
+        self.path = path
+        self.size = 0
+        self._file = open(path, 'a+b')
+        self._map = None
+        self._remap(size)
+
+    def _remap(self, size: int):
+        byte_count = (size + 7) // 8
+        # file is grown sparsely, untouched pages take no disk space.
+        # whole file lock keeps process from shrinking file another one has just grown
+        descriptor = self._file.fileno()
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+        try:
+            file_size = os.fstat(descriptor).st_size
+            if file_size < byte_count:
+                self._file.truncate(byte_count)
+            else:
+                byte_count = file_size
+        finally:
+            fcntl.flock(descriptor, fcntl.LOCK_UN)
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), byte_count)
+        self.size = byte_count * 8
+
+    def _covers(self, number: int):
+        '''whether number fits mapped part, maps part grown by other process if needed'''
+        if number < self.size:
+            return True
+        if os.fstat(self._file.fileno()).st_size * 8 > number:
+            self._remap(number + 1)
+            return True
+        return False
+
+    def __contains__(self, number: int):
+        if number < 0 or not self._covers(number):
+            return False
+        return bool(self._map[number >> 3] & (1 << (number & 7)))
+
+    def add(self, number: int):
+        '''sets bit of post number, grows file if number doesn't fit it'''
+        if number < 0:
+            raise ValueError(f'post number must not be negative: {number}')
+        if not self._covers(number):
+            self._remap((number // self.growth_step + 1) * self.growth_step)
+
+        byte_index = number >> 3
+        descriptor = self._file.fileno()
+        fcntl.lockf(descriptor, fcntl.LOCK_EX, 1, byte_index, os.SEEK_SET)
+        try:
+            self._map[byte_index] |= 1 << (number & 7)
+        finally:
+            fcntl.lockf(descriptor, fcntl.LOCK_UN, 1, byte_index, os.SEEK_SET)
+
+    def close(self):
+        '''flushes changes and unmaps file'''
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,260 @@
+'''refreshing score, comments count and awards of saved posts'''
+
+import calendar
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+from crawling.crawler import get_by_id_link
+from parsing.data_extractor import award_name_from_icon
+from parsing.post_sink import RecordPatcher, iter_records
+from util.proxied_request_executor import ProxiedRequestExecutor
+
+
+# fields of post which change after it is saved
+REFRESHED_FIELDS = ('score', 'comments_count', 'awards')
+
+GROUP_SIZE = 100
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def submission_timestamp(submission_time: str):
+    '''unix time of submission time string of post record, None if it can't be read'''
+    try:
+        return calendar.timegm(time.strptime(submission_time, '%a %b %d %H:%M:%S %Y %Z'))
+    except (TypeError, ValueError):
+        return None
+
+
+def refreshed_fields(post: dict):
+    '''score, comments count and awards of post from by_id listing json,
+    award names are taken from icons like on post page'''
+    awards = {}
+    for award in post.get('all_awardings') or []:
+        awards[award_name_from_icon(award['icon_url'])] = award['count']
+    return {
+        'score': post['score'],
+        'comments_count': post['num_comments'],
+        'awards': awards,
+    }
+
+
+class Recrawler:
+    '''keeps schedule of saved posts in sqlite database and refreshes posts which are due.
+    posts are split into groups of similar age, every group is a single by_id listing
+    request which is sent with validators of previous response, so listing
+    which didn't change costs empty 304 response.
+    group is rechecked after age_factor of its age, the interval doubles with every
+    check which found no changes and resets when something changed.
+    posts older than archive_age are archived by reddit and are not checked anymore'''
+
+    def __init__(
+        self,
+        records_root=os.path.join('.', 'cleaned_posts'),
+        state_path=None,
+        executor: ProxiedRequestExecutor = None,
+        base_url='https://old.reddit.com',
+        age_factor=0.25,
+        min_interval=HOUR,
+        max_interval=30 * DAY,
+        archive_age=180 * DAY,
+        max_backoff=4,
+    ):
+        self.records_root = records_root
+        self.executor = executor
+        self.base_url = base_url
+        self.age_factor = age_factor
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.archive_age = archive_age
+        self.max_backoff = max_backoff
+
+        if state_path is None:
+            state_path = os.path.join(records_root, 'recrawl.sqlite')
+        self.connection = sqlite3.connect(state_path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS posts (
+                post_id TEXT PRIMARY KEY,
+                group_id INTEGER NOT NULL,
+                fields TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS posts_groups ON posts (group_id);
+            CREATE TABLE IF NOT EXISTS groups (
+                group_id INTEGER PRIMARY KEY,
+                submitted_at INTEGER NOT NULL,
+                next_check_at REAL NOT NULL,
+                unchanged_checks INTEGER NOT NULL DEFAULT 0,
+                etag TEXT,
+                last_modified TEXT
+            );
+            CREATE INDEX IF NOT EXISTS groups_schedule ON groups (next_check_at);
+        ''')
+
+    def add_new_posts(self, now=None):
+        '''schedules posts of records which are not scheduled yet,
+        returns number of added posts'''
+        now = time.time() if now is None else now
+        known = {post_id for post_id, in self.connection.execute('SELECT post_id FROM posts')}
+
+        new_posts = []
+        for record in iter_records(self.records_root):
+            if record['id'] in known:
+                continue
+            submitted_at = submission_timestamp(record.get('submission_time'))
+            if submitted_at is None or now - submitted_at > self.archive_age:
+                continue
+            known.add(record['id'])
+            fields = {name: record.get(name) for name in REFRESHED_FIELDS}
+            new_posts.append((submitted_at, record['id'], fields))
+        new_posts.sort()
+
+        next_group_id = self.connection.execute(
+            'SELECT COALESCE(MAX(group_id), -1) + 1 FROM groups').fetchone()[0]
+        with self._transaction():
+            for start in range(0, len(new_posts), GROUP_SIZE):
+                group = new_posts[start:start + GROUP_SIZE]
+                group_id = next_group_id + start // GROUP_SIZE
+                self.connection.executemany(
+                    'INSERT INTO posts VALUES (?, ?, ?)',
+                    [(post_id, group_id, json.dumps(fields)) for _, post_id, fields in group],
+                )
+                # metadata saved at crawl time is stale already, so new group is due at once
+                self.connection.execute(
+                    'INSERT INTO groups (group_id, submitted_at, next_check_at) VALUES (?, ?, ?)',
+                    (group_id, group[-1][0], now),
+                )
+        return len(new_posts)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.connection.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def due_count(self, now=None):
+        '''number of groups which are due to be checked'''
+        now = time.time() if now is None else now
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM groups WHERE next_check_at <= ?', (now,)).fetchone()[0]
+
+    def _interval(self, submitted_at, unchanged_checks, now):
+        interval = max(now - submitted_at, 0) * self.age_factor
+        interval *= 2 ** min(unchanged_checks, self.max_backoff)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _schedule(self, group_id, submitted_at, unchanged_checks, now, etag, last_modified):
+        if now - submitted_at > self.archive_age:
+            self.connection.execute('DELETE FROM posts WHERE group_id = ?', (group_id,))
+            self.connection.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
+            return
+        self.connection.execute(
+            'UPDATE groups SET next_check_at = ?, unchanged_checks = ?, etag = ?, '
+            'last_modified = ? WHERE group_id = ?',
+            (
+                now + self._interval(submitted_at, unchanged_checks, now),
+                unchanged_checks,
+                etag,
+                last_modified,
+                group_id,
+            ),
+        )
+
+    def _apply_listing(self, group_id, listing, patcher: RecordPatcher):
+        known = {
+            post_id: json.loads(fields) for post_id, fields in self.connection.execute(
+                'SELECT post_id, fields FROM posts WHERE group_id = ?', (group_id,))
+        }
+        changed = []
+        for child in json.loads(listing)['data']['children']:
+            post = child.get('data', {})
+            if post.get('id') not in known:
+                continue
+            fields = refreshed_fields(post)
+            if fields != known[post['id']]:
+                patcher.patch(post['id'], fields)
+                changed.append((json.dumps(fields), post['id']))
+
+        self.connection.executemany('UPDATE posts SET fields = ? WHERE post_id = ?', changed)
+        return len(changed)
+
+    def refresh(self, max_requests=1000, concurrency=16, now=None, on_group=None):
+        '''checks up to max_requests due groups, patches records of changed posts.
+        returns counts of checked groups, not modified groups, failed requests
+        and patched posts; on_group is called after every checked group'''
+        now = time.time() if now is None else now
+        if self.executor is None:
+            self.executor = ProxiedRequestExecutor()
+
+        groups = {}
+        for group_id, submitted_at, unchanged_checks, etag, last_modified in self.connection.execute(
+            'SELECT group_id, submitted_at, unchanged_checks, etag, last_modified FROM groups '
+            'WHERE next_check_at <= ? ORDER BY next_check_at LIMIT ?',
+            (now, max_requests),
+        ).fetchall():
+            post_ids = [post_id for post_id, in self.connection.execute(
+                'SELECT post_id FROM posts WHERE group_id = ? ORDER BY post_id', (group_id,))]
+            link = get_by_id_link(post_ids, self.base_url)
+            groups[link] = (group_id, submitted_at, unchanged_checks, etag, last_modified)
+
+        def request(link):
+            _, _, _, etag, last_modified = groups[link]
+            return self.executor.get_if_modified(link, etag, last_modified)
+
+        stats = {'checked': 0, 'not_modified': 0, 'failed': 0, 'patched': 0}
+        with RecordPatcher(self.records_root) as patcher:
+            for link, response in self.executor.get_many(groups, concurrency, request):
+                group_id, submitted_at, unchanged_checks, etag, last_modified = groups[link]
+                with self._transaction():
+                    if response is None:
+                        stats['failed'] += 1
+                        # failed group is retried after minimal interval
+                        self.connection.execute(
+                            'UPDATE groups SET next_check_at = ? WHERE group_id = ?',
+                            (now + self.min_interval, group_id),
+                        )
+                    else:
+                        listing, etag, last_modified = response
+                        patched = 0
+                        if listing is None:
+                            stats['not_modified'] += 1
+                        else:
+                            try:
+                                patched = self._apply_listing(group_id, listing, patcher)
+                            except (ValueError, KeyError, TypeError):
+                                # listing which can't be read is not worth validating next time
+                                etag, last_modified = None, None
+                        stats['checked'] += 1
+                        stats['patched'] += patched
+                        self._schedule(
+                            group_id,
+                            submitted_at,
+                            unchanged_checks + 1 if patched == 0 else 0,
+                            now,
+                            etag,
+                            last_modified,
+                        )
+                if on_group is not None:
+                    on_group(stats)
+        return stats
+
+    def close(self):
+        '''closes executor and database'''
+        if self.executor is not None:
+            self.executor.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
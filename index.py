@@ -0,0 +1,82 @@
+'''inverted index building script'''
+
+import argparse
+import os
+import shutil
+
+from tqdm import tqdm
+
+from indexing.index_builder import build_index, merge_segments
+from indexing.inverted_index import read_manifest
+from parsing.post_sink import iter_records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=('Script for building inverted index of parsed posts. '
+                     'Already indexed posts only get their score and comments count refreshed, '
+                     'new ones go to new index segment.'),
+    )
+
+    parser.add_argument(
+        '--input_path',
+        type=str,
+        default=os.path.join('.', 'cleaned_posts'),
+        help=('path where parsed posts stored, as json files or jsonl shards'),
+    )
+
+    parser.add_argument(
+        '--index_path',
+        type=str,
+        default=os.path.join('.', 'index'),
+        help=('path where index is stored'),
+    )
+
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help=('number of indexing processes'),
+    )
+
+    parser.add_argument(
+        '--memory_mb',
+        type=int,
+        default=1024,
+        help=('memory for in-memory postings of all indexing processes, '
+              'postings are flushed to disk blocks when it is exceeded'),
+    )
+
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help=('merges all index segments into one after indexing'),
+    )
+
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help=('removes existing index and indexes all posts again'),
+    )
+
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.index_path):
+        shutil.rmtree(args.index_path)
+
+    refreshed = []
+    with tqdm(desc='Indexing posts') as bar:
+        indexed_count = build_index(
+            iter_records(args.input_path),
+            args.index_path,
+            workers_count=args.workers,
+            memory_budget=args.memory_mb * 1024 * 1024,
+            on_progress=bar.update,
+            on_refreshed=refreshed.append,
+        )
+    print(f'{indexed_count} posts indexed, {refreshed[0]} indexed posts refreshed')
+
+    if args.merge:
+        merge_segments(args.index_path)
+    print(f'Index segments: {len(read_manifest(args.index_path))}')
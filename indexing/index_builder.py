@@ -0,0 +1,306 @@
+'''building inverted index segments from post records'''
+
+import heapq
+import itertools
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+
+from indexing.inverted_index import (
+    DICTIONARY_NAME,
+    DOCUMENTS_NAME,
+    POST_IDS_NAME,
+    POSTINGS_NAME,
+    TERM_RECORD,
+    TERMS_NAME,
+    IndexSegment,
+    read_manifest,
+    read_post_ids,
+    write_manifest,
+)
+from indexing.postings_codec import decode_postings, encode_postings
+from indexing.spimi import DOCUMENT_RECORD, invert_documents, iter_block
+
+
+# raw text takes about that many times less memory than postings built from it
+POSTINGS_MEMORY_PER_CHARACTER = 8
+MIN_WORKER_MEMORY = 16 * 1024 * 1024
+DICTIONARY_BUFFER_SIZE = 65536
+
+
+def _ignore_progress(_):
+    pass
+
+
+def segment_name(number):
+    '''directory name of index segment'''
+    return f'segment-{number:05d}'
+
+
+def _next_segment_name(index_root):
+    names = set(read_manifest(index_root))
+    number = 0
+    while segment_name(number) in names or os.path.exists(
+            os.path.join(index_root, segment_name(number))):
+        number += 1
+    return segment_name(number)
+
+
+def merge_postings(sources, segment_root):
+    '''merges term ordered sources into postings file and term dictionary of segment.
+    every source yields (term, doc count, compressed postings) and has doc id offset,
+    sources have to be given in doc id order. returns number of terms'''
+    def with_offset(source, doc_offset):
+        for term, doc_count, data in source:
+            yield term, doc_count, data, doc_offset
+
+    merged = heapq.merge(
+        *(with_offset(source, doc_offset) for source, doc_offset in sources),
+        key=lambda entry: entry[0],
+    )
+
+    terms_count = 0
+    dictionary = []
+    with open(os.path.join(segment_root, POSTINGS_NAME), 'wb') as postings_file, \
+            open(os.path.join(segment_root, TERMS_NAME), 'w', encoding='UTF-8') as terms_file, \
+            open(os.path.join(segment_root, DICTIONARY_NAME), 'wb') as dictionary_file:
+        for term, entries in itertools.groupby(merged, key=lambda entry: entry[0]):
+            entries = list(entries)
+            if len(entries) == 1 and entries[0][3] == 0:
+                # postings of single block are written as is
+                _, doc_count, data, _ = entries[0]
+                data = bytes(data)
+            else:
+                parts = []
+                for _, _, part_data, doc_offset in entries:
+                    postings = decode_postings(part_data)
+                    postings[:, 0] += np.uint64(doc_offset)
+                    parts.append(postings)
+                postings = np.concatenate(parts)
+                doc_count = len(postings)
+                data = encode_postings(postings)
+
+            dictionary.append((postings_file.tell(), len(data), doc_count))
+            postings_file.write(data)
+            terms_file.write(f'{term}\n')
+            terms_count += 1
+
+            if len(dictionary) >= DICTIONARY_BUFFER_SIZE:
+                dictionary_file.write(np.array(dictionary, dtype=TERM_RECORD).tobytes())
+                dictionary = []
+        dictionary_file.write(np.array(dictionary, dtype=TERM_RECORD).tobytes())
+
+    return terms_count
+
+
+class DocumentsRefresher:
+    '''writes changed score and comments count of already indexed posts
+    to doc tables of their segments, query engine builds its priors from them'''
+
+    def __init__(self, index_root, locations):
+        self.index_root = index_root
+        # post id to (segment name, doc id in segment), None for posts indexed in this run
+        self.locations = locations
+        self.refreshed_count = 0
+        self._tables = {}
+
+    def _table(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            table = np.memmap(
+                os.path.join(self.index_root, name, DOCUMENTS_NAME),
+                dtype=DOCUMENT_RECORD,
+                mode='r+',
+            )
+            self._tables[name] = table
+        return table
+
+    def refresh(self, record):
+        '''updates doc table row of indexed post if record of it changed'''
+        location = self.locations[record['id']]
+        if location is None:
+            return
+        name, doc_id = location
+        table = self._table(name)
+        if table['score'][doc_id] != record['score'] \
+                or table['comments_count'][doc_id] != record['comments_count']:
+            table['score'][doc_id] = record['score']
+            table['comments_count'][doc_id] = record['comments_count']
+            self.refreshed_count += 1
+
+    def close(self):
+        '''flushes changed doc tables'''
+        for table in self._tables.values():
+            table.flush()
+        self._tables = {}
+
+
+def _documents_of(records, refresher: DocumentsRefresher):
+    for record in records:
+        # flagged near duplicates would only repeat posts they copy in results
+        if record.get('duplicate_of') is not None:
+            continue
+        if record['id'] in refresher.locations:
+            refresher.refresh(record)
+        else:
+            refresher.locations[record['id']] = None
+            yield record
+
+
+def _batches_of(records, max_characters):
+    batch = []
+    characters = 0
+    for record in records:
+        batch.append(record)
+        characters += len(record['title']) + len(record['text'])
+        if characters >= max_characters:
+            yield batch
+            batch = []
+            characters = 0
+    if len(batch) != 0:
+        yield batch
+
+
+def indexed_locations(index_root):
+    '''(segment name, doc id in segment) of every indexed post by its id'''
+    locations = {}
+    for name in read_manifest(index_root):
+        for doc_id, post_id in enumerate(read_post_ids(os.path.join(index_root, name))):
+            locations[post_id] = (name, doc_id)
+    return locations
+
+
+def build_index(
+    records,
+    index_root,
+    workers_count=1,
+    memory_budget=1024 * 1024 * 1024,
+    max_batches_in_flight=None,
+    on_progress=_ignore_progress,
+    on_refreshed=_ignore_progress,
+):
+    '''indexes posts which aren't in index yet into new segment.
+    records are inverted in batches by pool of processes, each one keeping its
+    postings under memory_budget / workers_count and flushing them to sorted blocks,
+    blocks are merged into segment afterwards. score and comments count of posts
+    which are already indexed are refreshed from their records in place.
+    on_progress is called with number of indexed posts, returns number of them,
+    on_refreshed is called with number of refreshed posts at the end'''
+    os.makedirs(index_root, exist_ok=True)
+    name = _next_segment_name(index_root)
+    segment_root = os.path.join(index_root, name)
+    block_root = os.path.join(segment_root, 'blocks')
+    os.makedirs(block_root)
+
+    worker_memory = max(memory_budget // max(workers_count, 1), MIN_WORKER_MEMORY)
+    refresher = DocumentsRefresher(index_root, indexed_locations(index_root))
+    batches = _batches_of(
+        _documents_of(records, refresher),
+        max(worker_memory // POSTINGS_MEMORY_PER_CHARACTER, 1),
+    )
+
+    block_paths = {}
+    documents_count = 0
+
+    with open(os.path.join(segment_root, POST_IDS_NAME), 'w', encoding='UTF-8') as ids_file, \
+            open(os.path.join(segment_root, DOCUMENTS_NAME), 'wb') as documents_file:
+
+        def tasks():
+            nonlocal documents_count
+            for batch_number, batch in enumerate(batches):
+                documents = []
+                for record in batch:
+                    ids_file.write(f'{record["id"]}\n')
+                    documents.append((
+                        documents_count,
+                        record['title'],
+                        record['text'],
+                        record['score'],
+                        record['comments_count'],
+                    ))
+                    documents_count += 1
+                yield batch_number, documents, block_root, worker_memory
+
+        def store(task, result):
+            batch_number, documents, _, _ = task
+            paths, rows = result
+            block_paths[batch_number] = paths
+            # batches finish out of order, doc table rows go to their places
+            first_doc_id = documents[0][0]
+            documents_file.seek(first_doc_id * DOCUMENT_RECORD.itemsize)
+            documents_file.write(rows.tobytes())
+            on_progress(len(rows))
+
+        if workers_count <= 1:
+            for task in tasks():
+                store(task, invert_documents(task))
+        else:
+            if max_batches_in_flight is None:
+                max_batches_in_flight = workers_count * 2
+
+            with ProcessPoolExecutor(max_workers=workers_count) as pool:
+                in_flight = {}
+
+                def collect(done):
+                    for future in done:
+                        store(in_flight.pop(future), future.result())
+
+                for task in tasks():
+                    if len(in_flight) >= max_batches_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight[pool.submit(invert_documents, task)] = task
+
+                while len(in_flight) != 0:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+    refresher.close()
+    on_refreshed(refresher.refreshed_count)
+
+    if documents_count == 0:
+        shutil.rmtree(segment_root)
+        return 0
+
+    ordered_paths = [
+        path for batch_number in sorted(block_paths) for path in block_paths[batch_number]
+    ]
+    merge_postings([(iter_block(path), 0) for path in ordered_paths], segment_root)
+    shutil.rmtree(block_root)
+
+    write_manifest(index_root, read_manifest(index_root) + [name])
+    return documents_count
+
+
+def merge_segments(index_root):
+    '''merges all index segments into one'''
+    names = read_manifest(index_root)
+    if len(names) <= 1:
+        return
+
+    name = _next_segment_name(index_root)
+    segment_root = os.path.join(index_root, name)
+    os.makedirs(segment_root)
+
+    segments = [IndexSegment(os.path.join(index_root, old_name)) for old_name in names]
+    try:
+        sources = []
+        base = 0
+        for segment in segments:
+            sources.append((segment.iter_terms(), base))
+            base += len(segment)
+        merge_postings(sources, segment_root)
+
+        with open(os.path.join(segment_root, POST_IDS_NAME), 'w', encoding='UTF-8') as ids_file, \
+                open(os.path.join(segment_root, DOCUMENTS_NAME), 'wb') as documents_file:
+            for segment in segments:
+                ids_file.writelines(f'{post_id}\n' for post_id in segment.post_ids)
+                documents_file.write(segment.documents.tobytes())
+    finally:
+        for segment in segments:
+            segment.close()
+
+    write_manifest(index_root, [name])
+    for old_name in names:
+        shutil.rmtree(os.path.join(index_root, old_name))
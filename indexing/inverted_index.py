@@ -0,0 +1,157 @@
+'''reading inverted index segments built by index builder'''
+
+import bisect
+import json
+import mmap
+import os
+import numpy as np
+
+from indexing.postings_codec import decode_postings
+from indexing.spimi import DOCUMENT_RECORD
+
+
+TERM_RECORD = np.dtype([
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('doc_count', '<u4'),
+])
+
+MANIFEST_NAME = 'segments.json'
+POSTINGS_NAME = 'postings.bin'
+TERMS_NAME = 'terms.txt'
+DICTIONARY_NAME = 'terms.dict'
+DOCUMENTS_NAME = 'documents.bin'
+POST_IDS_NAME = 'post_ids.txt'
+
+
+def read_manifest(index_root):
+    '''names of index segments in order they were built'''
+    manifest_path = os.path.join(index_root, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, 'r', encoding='UTF-8') as manifest_file:
+        return json.load(manifest_file)['segments']
+
+
+def write_manifest(index_root, segments):
+    '''atomically replaces list of index segments'''
+    manifest_path = os.path.join(index_root, MANIFEST_NAME)
+    temp_path = f'{manifest_path}.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as manifest_file:
+        json.dump({'segments': segments}, manifest_file)
+    os.replace(temp_path, manifest_path)
+
+
+def read_post_ids(segment_root):
+    '''post ids of segment documents in doc id order'''
+    with open(os.path.join(segment_root, POST_IDS_NAME), 'r', encoding='UTF-8') as ids_file:
+        return ids_file.read().split()
+
+
+class IndexSegment:
+    '''term dictionary, doc table and memory mapped postings of single segment'''
+
+    def __init__(self, root):
+        self.root = root
+
+        with open(os.path.join(root, TERMS_NAME), 'r', encoding='UTF-8') as terms_file:
+            self.terms = terms_file.read().split()
+        self.dictionary = np.fromfile(os.path.join(root, DICTIONARY_NAME), dtype=TERM_RECORD)
+        self.documents = np.fromfile(os.path.join(root, DOCUMENTS_NAME), dtype=DOCUMENT_RECORD)
+        self.post_ids = read_post_ids(root)
+
+        self._postings_map = None
+        postings_path = os.path.join(root, POSTINGS_NAME)
+        if os.path.getsize(postings_path) != 0:
+            with open(postings_path, 'rb') as postings_file:
+                self._postings_map = mmap.mmap(
+                    postings_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _position(self, term):
+        position = bisect.bisect_left(self.terms, term)
+        if position < len(self.terms) and self.terms[position] == term:
+            return position
+        return None
+
+    def doc_count(self, term):
+        '''number of segment documents with term'''
+        position = self._position(term)
+        return 0 if position is None else int(self.dictionary['doc_count'][position])
+
+    def encoded_postings(self, position):
+        '''compressed postings of term at dictionary position'''
+        offset = int(self.dictionary['offset'][position])
+        length = int(self.dictionary['length'][position])
+        return self._postings_map[offset:offset + length]
+
+    def postings(self, term):
+        '''array of (doc id, title tf, text tf) rows of term, None for unknown term'''
+        position = self._position(term)
+        if position is None:
+            return None
+        return decode_postings(self.encoded_postings(position))
+
+    def iter_terms(self):
+        '''yields (term, doc count, compressed postings) in term order'''
+        for position, term in enumerate(self.terms):
+            yield term, int(self.dictionary['doc_count'][position]), self.encoded_postings(position)
+
+    def close(self):
+        '''unmaps postings'''
+        if self._postings_map is not None:
+            self._postings_map.close()
+            self._postings_map = None
+
+
+class InvertedIndex:
+    '''all segments of index, doc ids of every next segment follow previous ones'''
+
+    def __init__(self, root):
+        self.root = root
+        self.segments = [
+            IndexSegment(os.path.join(root, name)) for name in read_manifest(root)
+        ]
+        self.bases = []
+        base = 0
+        for segment in self.segments:
+            self.bases.append(base)
+            base += len(segment)
+        self.documents_count = base
+
+    def __len__(self):
+        return self.documents_count
+
+    def doc_count(self, term):
+        '''number of indexed documents with term'''
+        return sum(segment.doc_count(term) for segment in self.segments)
+
+    def postings(self, term):
+        '''array of (doc id, title tf, text tf) rows of term across segments'''
+        parts = []
+        for base, segment in zip(self.bases, self.segments):
+            postings = segment.postings(term)
+            if postings is not None:
+                postings[:, 0] += np.uint64(base)
+                parts.append(postings)
+        if len(parts) == 0:
+            return np.zeros((0, 3), dtype='<u8')
+        return np.concatenate(parts)
+
+    def post_id(self, doc_id):
+        '''post id of document'''
+        segment_number = bisect.bisect_right(self.bases, doc_id) - 1
+        return self.segments[segment_number].post_ids[doc_id - self.bases[segment_number]]
+
+    def close(self):
+        '''unmaps postings of every segment'''
+        for segment in self.segments:
+            segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
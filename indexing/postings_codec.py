@@ -0,0 +1,90 @@
+'''delta and varint compression of postings lists'''
+
+import numpy as np
+
+
+# every posting is doc id, term frequency in title and in text
+POSTING_WIDTH = 3
+
+# lists shorter than that are encoded in plain python, numpy call overhead is bigger there
+SHORT_LIST_SIZE = 16
+
+
+def _encode_varints_short(values):
+    data = bytearray()
+    for value in values:
+        value = int(value)
+        while value >= 0x80:
+            data.append((value & 0x7f) | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def encode_varints(values):
+    '''encodes non negative integers as little endian base 128 varints'''
+    if len(values) < SHORT_LIST_SIZE:
+        return _encode_varints_short(values)
+
+    values = np.asarray(values, dtype='<u8')
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        sizes += rest != 0
+        rest >>= 7
+
+    starts = np.cumsum(sizes) - sizes
+    data = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for byte_number in range(int(sizes.max())):
+        has_byte = sizes > byte_number
+        chunk = (values[has_byte] >> np.uint64(7 * byte_number)) & np.uint64(0x7f)
+        is_continued = sizes[has_byte] > byte_number + 1
+        data[starts[has_byte] + byte_number] = chunk | (is_continued.astype(np.uint64) << np.uint64(7))
+    return data.tobytes()
+
+
+def decode_varints(data):
+    '''decodes varints from bytes-like object into uint64 array'''
+    data = np.frombuffer(data, dtype=np.uint8)
+    is_last = data < 0x80
+    if is_last.all():
+        return data.astype('<u8')
+
+    ends = np.flatnonzero(is_last)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    sizes = ends - starts + 1
+
+    values = (data[starts] & 0x7f).astype('<u8')
+    # most of values take one or two bytes, next bytes are gathered for fewer values
+    longer = np.flatnonzero(sizes > 1)
+    byte_number = 1
+    while len(longer) != 0:
+        chunk = (data[starts[longer] + byte_number] & 0x7f).astype('<u8')
+        values[longer] |= chunk << np.uint64(7 * byte_number)
+        byte_number += 1
+        longer = longer[sizes[longer] > byte_number]
+    return values
+
+
+def encode_postings(postings):
+    '''encodes postings sorted by doc id, given as flat list of doc id, title tf, text tf
+    triples or as array of such rows. doc ids are stored as gaps'''
+    if isinstance(postings, list) and len(postings) < SHORT_LIST_SIZE * POSTING_WIDTH:
+        values = list(postings)
+        for position in range(len(values) - POSTING_WIDTH, 0, -POSTING_WIDTH):
+            values[position] -= values[position - POSTING_WIDTH]
+        return _encode_varints_short(values)
+
+    postings = np.asarray(postings, dtype='<u8').reshape(-1, POSTING_WIDTH)
+    gaps = postings.copy()
+    gaps[1:, 0] = postings[1:, 0] - postings[:-1, 0]
+    return encode_varints(gaps.reshape(-1))
+
+
+def decode_postings(data):
+    '''decodes postings into array of (doc id, title tf, text tf) rows'''
+    postings = decode_varints(data).reshape(-1, POSTING_WIDTH)
+    postings[:, 0] = np.cumsum(postings[:, 0])
+    return postings
@@ -0,0 +1,165 @@
+'''ranked retrieval of posts with bm25 over inverted index'''
+
+import math
+import numpy as np
+
+from indexing.inverted_index import InvertedIndex
+from indexing.spimi import DOCUMENT_RECORD
+from parsing.text_cleaner import TextCleaner
+
+
+def load_queries(path):
+    '''reads queries from file, one query per line'''
+    with open(path, 'r', encoding='UTF-8') as queries_file:
+        return [line.strip() for line in queries_file if line.strip()]
+
+
+class QueryEngine:
+    '''scores posts with bm25 over title and text fields and finds top k of them.
+    field term frequencies are length normalized separately and summed with title_weight,
+    score_weight and comments_weight add log of post score and comments count as priors.
+    top k search uses maxscore pruning: lists of terms whose maximal contributions
+    together can't lift post over current k-th score are only used to finish
+    scoring of posts found in other lists'''
+
+    def __init__(
+        self,
+        index_root,
+        k1=1.2,
+        b=0.75,
+        title_weight=2.0,
+        score_weight=0.0,
+        comments_weight=0.0,
+    ):
+        self.index = InvertedIndex(index_root)
+        self.k1 = k1
+        self.title_weight = title_weight
+        self.cleaner = TextCleaner()
+
+        if len(self.index.segments) != 0:
+            documents = np.concatenate([segment.documents for segment in self.index.segments])
+        else:
+            documents = np.zeros(0, dtype=DOCUMENT_RECORD)
+
+        def length_norms(lengths):
+            lengths = lengths.astype(np.float64)
+            average = lengths.mean() if len(lengths) != 0 else 0.0
+            if average == 0:
+                return np.ones(len(lengths))
+            return 1 - b + b * lengths / average
+
+        self.title_norms = length_norms(documents['title_length'])
+        self.text_norms = length_norms(documents['text_length'])
+        self.priors = (
+            score_weight * np.log1p(np.maximum(documents['score'], 0))
+            + comments_weight * np.log1p(np.maximum(documents['comments_count'], 0))
+        )
+        self.max_prior = float(self.priors.max()) if len(self.priors) != 0 else 0.0
+
+    def close(self):
+        '''unmaps index postings'''
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def term_impacts(self, term):
+        '''sorted doc ids with term and bm25 contribution of term to each of them'''
+        postings = self.index.postings(term)
+        doc_ids = postings[:, 0].astype(np.int64)
+        if len(doc_ids) == 0:
+            return doc_ids, np.zeros(0)
+
+        documents_count = len(self.index)
+        idf = math.log(1 + (documents_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+        frequencies = (
+            self.title_weight * postings[:, 1] / self.title_norms[doc_ids]
+            + postings[:, 2] / self.text_norms[doc_ids]
+        )
+        return doc_ids, idf * frequencies * (self.k1 + 1) / (self.k1 + frequencies)
+
+    def query_terms(self, query: str):
+        '''distinct terms of query in order of their appearance'''
+        return list(dict.fromkeys(self.cleaner.tokenize(query)))
+
+    @staticmethod
+    def _score(candidates, lists):
+        scores = np.zeros(len(candidates))
+        for doc_ids, impacts in lists:
+            positions = np.searchsorted(doc_ids, candidates)
+            positions[positions == len(doc_ids)] = 0
+            found = doc_ids[positions] == candidates
+            scores[found] += impacts[positions[found]]
+        return scores
+
+    def _top(self, candidates, scores, k):
+        scores = scores + self.priors[candidates]
+        if len(candidates) > k:
+            # everything tied with k-th score stays, ties are broken by doc id below
+            kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+            is_top = scores >= kth_score
+            candidates = candidates[is_top]
+            scores = scores[is_top]
+        order = np.lexsort((candidates, -scores))[:k]
+        return candidates[order], scores[order]
+
+    def _search_terms(self, lists, k, prune=True):
+        lists = [(doc_ids, impacts) for doc_ids, impacts in lists if len(doc_ids) != 0]
+        if len(lists) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        # lists sorted by maximal contribution, the most contributing one goes last
+        lists.sort(key=lambda entry: float(entry[1].max()))
+        essential_from = 0
+        if prune:
+            doc_ids, impacts = lists[-1]
+            # posts of the most contributing term give first estimate of k-th score
+            top_ids, top_scores = self._top(doc_ids, self._score(doc_ids, lists), k)
+            if len(top_ids) == k:
+                threshold = top_scores[-1]
+                bound = self.max_prior
+                for doc_ids, impacts in lists:
+                    bound += float(impacts.max())
+                    if bound >= threshold:
+                        break
+                    essential_from += 1
+                if essential_from == len(lists) - 1:
+                    return top_ids, top_scores
+
+        candidates = lists[essential_from][0]
+        if essential_from < len(lists) - 1:
+            candidates = np.unique(np.concatenate([
+                doc_ids for doc_ids, _ in lists[essential_from:]
+            ]))
+        return self._top(candidates, self._score(candidates, lists), k)
+
+    def _results(self, doc_ids, scores):
+        return [
+            (self.index.post_id(int(doc_id)), float(score))
+            for doc_id, score in zip(doc_ids, scores)
+        ]
+
+    def search(self, query: str, k=10, prune=True):
+        '''top k (post id, score) pairs for query, best first'''
+        lists = [self.term_impacts(term) for term in self.query_terms(query)]
+        return self._results(*self._search_terms(lists, k, prune))
+
+    def search_batch(self, queries, k=10, prune=True, max_cached_terms=10000):
+        '''top k (post id, score) pairs for every query,
+        postings of term shared by queries are read and scored once
+        as long as no more than max_cached_terms terms are kept'''
+        impacts = {}
+        results = []
+        for query in queries:
+            lists = []
+            for term in self.query_terms(query):
+                if term not in impacts:
+                    if len(impacts) >= max_cached_terms:
+                        impacts = {}
+                    impacts[term] = self.term_impacts(term)
+                lists.append(impacts[term])
+            results.append(self._results(*self._search_terms(lists, k, prune)))
+        return results
@@ -0,0 +1,117 @@
+'''single pass in-memory inversion of documents into sorted on-disk blocks'''
+
+import mmap
+import os
+import numpy as np
+
+from indexing.postings_codec import POSTING_WIDTH, encode_postings, encode_varints
+from parsing.text_cleaner import TextCleaner
+
+
+DOCUMENT_RECORD = np.dtype([
+    ('title_length', '<u4'),
+    ('text_length', '<u4'),
+    ('score', '<i8'),
+    ('comments_count', '<i8'),
+])
+
+# rough size of python objects behind in-memory postings
+TERM_MEMORY = 200
+POSTING_MEMORY = 60
+
+TEXT_CLEANER = TextCleaner()
+
+
+def block_path(block_root, batch_number, part):
+    '''path of block written for part of documents batch'''
+    return os.path.join(block_root, f'block-{batch_number:06d}-{part:03d}.blk')
+
+
+def write_block(path, postings: dict):
+    '''writes postings of every term in term order,
+    every entry is term length, term, doc count, postings length and postings'''
+    with open(path, 'wb') as block_file:
+        for term in sorted(postings):
+            term_bytes = term.encode('UTF-8')
+            data = encode_postings(postings[term])
+            block_file.write(encode_varints([len(term_bytes)]))
+            block_file.write(term_bytes)
+            block_file.write(encode_varints([len(postings[term]) // POSTING_WIDTH, len(data)]))
+            block_file.write(data)
+
+
+def _read_varint(buffer, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def iter_block(path):
+    '''yields (term, doc count, compressed postings) of block in term order'''
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as block_file:
+        block_map = mmap.mmap(block_file.fileno(), 0, access=mmap.ACCESS_READ)
+    with block_map:
+        position = 0
+        while position < len(block_map):
+            term_length, position = _read_varint(block_map, position)
+            term = block_map[position:position + term_length].decode('UTF-8')
+            position += term_length
+            doc_count, position = _read_varint(block_map, position)
+            data_length, position = _read_varint(block_map, position)
+            yield term, doc_count, block_map[position:position + data_length]
+            position += data_length
+
+
+def invert_documents(task):
+    '''builds postings of documents batch in memory, flushing them to block
+    every time they grow over memory budget.
+    task is (batch number, documents, block root, memory budget),
+    every document is (doc id, title, cleaned text, score, comments count),
+    returns block paths and doc table rows of batch'''
+    batch_number, documents, block_root, memory_budget = task
+
+    block_paths = []
+    rows = np.zeros(len(documents), dtype=DOCUMENT_RECORD)
+    postings = {}
+    used_memory = 0
+
+    def flush():
+        path = block_path(block_root, batch_number, len(block_paths))
+        write_block(path, postings)
+        block_paths.append(path)
+
+    for position, (doc_id, title, text, score, comments_count) in enumerate(documents):
+        title_terms = TEXT_CLEANER.term_counts(title)
+        text_terms = TEXT_CLEANER.term_counts(text, is_cleaned=True)
+        rows[position] = (
+            sum(title_terms.values()),
+            sum(text_terms.values()),
+            score,
+            comments_count,
+        )
+
+        for term in title_terms.keys() | text_terms.keys():
+            term_postings = postings.get(term)
+            if term_postings is None:
+                term_postings = postings[term] = []
+                used_memory += TERM_MEMORY
+            term_postings += (doc_id, title_terms[term], text_terms[term])
+            used_memory += POSTING_MEMORY
+
+        if used_memory >= memory_budget:
+            flush()
+            postings = {}
+            used_memory = 0
+
+    if len(postings) != 0:
+        flush()
+
+    return block_paths, rows
@@ -0,0 +1,61 @@
+'''crawled pages migration script'''
+
+import argparse
+import os
+
+from tqdm import tqdm
+
+from util.helpers import get_filenames_batched
+from util.page_store import is_page_file, page_id_from_name, read_page_file
+from util.segment_store import SegmentStore, SegmentWriter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script for moving crawled html pages into packed segment files.',
+    )
+
+    parser.add_argument(
+        '--input_path',
+        type=str,
+        default=os.path.join('.', 'posts'),
+        help=('path where crawled pages stored'),
+    )
+
+    parser.add_argument(
+        '--save_path',
+        type=str,
+        default=os.path.join('.', 'segments'),
+        help=('path for storing segments'),
+    )
+
+    parser.add_argument(
+        '--segment_size_mb',
+        type=int,
+        default=1024,
+        help=('size of segment file after which next segment is started'),
+    )
+
+    args = parser.parse_args()
+
+    already_migrated = SegmentStore(args.save_path) \
+        if os.path.exists(args.save_path) else []
+
+    file_count = len([
+        name for name in os.listdir(args.input_path)
+        if is_page_file(name)
+    ])
+
+    writer = SegmentWriter(
+        args.save_path,
+        writer_id='migrated',
+        segment_size=args.segment_size_mb * 1024 * 1024,
+    )
+
+    with writer, tqdm(total=file_count, desc='Migrating posts') as bar:
+        for batch in get_filenames_batched(args.input_path):
+            for path in batch:
+                post_id = page_id_from_name(path)
+                if post_id not in already_migrated:
+                    writer.save(post_id, read_page_file(path))
+            bar.update(len(batch))
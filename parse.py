@@ -5,8 +5,12 @@ import os
 
 from tqdm import tqdm
 
-from parsing.data_extractor import extract_from_batch
-from util.helpers import get_filenames_batched
+from parsing.data_extractor import extract_records_from_batch, extract_records_from_segments
+from parsing.near_duplicates import DeduplicatingSink, NearDuplicateIndex
+from parsing.parse_manifest import ParseManifest
+from parsing.pipeline import extract_in_parallel, report_failures
+from parsing.post_sink import create_sink
+from util.segment_store import SegmentStore
 
 
 if __name__ == '__main__':
@@ -21,6 +25,14 @@ if __name__ == '__main__':
         help=('path where crawled pages stored'),
     )
 
+    parser.add_argument(
+        '--input_format',
+        choices=['files', 'segments'],
+        default='files',
+        help=('files reads html or gzipped html file per post, '
+              'segments reads packed segment files'),
+    )
+
     parser.add_argument(
         '--save_path',
         type=str,
@@ -28,20 +40,116 @@ if __name__ == '__main__':
         help=('path for storing parsed data'),
     )
 
+    parser.add_argument(
+        '--output_format',
+        choices=['json', 'jsonl'],
+        default='json',
+        help=('json writes pretty printed file per post, '
+              'jsonl appends compact records to rotating shards'),
+    )
+
+    parser.add_argument(
+        '--compression',
+        choices=['gzip', 'zstd'],
+        default=None,
+        help=('compression of jsonl shards, zstd requires zstandard package'),
+    )
+
+    parser.add_argument(
+        '--shard_size_mb',
+        type=int,
+        default=256,
+        help=('size of jsonl shard on disk after which next shard is started'),
+    )
+
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help=('number of parsing processes'),
+    )
+
+    parser.add_argument(
+        '--dedup',
+        choices=['flag', 'drop'],
+        default=None,
+        help=('flag marks near duplicates of already seen posts with duplicate_of field, '
+              'drop skips them'),
+    )
+
+    parser.add_argument(
+        '--dedup_path',
+        type=str,
+        default=os.path.join('.', 'near_duplicates.sqlite'),
+        help=('database of seen posts signatures used for near duplicates detection, '
+              'shared with crawler'),
+    )
+
+    parser.add_argument(
+        '--manifest_path',
+        type=str,
+        default=None,
+        help=('database of already parsed pages, only new and changed pages are parsed, '
+              'defaults to parse_manifest.sqlite in save_path'),
+    )
+
+    parser.add_argument(
+        '--reparse_all',
+        action='store_true',
+        help=('parses all pages even if manifest has them'),
+    )
+
+    parser.add_argument(
+        '--failures_path',
+        type=str,
+        default=os.path.join('.', 'parse_failures.log'),
+        help=('path for storing list of pages which failed to parse'),
+    )
+
     args = parser.parse_args()
 
+    os.makedirs(args.save_path, exist_ok=True)
+    manifest = ParseManifest(
+        args.manifest_path or os.path.join(args.save_path, 'parse_manifest.sqlite'))
+    if args.reparse_all:
+        manifest.reset()
+
     BATCH_SIZE = 10
-    batches = get_filenames_batched(args.input_path, batch_size=BATCH_SIZE)
-
-    file_count = len([
-        name for name in os.listdir(args.input_path)
-        if os.path.isfile(os.path.join(args.input_path, name))
-    ])
-
-    with tqdm(total=file_count, desc='Parsing posts info') as bar:
-        for batch in batches:
-            extract_from_batch(
-                posts_batch=batch,
-                cleaned_posts_root=args.save_path,
-            )
-            bar.update(BATCH_SIZE)
+    if args.input_format == 'segments':
+        store = SegmentStore(args.input_path)
+        manifest.scan_segments(store.entries())
+        store.close()
+        extract_batch = extract_records_from_segments
+    else:
+        manifest.scan_files(args.input_path)
+        extract_batch = extract_records_from_batch
+    file_count = manifest.pending_count()
+
+    sink = create_sink(
+        args.output_format,
+        root=args.save_path,
+        compression=args.compression,
+        shard_size=args.shard_size_mb * 1024 * 1024,
+    )
+    if args.dedup is not None:
+        sink = DeduplicatingSink(sink, NearDuplicateIndex(args.dedup_path), mode=args.dedup)
+
+    with manifest, sink, tqdm(total=file_count, desc='Parsing posts info') as bar:
+        failures = extract_in_parallel(
+            manifest.pending_batches(batch_size=BATCH_SIZE, on_unchanged=bar.update),
+            sink,
+            workers_count=args.workers,
+            on_progress=bar.update,
+            extract_batch=extract_batch,
+            on_batch_stored=manifest.complete_batch,
+        )
+
+    if args.dedup is not None:
+        sink.duplicates.close()
+        print(f'{sink.duplicates_count} near duplicates found')
+
+    if len(failures) != 0:
+        report_failures(failures, args.failures_path)
+        print(f'{len(failures)} pages failed to parse, '
+              f'see {args.failures_path} for details')
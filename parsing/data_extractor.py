@@ -2,21 +2,41 @@
 
 import os
 import re
-import json
 from bs4 import BeautifulSoup
+from parsel import Selector
+from parsing.post_sink import JsonFilesSink
+from parsing.text_cleaner import TextCleaner
+from util.page_store import decode_page_file, page_data_hash, read_page_file
+from util.segment_store import SegmentReader, decompress_page
+
+
+TITLE_SELECTOR = '#siteTable .thing .top-matter p.title a.title'
+TEXT_SELECTOR = '#siteTable .thing .entry .expando form .usertext-body .md'
+SCORE_SELECTOR = '#siteTable .unvoted .unvoted'
+TIME_SELECTOR = '#siteTable  .top-matter .tagline time'
+COMMENTS_SELECTOR = '#siteTable .thing .entry .buttons .first'
+AWARDS_SELECTOR = '#siteTable  .top-matter .tagline .awardings-bar .awarding-link'
+AWARD_ICON_SELECTOR = '.awarding-icon-container .awarding-icon'
+# every field is extracted from inside of it, comments and sidebar are outside
+FRAGMENT_SELECTOR = '#siteTable'
+
+# has to be changed with every change of extracted fields,
+# parse.py reparses pages extracted by other versions
+EXTRACTOR_VERSION = 1
+
+TEXT_CLEANER = TextCleaner()
 
 
 def parse_post_title(markup: str):
     '''parses post title from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
-    title_tag = soup.select_one(
-        '#siteTable .thing .top-matter p.title a.title')
+    title_tag = soup.select_one(TITLE_SELECTOR)
 
     title = ''
     if title_tag is not None:
         title_raw = title_tag.get_text()
         if title_raw is not None:
-            title = re.sub(r'[^\w\s]', '', title_raw)
+            title = TEXT_CLEANER.remove_punctuation(title_raw)
 
     return title
 
@@ -25,22 +45,15 @@ def parse_post_text(markup: str):
     '''parses and cleans up post content from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
 
-    url_pattern = r'''((?:(?<=[^a-zA-Z0-9])''' \
-        r'''(?:(?:https?\:\/\/){0,1}(?:[a-zA-Z0-9\%]{1,}\:[a-zA-Z0-9\%]{1,}[@]){,1})'''\
-        r'''(?:(?:\w{1,}\.{1}){1,5}(?:(?:[a-zA-Z]){1,})|'''\
-        r'''(?:[a-zA-Z]{1,}\/[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\:[0-9]{1,4}){1})){1}'''\
-        r'''(?:(?:(?:\/{0,1}(?:[a-zA-Z0-9\-\_\=\-]){1,})*)(?:[?][a-zA-Z0-9\=\%\&\_\-]{1,}){0,1})'''\
-        r'''(?:\.(?:[a-zA-Z0-9]){0,}){0,1})'''
     post_text = ''
 
-    post_tag = soup.select_one(
-        '#siteTable .thing .entry .expando form .usertext-body .md')
+    post_tag = soup.select_one(TEXT_SELECTOR)
     if post_tag is not None:
         # removing <a> tags with link texts
         link_tags = post_tag.find_all('a')
         for link in link_tags:
             link_text = link.get_text()
-            if re.search(url_pattern, link_text) is not None:
+            if TEXT_CLEANER.has_url(link_text):
                 link.decompose()
 
         # removing images
@@ -58,22 +71,20 @@ def parse_post_text(markup: str):
         for code in code_tags:
             code.decompose()
 
-        post_text = post_tag.get_text()
+        post_text = clean_post_text(post_tag.get_text())
 
-        # revoving links in main content text
-        post_text = re.sub(url_pattern, '', post_text)
+    return post_text
 
-        post_text = re.sub(r'[\-]', ' ', post_text)
-        post_text = re.sub(r'[^\w\s]', '', post_text)
-        post_text = re.sub(r'[\s]+', ' ', post_text)
 
-    return post_text.strip()
+def clean_post_text(post_text: str):
+    '''removes links, punctuation and extra whitespace from post text'''
+    return TEXT_CLEANER.clean(post_text)
 
 
 def parse_post_score(markup: str):
     '''parses voting score from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
-    score_tag = soup.select_one('#siteTable .unvoted .unvoted')
+    score_tag = soup.select_one(SCORE_SELECTOR)
 
     score = 0
     if score_tag is not None:
@@ -88,7 +99,7 @@ def parse_post_score(markup: str):
 def parse_submission_time_utc(markup: str):
     '''parses post submission date as utc string from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
-    time_tag = soup.select_one('#siteTable  .top-matter .tagline time')
+    time_tag = soup.select_one(TIME_SELECTOR)
 
     time = None
     if time_tag is not None:
@@ -100,7 +111,7 @@ def parse_submission_time_utc(markup: str):
 def parse_comments_count(markup: str):
     '''parses comments cout of the post from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
-    comments_tag = soup.select_one('#siteTable .thing .entry .buttons .first')
+    comments_tag = soup.select_one(COMMENTS_SELECTOR)
 
     comments_count = 0
     if comments_tag is not None:
@@ -115,57 +126,237 @@ def parse_comments_count(markup: str):
 def parse_awards(markup: str):
     '''parses award badges names of the post from html page'''
     soup = BeautifulSoup(markup, 'html.parser')
-    awards_tags = soup.select(
-        '#siteTable  .top-matter .tagline .awardings-bar .awarding-link')
-    award_name_pattern = re.compile(
-        r'([\w]+)[_][\d]+\.[a-z]+|([a-zA-Z0-9]+)\.[a-z]+')
+    awards_tags = soup.select(AWARDS_SELECTOR)
     awards = {}
     for award_tag in awards_tags:
         count = int(award_tag.get('data-count'))
-        image_tag = award_tag.select_one(
-            '.awarding-icon-container .awarding-icon')
+        image_tag = award_tag.select_one(AWARD_ICON_SELECTOR)
         award_name = ''
         if image_tag is not None:
-            image_link = image_tag.get('src').split('/')[-1]
-            groups = award_name_pattern.findall(image_link)[0]
-            for group in groups:
-                if len(group) > 0:
-                    award_name = group
-                    break
+            award_name = award_name_from_icon(image_tag.get('src'))
         awards[award_name] = count
     return awards
 
 
-def extract_post_data(post_path):
-    '''extracts data of main post content'''
-    with open(post_path, 'r', encoding='UTF-8') as post_file:
-        markup = post_file.read()
+def award_name_from_icon(icon_url: str):
+    '''gets award name from award icon url'''
+    award_name_pattern = re.compile(
+        r'([\w]+)[_][\d]+\.[a-z]+|([a-zA-Z0-9]+)\.[a-z]+')
+    image_link = icon_url.split('/')[-1]
+    groups = award_name_pattern.findall(image_link)[0]
+    for group in groups:
+        if len(group) > 0:
+            return group
+    return ''
+
+
+def _drop_element(element):
+    '''removes element from lxml tree keeping text which follows it'''
+    parent = element.getparent()
+    if parent is None:
+        return
+
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+    parent.remove(element)
+
+
+def _extract_title(selector: Selector):
+    title = ''
+    title_tag = selector.css(TITLE_SELECTOR)[:1]
+    if len(title_tag) != 0:
+        title = TEXT_CLEANER.remove_punctuation(
+            title_tag[0].root.xpath('string()'))
+    return title
+
 
-        return {
-            'title': parse_post_title(markup),
-            'text': parse_post_text(markup),
-            'score': parse_post_score(markup),
-            'submission_time': parse_submission_time_utc(markup),
-            'comments_count': parse_comments_count(markup),
-            'awards': parse_awards(markup),
-        }
+def _extract_raw_text(selector: Selector):
+    post_text = ''
+    post_tag = selector.css(TEXT_SELECTOR)[:1]
+    if len(post_tag) != 0:
+        root = post_tag[0].root
+
+        # removing <a> tags with link texts
+        for link in list(root.iter('a')):
+            if TEXT_CLEANER.has_url(link.xpath('string()')):
+                _drop_element(link)
 
+        # removing images, tables and code blocks
+        for tag in list(root.iter('img', 'table', 'code')):
+            _drop_element(tag)
+
+        post_text = root.xpath('string()')
+    return post_text
+
+
+def _extract_text(selector: Selector):
+    return clean_post_text(_extract_raw_text(selector))
+
+
+def extract_raw_post_text(markup: str):
+    '''gets post content from html page without links, images, tables and code
+    but before text cleaning'''
+    return _extract_raw_text(Selector(text=markup))
+
+
+def _extract_score(selector: Selector):
+    score = 0
+    score_tag = selector.css(SCORE_SELECTOR)[:1]
+    if len(score_tag) != 0:
+        try:
+            score = int(score_tag[0].root.xpath('string()'))
+        except Exception:
+            score = 0
+    return score
+
+
+def _extract_comments_count(selector: Selector):
+    comments_count = 0
+    comments_tag = selector.css(COMMENTS_SELECTOR)[:1]
+    if len(comments_tag) != 0:
+        comments_words = comments_tag[0].root.xpath('string()').split(' ')
+        if len(comments_words) == 2:
+            comments_count = int(comments_words[0])
+    return comments_count
+
+
+def _extract_awards(selector: Selector):
+    awards = {}
+    for award_tag in selector.css(AWARDS_SELECTOR):
+        count = int(award_tag.attrib.get('data-count'))
+        icon_url = award_tag.css(AWARD_ICON_SELECTOR).attrib.get('src')
+        award_name = ''
+        if icon_url is not None:
+            award_name = award_name_from_icon(icon_url)
+        awards[award_name] = count
+    return awards
+
+
+def could_be_long_post(markup: str, min_length: int):
+    '''cheaply checks whether post text may be at least min_length characters long.
+    text can't be longer than markup it is extracted from,
+    so markup of post body shorter than min_length means short post'''
+    site_table = markup.find('id="siteTable"')
+    if site_table == -1:
+        return True
+
+    body_start = markup.find('usertext-body', site_table)
+    if body_start == -1:
+        return False
+
+    body_end = markup.find('</form>', body_start)
+    if body_end == -1:
+        return True
+
+    return body_end - body_start >= min_length
+
+
+def page_fragment(selector: Selector):
+    '''minimal html page with #siteTable only cut out of parsed post page,
+    None if page has no #siteTable. every parse_* function gives the same result
+    for it as for the whole page'''
+    site_table = selector.css(FRAGMENT_SELECTOR)[:1].get()
+    if site_table is None:
+        return None
+    return f'<html><body>{site_table}</body></html>'
 
-def extract_from_batch(posts_batch, cleaned_posts_root=os.path.join('.', 'cleaned_posts')):
-    '''extracts data from batch of posts'''
-    if not os.path.exists(cleaned_posts_root):
-        os.makedirs(cleaned_posts_root)
 
+def extract_page_fragment(markup: str):
+    '''cuts post page down to minimal html page with #siteTable only'''
+    fragment = page_fragment(Selector(text=markup))
+    return markup if fragment is None else fragment
+
+
+def extract_fields(selector: Selector):
+    '''extracts all post fields from parsed page,
+    cuts links, images, tables and code out of its tree'''
+    title = _extract_title(selector)
+    score = _extract_score(selector)
+    submission_time = selector.css(TIME_SELECTOR).attrib.get('title')
+    comments_count = _extract_comments_count(selector)
+    awards = _extract_awards(selector)
+    # goes last because it cuts links, images, tables and code out of the tree
+    text = _extract_text(selector)
+
+    return {
+        'title': title,
+        'text': text,
+        'score': score,
+        'submission_time': submission_time,
+        'comments_count': comments_count,
+        'awards': awards,
+    }
+
+
+def extract_post_fields(markup: str):
+    '''parses html page once and extracts all post fields from it'''
+    return extract_fields(Selector(text=markup))
+
+
+def extract_post_data(post_path):
+    '''extracts data of main post content from plain or compressed page'''
+    return extract_post_fields(read_page_file(post_path))
+
+
+def post_id_from_path(path):
+    '''gets post id from crawled page filename'''
+    # matches both <post_id>.html and <post_id>.html.gz
     post_id_pattern = re.compile(r'([a-z0-9]+)\.html')
+    return post_id_pattern.findall(path)[0]
+
+
+def extract_records_from_batch(posts_batch):
+    '''extracts data from batch of posts,
+    returns records with post ids, paths which failed with errors
+    and hashes of read files by post id'''
+    records = []
+    failures = []
+    input_hashes = {}
 
     for path in posts_batch:
-        post_id = None
+        try:
+            with open(path, 'rb') as post_file:
+                data = post_file.read()
+            post_id = post_id_from_path(path)
+            input_hashes[post_id] = page_data_hash(data)
+            records.append({'id': post_id, **extract_post_fields(decode_page_file(path, data))})
+        except Exception as error:
+            failures.append((path, repr(error)))
+
+    return records, failures, input_hashes
+
+
+def extract_records_from_segments(entries_batch):
+    '''extracts data from batch of (post_id, segment path, offset, length) entries,
+    returns records with post ids, pages which failed with errors
+    and hashes of read pages by post id.
+    entries go in segment order, so every segment is opened once per batch'''
+    records = []
+    failures = []
+    input_hashes = {}
+
+    with SegmentReader() as reader:
+        for post_id, path, offset, length in entries_batch:
+            try:
+                data = reader.read(path, offset, length)
+                input_hashes[post_id] = page_data_hash(data)
+                records.append({'id': post_id, **extract_post_fields(decompress_page(data))})
+            except Exception as error:
+                failures.append((f'{path}:{offset} ({post_id})', repr(error)))
+
+    return records, failures, input_hashes
+
 
-        post_id = post_id_pattern.findall(path)[0]
+def extract_from_batch(posts_batch, cleaned_posts_root=os.path.join('.', 'cleaned_posts')):
+    '''extracts data from batch of posts, returns paths which failed with errors'''
+    records, failures, _ = extract_records_from_batch(posts_batch)
 
-        save_path = os.path.join(cleaned_posts_root, f'{post_id}.json')
-        parsed_post = extract_post_data(path)
+    with JsonFilesSink(cleaned_posts_root) as sink:
+        for record in records:
+            sink.write(record)
 
-        with open(save_path, 'w', encoding='UTF-8') as cleaned_post_file:
-            json.dump(parsed_post, cleaned_post_file,
-                      ensure_ascii=False, indent=4)
+    return failures
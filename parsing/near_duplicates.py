@@ -0,0 +1,236 @@
+'''near duplicate posts detection with minhash signatures and lsh persisted in sqlite'''
+
+import contextlib
+import os
+import sqlite3
+import zlib
+import numpy as np
+
+from parsing.text_cleaner import TextCleaner
+
+
+FLAG_DUPLICATES = 'flag'
+DROP_DUPLICATES = 'drop'
+
+# multiplier of splitmix64 finalizer and of shingle hash
+MIX_MULTIPLIER_1 = np.uint64(0xbf58476d1ce4e5b9)
+MIX_MULTIPLIER_2 = np.uint64(0x94d049bb133111eb)
+SHINGLE_MULTIPLIER = np.uint64(0x9e3779b97f4a7c15)
+
+SHINGLES_CHUNK_SIZE = 4096
+
+TEXT_CLEANER = TextCleaner()
+
+
+def _mix(values):
+    values = values ^ (values >> np.uint64(30))
+    values = values * MIX_MULTIPLIER_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * MIX_MULTIPLIER_2
+    return values ^ (values >> np.uint64(31))
+
+
+class NearDuplicateIndex:
+    '''finds posts whose texts share most of word shingles with already added ones.
+    texts are turned into minhash signatures of num_perm values, signatures are split
+    into bands and posts with the same band go to the same lsh bucket.
+    buckets and signatures are kept in sqlite database, so memory footprint doesn't
+    grow with number of posts and index survives between runs.
+    processes can share database, check and add of post is single transaction'''
+
+    def __init__(
+        self,
+        path=os.path.join('.', 'near_duplicates.sqlite'),
+        threshold=0.8,
+        num_perm=128,
+        bands=16,
+        shingle_size=5,
+        seed=0,
+        cache_mb=64,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError('num_perm has to be divisible by bands')
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        # odd multipliers keep multiply-add permutations bijective
+        self._multipliers = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * 2 + 1
+        self._increments = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_multipliers = rng.integers(
+            0, 2 ** 63, num_perm // bands, dtype=np.uint64) * 2 + 1
+
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(f'PRAGMA cache_size=-{cache_mb * 1024}')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS signatures (
+                post_id TEXT PRIMARY KEY,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                key INTEGER NOT NULL,
+                post_id TEXT NOT NULL,
+                PRIMARY KEY (key, post_id)
+            ) WITHOUT ROWID;
+        ''')
+        self._check_settings({
+            'num_perm': num_perm,
+            'bands': bands,
+            'shingle_size': shingle_size,
+            'seed': seed,
+        })
+
+    def _check_settings(self, settings):
+        with self._transaction():
+            stored = dict(self.connection.execute('SELECT name, value FROM settings'))
+            if len(stored) == 0:
+                self.connection.executemany(
+                    'INSERT INTO settings VALUES (?, ?)',
+                    [(name, str(value)) for name, value in settings.items()],
+                )
+        if len(stored) != 0 and stored != {name: str(value) for name, value in settings.items()}:
+            raise ValueError(f'near duplicates index was built with other settings: {stored}')
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # immediate transaction takes write lock at once, so other process
+        # can't add the same duplicate between check and insert
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def signature(self, text: str, is_cleaned=True):
+        '''minhash signature of text, None if text is shorter than single shingle'''
+        tokens = TEXT_CLEANER.tokenize(text, is_cleaned=is_cleaned)
+        if len(tokens) < self.shingle_size:
+            return None
+
+        token_hashes = np.fromiter(
+            (zlib.crc32(token.encode('UTF-8')) for token in tokens),
+            dtype=np.uint64,
+            count=len(tokens),
+        )
+        shingles_count = len(tokens) - self.shingle_size + 1
+        shingles = np.zeros(shingles_count, dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            shingles = shingles * SHINGLE_MULTIPLIER + token_hashes[offset:offset + shingles_count]
+        shingles = _mix(np.unique(shingles))
+
+        # every permutation is multiply-add of mixed shingle hash modulo 2 ** 64,
+        # shingles go in chunks to keep shingles x permutations matrix small
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(shingles), SHINGLES_CHUNK_SIZE):
+            chunk = shingles[start:start + SHINGLES_CHUNK_SIZE]
+            permuted = np.multiply.outer(chunk, self._multipliers) + self._increments
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature
+
+    def bucket_keys(self, signature):
+        '''lsh bucket of every band of signature'''
+        rows = signature.reshape(self.bands, -1)
+        keys = _mix(
+            (rows * self._band_multipliers).sum(axis=1) + np.arange(self.bands, dtype=np.uint64))
+        return keys.view(np.int64).tolist()
+
+    def _find(self, post_id, signature, keys):
+        placeholders = ', '.join('?' * len(keys))
+        candidates = self.connection.execute(
+            'SELECT signatures.post_id, signatures.signature FROM signatures '
+            'WHERE signatures.post_id IN '
+            f'(SELECT DISTINCT post_id FROM buckets WHERE key IN ({placeholders}))',
+            keys,
+        ).fetchall()
+
+        best_id = None
+        best_similarity = self.threshold
+        for candidate_id, candidate_signature in candidates:
+            if candidate_id == post_id:
+                continue
+            similarity = float(np.mean(
+                np.frombuffer(candidate_signature, dtype=np.uint64) == signature))
+            if similarity >= best_similarity:
+                best_id = candidate_id
+                best_similarity = similarity
+        return best_id
+
+    def find_duplicate(self, post_id: str, text: str, is_cleaned=True):
+        '''id of already added post which text is near duplicate of text or None'''
+        signature = self.signature(text, is_cleaned)
+        if signature is None:
+            return None
+        return self._find(post_id, signature, self.bucket_keys(signature))
+
+    def check_and_add(self, post_id: str, text: str, is_cleaned=True):
+        '''returns id of post which text is near duplicate of text,
+        otherwise adds post to index and returns None'''
+        signature = self.signature(text, is_cleaned)
+        if signature is None:
+            return None
+        keys = self.bucket_keys(signature)
+
+        with self._transaction():
+            duplicate_of = self._find(post_id, signature, keys)
+            if duplicate_of is None:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO signatures VALUES (?, ?)',
+                    (post_id, signature.tobytes()),
+                )
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO buckets VALUES (?, ?)',
+                    [(key, post_id) for key in keys],
+                )
+        return duplicate_of
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM signatures').fetchone()[0]
+
+    def close(self):
+        '''closes database'''
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class DeduplicatingSink:
+    '''passes records to sink, flagging near duplicates with duplicate_of field
+    or dropping them'''
+
+    def __init__(self, sink, duplicates: NearDuplicateIndex, mode=FLAG_DUPLICATES):
+        self.sink = sink
+        self.duplicates = duplicates
+        self.mode = mode
+        self.duplicates_count = 0
+
+    def write(self, record: dict):
+        '''checks post text against index before writing record'''
+        duplicate_of = self.duplicates.check_and_add(record['id'], record['text'])
+        if duplicate_of is not None:
+            self.duplicates_count += 1
+            if self.mode == DROP_DUPLICATES:
+                return
+            record = {**record, 'duplicate_of': duplicate_of}
+        self.sink.write(record)
+
+    def close(self):
+        '''closes wrapped sink'''
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,197 @@
+'''manifest of parsed inputs letting parsing skip pages which didn't change'''
+
+import os
+import sqlite3
+
+from parsing.data_extractor import EXTRACTOR_VERSION, post_id_from_path
+from util.page_store import is_page_file, page_data_hash
+
+
+SCAN_CHUNK_SIZE = 10000
+# sqlite limits number of query parameters
+COMPLETE_CHUNK_SIZE = 500
+
+
+def _ignore_unchanged(_):
+    pass
+
+
+def content_hash(path, offset=None, length=None):
+    '''hash of whole file or of its part'''
+    with open(path, 'rb') as input_file:
+        if offset is None:
+            data = input_file.read()
+        else:
+            input_file.seek(offset)
+            data = input_file.read(length)
+    return page_data_hash(data)
+
+
+class ParseManifest:
+    '''sqlite database of parsed inputs: post id, source (file name or segment and offset),
+    size, mtime, content hash and version of extractor which parsed it.
+    inputs are scanned into temporary table once per run and compared with manifest,
+    the ones which are new, changed or parsed by other extractor version are pending'''
+
+    def __init__(self, path, extractor_version=EXTRACTOR_VERSION):
+        self.extractor_version = str(extractor_version)
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS inputs (
+                post_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                extractor_version TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE scan (
+                post_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                path TEXT NOT NULL,
+                offset INTEGER,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE pending (
+                post_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                path TEXT NOT NULL,
+                offset INTEGER,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                known_hash TEXT
+            ) WITHOUT ROWID;
+        ''')
+
+    def _insert_scanned(self, rows):
+        insert = 'INSERT OR REPLACE INTO scan VALUES (?, ?, ?, ?, ?, ?)'
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == SCAN_CHUNK_SIZE:
+                self.connection.executemany(insert, chunk)
+                chunk = []
+        self.connection.executemany(insert, chunk)
+
+        self.connection.execute('DELETE FROM pending')
+        self.connection.execute('''
+            INSERT INTO pending
+            SELECT scan.post_id, scan.source, scan.path, scan.offset, scan.size, scan.mtime_ns,
+                CASE WHEN inputs.extractor_version = :version THEN inputs.hash END
+            FROM scan LEFT JOIN inputs ON inputs.post_id = scan.post_id
+            WHERE inputs.post_id IS NULL
+                OR inputs.extractor_version != :version
+                OR inputs.source != scan.source
+                OR inputs.size != scan.size
+                OR inputs.mtime_ns != scan.mtime_ns
+        ''', {'version': self.extractor_version})
+        self.connection.execute('DELETE FROM scan')
+
+    def scan_files(self, root):
+        '''compares plain and compressed html files of directory with manifest,
+        single directory pass'''
+        def rows():
+            for entry in os.scandir(root):
+                if is_page_file(entry.name):
+                    stat = entry.stat()
+                    yield (
+                        post_id_from_path(entry.name),
+                        entry.name,
+                        entry.path,
+                        None,
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    )
+
+        self.connection.execute('BEGIN')
+        self._insert_scanned(rows())
+        self.connection.execute('COMMIT')
+
+    def scan_segments(self, entries):
+        '''compares (post id, segment path, offset, length) entries with manifest,
+        segments are append only, so page is changed when its place is'''
+        def rows():
+            for post_id, path, offset, length in entries:
+                yield (
+                    post_id,
+                    f'{os.path.basename(path)}:{offset}',
+                    path,
+                    offset,
+                    length,
+                    0,
+                )
+
+        self.connection.execute('BEGIN')
+        self._insert_scanned(rows())
+        self.connection.execute('COMMIT')
+
+    def pending_count(self):
+        '''number of inputs found by last scan which may need parsing'''
+        return self.connection.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def pending_batches(self, batch_size=1000, on_unchanged=_ignore_unchanged):
+        '''yields pending inputs batch by batch in file and offset order,
+        as file paths or as (post id, segment path, offset, length) entries.
+        inputs which were only touched are recorded without parsing, on_unchanged
+        is called for each of them'''
+        rows = self.connection.cursor().execute(
+            'SELECT post_id, path, offset, size, known_hash FROM pending ORDER BY path, offset')
+
+        batch = []
+        for post_id, path, offset, size, known_hash in rows:
+            if known_hash is not None and content_hash(path, offset, size) == known_hash:
+                self.complete({post_id: known_hash})
+                on_unchanged(1)
+                continue
+            batch.append(path if offset is None else (post_id, path, offset, size))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) != 0:
+            yield batch
+
+    def complete(self, input_hashes: dict):
+        '''records pending inputs of posts as parsed by current extractor,
+        input_hashes maps post ids to hashes of inputs which were parsed'''
+        post_ids = list(input_hashes)
+        rows = []
+        for start in range(0, len(post_ids), COMPLETE_CHUNK_SIZE):
+            chunk = post_ids[start:start + COMPLETE_CHUNK_SIZE]
+            rows += self.connection.execute(
+                'SELECT post_id, source, size, mtime_ns FROM pending '
+                f'WHERE post_id IN ({", ".join("?" * len(chunk))})',
+                chunk,
+            ).fetchall()
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (post_id, source, size, mtime_ns, input_hashes[post_id], self.extractor_version)
+                for post_id, source, size, mtime_ns in rows
+            ],
+        )
+
+    def complete_batch(self, batch, records, input_hashes):
+        '''records inputs of batch which produced records, hashed by parsing workers'''
+        if len(records) != 0:
+            self.complete({record['id']: input_hashes[record['id']] for record in records})
+
+    def reset(self):
+        '''forgets all parsed inputs'''
+        self.connection.execute('DELETE FROM inputs')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM inputs').fetchone()[0]
+
+    def close(self):
+        '''closes database'''
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,87 @@
+'''running posts extraction over many batches in parallel'''
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from parsing.data_extractor import extract_records_from_batch
+
+
+def _ignore_progress(_):
+    pass
+
+
+def _ignore_batch(*_):
+    pass
+
+
+def _store_batch(batch, records, batch_failures, input_hashes, sink, failures, on_batch_stored):
+    for record in records:
+        sink.write(record)
+    failures.extend(batch_failures)
+    on_batch_stored(batch, records, input_hashes)
+
+
+def _collect_batch(future, batch, sink, failures, on_batch_stored):
+    try:
+        records, batch_failures, input_hashes = future.result()
+    except Exception as error:
+        # whole batch is lost when worker process dies
+        failures.extend((path, repr(error)) for path in batch)
+    else:
+        _store_batch(
+            batch, records, batch_failures, input_hashes, sink, failures, on_batch_stored)
+
+
+def extract_in_parallel(
+    batches,
+    sink,
+    workers_count=1,
+    max_batches_in_flight=None,
+    on_progress=_ignore_progress,
+    extract_batch=extract_records_from_batch,
+    on_batch_stored=_ignore_batch,
+):
+    '''extracts data from batches of posts in pool of processes and writes it to sink.
+    extract_batch turns batch into records, failures and hashes of inputs by post id,
+    on_progress is called with number of processed files,
+    on_batch_stored is called with batch, its records and hashes of inputs
+    after records are written,
+    returns list of paths which failed with errors'''
+    failures = []
+
+    if workers_count <= 1:
+        for batch in batches:
+            _store_batch(batch, *extract_batch(batch), sink, failures, on_batch_stored)
+            on_progress(len(batch))
+        return failures
+
+    if max_batches_in_flight is None:
+        max_batches_in_flight = workers_count * 4
+
+    with ProcessPoolExecutor(max_workers=workers_count) as pool:
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                batch = in_flight.pop(future)
+                _collect_batch(future, batch, sink, failures, on_batch_stored)
+                on_progress(len(batch))
+
+        for batch in batches:
+            if len(in_flight) >= max_batches_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = pool.submit(extract_batch, batch)
+            in_flight[future] = batch
+
+        while len(in_flight) != 0:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    return failures
+
+
+def report_failures(failures, report_path):
+    '''writes failed paths with errors to report file'''
+    with open(report_path, 'w', encoding='UTF-8') as report_file:
+        for path, error in failures:
+            report_file.write(f'{path}\t{error}\n')
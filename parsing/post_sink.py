@@ -0,0 +1,258 @@
+'''storing extracted posts data'''
+
+import gzip
+import io
+import json
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP_COMPRESSION = 'gzip'
+ZSTD_COMPRESSION = 'zstd'
+
+# prefix of shards with changed fields of records of other shards
+PATCH_PREFIX = 'patch'
+
+SHARD_EXTENSIONS = {
+    None: '.jsonl',
+    GZIP_COMPRESSION: '.jsonl.gz',
+    ZSTD_COMPRESSION: '.jsonl.zst',
+}
+
+
+class JsonFilesSink:
+    '''writes every post to its own pretty printed json file'''
+
+    def __init__(self, root=os.path.join('.', 'cleaned_posts')):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, record: dict):
+        '''saves post record, post id is used as filename'''
+        post = dict(record)
+        post_id = post.pop('id')
+        save_path = os.path.join(self.root, f'{post_id}.json')
+        with open(save_path, 'w', encoding='UTF-8') as cleaned_post_file:
+            json.dump(post, cleaned_post_file, ensure_ascii=False, indent=4)
+
+    def close(self):
+        '''nothing to flush, every file is closed after write'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class JsonlShardSink:
+    '''appends compact post records to rotating, optionally compressed jsonl shards.
+    shards are append only, record written again for the same post doesn't replace
+    the earlier one, iter_records yields only the latest of them'''
+
+    def __init__(
+        self,
+        root=os.path.join('.', 'cleaned_posts'),
+        prefix='posts',
+        shard_size=256 * 1024 * 1024,
+        compression=None,
+        buffer_size=1024 * 1024,
+    ):
+        if compression not in SHARD_EXTENSIONS:
+            raise ValueError(f'unknown compression: {compression}')
+        if compression == ZSTD_COMPRESSION and zstandard is None:
+            raise ValueError('zstd compression requires zstandard package')
+
+        self.root = root
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.compression = compression
+        self.buffer_size = buffer_size
+
+        self._file = None
+        self._stream = None
+
+        os.makedirs(root, exist_ok=True)
+        self.shard_index = self._find_last_shard_index()
+
+    def _shard_path(self, index):
+        extension = SHARD_EXTENSIONS[self.compression]
+        return os.path.join(self.root, f'{self.prefix}-{index:05d}{extension}')
+
+    def _find_last_shard_index(self):
+        extension = re.escape(SHARD_EXTENSIONS[self.compression])
+        shard_pattern = re.compile(
+            rf'{re.escape(self.prefix)}-(\d+){extension}$')
+        indexes = [
+            int(match.group(1)) for match in
+            (shard_pattern.match(name) for name in os.listdir(self.root))
+            if match is not None
+        ]
+        return max(indexes, default=0)
+
+    def _open_shard(self):
+        # appending to a shard left from previous run adds new gzip member or zstd frame
+        self._file = open(self._shard_path(self.shard_index),
+                          'ab', buffering=self.buffer_size)
+        if self.compression == GZIP_COMPRESSION:
+            self._stream = gzip.GzipFile(
+                fileobj=self._file, mode='ab', compresslevel=6)
+        elif self.compression == ZSTD_COMPRESSION:
+            self._stream = zstandard.ZstdCompressor().stream_writer(
+                self._file, closefd=False)
+        else:
+            self._stream = self._file
+
+    def _close_shard(self):
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.close()
+        self._file = None
+        self._stream = None
+
+    def write(self, record: dict):
+        '''appends post record to current shard, rolls shard over when it is full'''
+        if self._file is None:
+            self._open_shard()
+            if 0 < self.shard_size <= self._file.tell():
+                self._close_shard()
+                self.shard_index += 1
+                self._open_shard()
+
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        self._stream.write(f'{line}\n'.encode('UTF-8'))
+
+        if self._file.tell() >= self.shard_size:
+            self._close_shard()
+            self.shard_index += 1
+
+    def close(self):
+        '''flushes buffered records'''
+        if self._file is not None:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def create_sink(
+    output_format,
+    root=os.path.join('.', 'cleaned_posts'),
+    compression=None,
+    shard_size=256 * 1024 * 1024,
+):
+    '''creates sink for "json" (file per post) or "jsonl" (shards) output format'''
+    if output_format == 'json':
+        return JsonFilesSink(root)
+    if output_format == 'jsonl':
+        return JsonlShardSink(root, shard_size=shard_size, compression=compression)
+    raise ValueError(f'unknown output format: {output_format}')
+
+
+def _open_shard_for_reading(path):
+    if path.endswith(SHARD_EXTENSIONS[GZIP_COMPRESSION]):
+        return gzip.open(path, 'rt', encoding='UTF-8')
+    if path.endswith(SHARD_EXTENSIONS[ZSTD_COMPRESSION]):
+        if zstandard is None:
+            raise ValueError('zstd compression requires zstandard package')
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(stream, encoding='UTF-8')
+    return open(path, 'r', encoding='UTF-8')
+
+
+def _is_shard(name):
+    return any(name.endswith(extension) for extension in SHARD_EXTENSIONS.values())
+
+
+def _is_patch_shard(name):
+    return name.startswith(f'{PATCH_PREFIX}-') and _is_shard(name)
+
+
+def _iter_shard(path):
+    with _open_shard_for_reading(path) as shard_file:
+        for line in shard_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_patches(root=os.path.join('.', 'cleaned_posts')):
+    '''fields of records changed after they were saved to shards, by post id.
+    later patches of the same post override earlier ones'''
+    patches = {}
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if _is_patch_shard(entry.name):
+            for patch in _iter_shard(entry.path):
+                patches.setdefault(patch.pop('id'), {}).update(patch)
+    return patches
+
+
+def _iter_saved(root):
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if entry.name.endswith('.json'):
+            with open(entry.path, 'r', encoding='UTF-8') as post_file:
+                yield {'id': entry.name[:-len('.json')], **json.load(post_file)}
+        elif _is_shard(entry.name) and not _is_patch_shard(entry.name):
+            yield from _iter_shard(entry.path)
+
+
+def iter_records(root=os.path.join('.', 'cleaned_posts')):
+    '''yields post records from json files and jsonl shards stored in directory,
+    records of shards come with their patches applied.
+    post saved several times, e.g. when its changed page was parsed again, is yielded once:
+    the last record wins, files are read in name order and shards line by line'''
+    patches = load_patches(root)
+    # first pass finds position of the last record of every post
+    last_positions = {}
+    for position, record in enumerate(_iter_saved(root)):
+        last_positions[record['id']] = position
+
+    for position, record in enumerate(_iter_saved(root)):
+        if last_positions[record['id']] != position:
+            continue
+        if record['id'] in patches:
+            record.update(patches[record['id']])
+        yield record
+
+
+class RecordPatcher:
+    '''updates fields of saved records without rewriting shards.
+    json file of post is rewritten in place, records of shards get
+    patch appended to patch shards which iter_records applies'''
+
+    def __init__(self, root=os.path.join('.', 'cleaned_posts')):
+        self.root = root
+        self.patches = JsonlShardSink(root, prefix=PATCH_PREFIX)
+
+    def patch(self, post_id: str, fields: dict):
+        '''sets fields of saved record of post'''
+        post_path = os.path.join(self.root, f'{post_id}.json')
+        if not os.path.exists(post_path):
+            self.patches.write({'id': post_id, **fields})
+            return
+
+        with open(post_path, 'r', encoding='UTF-8') as post_file:
+            post = json.load(post_file)
+        post.update(fields)
+        temp_path = f'{post_path}.tmp'
+        with open(temp_path, 'w', encoding='UTF-8') as post_file:
+            json.dump(post, post_file, ensure_ascii=False, indent=4)
+        os.replace(temp_path, post_path)
+
+    def close(self):
+        '''flushes patch shard'''
+        self.patches.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
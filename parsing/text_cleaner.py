@@ -0,0 +1,72 @@
+'''compiled text normalization shared by extraction and indexing'''
+
+import re
+from collections import Counter
+
+
+URL_PATTERN = r'''((?:(?<=[^a-zA-Z0-9])''' \
+    r'''(?:(?:https?\:\/\/){0,1}(?:[a-zA-Z0-9\%]{1,}\:[a-zA-Z0-9\%]{1,}[@]){,1})'''\
+    r'''(?:(?:\w{1,}\.{1}){1,5}(?:(?:[a-zA-Z]){1,})|'''\
+    r'''(?:[a-zA-Z]{1,}\/[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\:[0-9]{1,4}){1})){1}'''\
+    r'''(?:(?:(?:\/{0,1}(?:[a-zA-Z0-9\-\_\=\-]){1,})*)(?:[?][a-zA-Z0-9\=\%\&\_\-]{1,}){0,1})'''\
+    r'''(?:\.(?:[a-zA-Z0-9]){0,}){0,1})'''
+
+# every link match contains word character, dot and alphanumeric character in a row
+# and never contains whitespace, so link pattern runs only on such space separated tokens
+URL_CANDIDATE_PATTERN = r'(?<!\S)\S*\w\.[a-zA-Z0-9]\S*'
+PUNCTUATION_PATTERN = r'[^\w\s]+'
+
+
+class TextCleaner:
+    '''removes links, punctuation and extra whitespace from texts.
+    output is the same as of sequential substitutions
+    links -> dashes to spaces -> punctuation -> whitespace runs to single space,
+    but patterns are compiled once, link pattern is applied to candidate tokens only
+    and whitespace is collapsed without regex'''
+
+    def __init__(self):
+        self.url_regex = re.compile(URL_PATTERN)
+        self.url_candidate_regex = re.compile(URL_CANDIDATE_PATTERN)
+        self.punctuation_regex = re.compile(PUNCTUATION_PATTERN)
+
+    def _remove_urls_from_token(self, match):
+        token = match.group()
+        if match.start() == 0:
+            return self.url_regex.sub('', token)
+        # link pattern looks behind token, in text there is whitespace before it
+        return self.url_regex.sub('', f' {token}')[1:]
+
+    def has_url(self, text: str):
+        '''checks if text contains link'''
+        return self.url_regex.search(text) is not None
+
+    def remove_punctuation(self, text: str):
+        '''removes everything except word characters and whitespace'''
+        return self.punctuation_regex.sub('', text)
+
+    def remove_urls(self, text: str):
+        '''removes links from text'''
+        return self.url_candidate_regex.sub(self._remove_urls_from_token, text)
+
+    def clean(self, text: str):
+        '''removes links, punctuation and extra whitespace from text'''
+        text = self.remove_urls(text)
+        text = self.punctuation_regex.sub('', text.replace('-', ' '))
+        return ' '.join(text.split())
+
+    def clean_batch(self, texts):
+        '''cleans every text of iterable, returns list'''
+        clean = self.clean
+        return [clean(text) for text in texts]
+
+    def tokenize(self, text: str, lowercase=True, is_cleaned=False):
+        '''splits text into terms, text is cleaned first unless is_cleaned is set'''
+        if not is_cleaned:
+            text = self.clean(text)
+        if lowercase:
+            text = text.lower()
+        return text.split()
+
+    def term_counts(self, text: str, lowercase=True, is_cleaned=False):
+        '''counts occurrences of every term of text'''
+        return Counter(self.tokenize(text, lowercase, is_cleaned))
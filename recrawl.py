@@ -0,0 +1,101 @@
+'''saved posts metadata refreshing script'''
+
+import argparse
+import os
+
+from tqdm import tqdm
+
+from crawling.recrawler import DAY, HOUR, Recrawler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=('Script for refreshing score, comments count and awards of parsed posts. '
+                     'Posts are rechecked through by_id listings of 100 posts, '
+                     'young and often changing posts more often than old ones.'),
+    )
+
+    parser.add_argument(
+        '--records_path',
+        type=str,
+        default=os.path.join('.', 'cleaned_posts'),
+        help=('path where parsed posts are stored, json files are patched in place, '
+              'changes of jsonl shards records go to patch-*.jsonl shards'),
+    )
+
+    parser.add_argument(
+        '--state_path',
+        type=str,
+        default=None,
+        help=('database of recrawl schedule, defaults to recrawl.sqlite in --records_path'),
+    )
+
+    parser.add_argument(
+        '--max_requests',
+        type=int,
+        default=1000,
+        help=('max number of listing requests in this run, every request checks up to 100 posts'),
+    )
+
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        type=int,
+        default=16,
+        help=('number of requests in flight'),
+    )
+
+    parser.add_argument(
+        '--age_factor',
+        type=float,
+        default=0.25,
+        help=('share of post age after which post is rechecked, '
+              'doubled for every check which found no changes'),
+    )
+
+    parser.add_argument(
+        '--min_interval_hours',
+        type=float,
+        default=1.0,
+        help=('min hours between checks of the same post'),
+    )
+
+    parser.add_argument(
+        '--max_interval_days',
+        type=float,
+        default=30.0,
+        help=('max days between checks of the same post'),
+    )
+
+    parser.add_argument(
+        '--archive_days',
+        type=float,
+        default=180.0,
+        help=('age in days after which post is archived by reddit and is not checked anymore'),
+    )
+
+    args = parser.parse_args()
+
+    assert args.max_requests > 0 and args.concurrency > 0
+
+    with Recrawler(
+        args.records_path,
+        state_path=args.state_path,
+        age_factor=args.age_factor,
+        min_interval=args.min_interval_hours * HOUR,
+        max_interval=args.max_interval_days * DAY,
+        archive_age=args.archive_days * DAY,
+    ) as recrawler:
+        added = recrawler.add_new_posts()
+        print(f'{added} new posts scheduled')
+
+        total = min(recrawler.due_count(), args.max_requests)
+        with tqdm(total=total, desc='Refreshing posts') as bar:
+            stats = recrawler.refresh(
+                max_requests=args.max_requests,
+                concurrency=args.concurrency,
+                on_group=lambda _: bar.update(),
+            )
+
+    print(f'{stats["checked"]} listings checked, {stats["not_modified"]} not modified, '
+          f'{stats["failed"]} failed, {stats["patched"]} posts patched')
@@ -0,0 +1,84 @@
+'''ranked posts search script'''
+
+import argparse
+import os
+import sys
+
+from indexing.query_engine import QueryEngine, load_queries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=('Script for searching indexed posts ranked by BM25. '
+                     'Queries are taken from --query params, --queries_path file or stdin.'),
+    )
+
+    parser.add_argument(
+        '--index_path',
+        type=str,
+        default=os.path.join('.', 'index'),
+        help=('path where index is stored'),
+    )
+
+    parser.add_argument(
+        '-q',
+        '--query',
+        type=str,
+        action='append',
+        help=('search query, can be given several times'),
+    )
+
+    parser.add_argument(
+        '--queries_path',
+        type=str,
+        help=('file with one search query per line'),
+    )
+
+    parser.add_argument(
+        '-k',
+        '--top',
+        type=int,
+        default=10,
+        help=('number of posts found for every query'),
+    )
+
+    parser.add_argument(
+        '--title_weight',
+        type=float,
+        default=2.0,
+        help=('weight of term occurrences in post title relative to post text'),
+    )
+
+    parser.add_argument(
+        '--score_weight',
+        type=float,
+        default=0.0,
+        help=('weight of log of post score added to relevance'),
+    )
+
+    parser.add_argument(
+        '--comments_weight',
+        type=float,
+        default=0.0,
+        help=('weight of log of post comments count added to relevance'),
+    )
+
+    args = parser.parse_args()
+
+    if args.query is not None:
+        queries = args.query
+    elif args.queries_path is not None:
+        queries = load_queries(args.queries_path)
+    else:
+        queries = [line.strip() for line in sys.stdin if line.strip()]
+
+    with QueryEngine(
+        args.index_path,
+        title_weight=args.title_weight,
+        score_weight=args.score_weight,
+        comments_weight=args.comments_weight,
+    ) as engine:
+        for query, results in zip(queries, engine.search_batch(queries, args.top)):
+            print(query)
+            for rank, (post_id, score) in enumerate(results, start=1):
+                print(f'{rank:>4}. {post_id}\t{score:.4f}')
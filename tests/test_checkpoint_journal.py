@@ -0,0 +1,58 @@
+import os
+
+from crawling.checkpoint_journal import CheckpointJournal, JournalWriter, ProgressWatermark
+
+
+def test_watermark_waits_for_gaps():
+    watermark = ProgressWatermark(10)
+    watermark.complete(9)
+    assert watermark.next_number == 10
+    watermark.complete(10)
+    assert watermark.next_number == 8
+
+
+def test_remaining_ranges(tmp_path):
+    path = os.path.join(tmp_path, 'crawl.journal')
+    journal = CheckpointJournal(path)
+    journal.begin(100)
+    writer = JournalWriter(path)
+    writer.record_done(100, 90)
+    writer.record_progress(70, 50, 60)
+    writer.record_progress(70, 50, 65)
+    writer.record_failed(40)
+
+    journal = CheckpointJournal(path)
+    assert journal.top == 100
+    assert journal.remaining_ranges(100, 0) == [(90, 70), (60, 40), (39, 0)]
+    assert journal.remaining_ranges(55, 45) == [(55, 45)]
+    assert journal.crawled_count() == 10 + 10 + 1
+
+
+def test_cut_last_line_is_ignored(tmp_path):
+    path = os.path.join(tmp_path, 'crawl.journal')
+    with open(path, 'w', encoding='UTF-8') as journal_file:
+        journal_file.write('range 100\ndone 100 90\ndone 90')
+    journal = CheckpointJournal(path)
+    assert journal.remaining_ranges(100, 0) == [(90, 0)]
+
+
+def test_compact_keeps_remaining_ranges(tmp_path):
+    path = os.path.join(tmp_path, 'crawl.journal')
+    journal = CheckpointJournal(path)
+    journal.begin(100)
+    journal.record_done(100, 90)
+    journal.record_done(90, 80)
+    journal.record_progress(50, 0, 30)
+    journal.record_failed(60)
+    journal = CheckpointJournal(path)
+    remaining = journal.remaining_ranges(100, 0)
+
+    journal.compact()
+    assert journal.remaining_ranges(100, 0) == remaining
+    with open(path, 'r', encoding='UTF-8') as journal_file:
+        lines = journal_file.read().splitlines()
+    assert lines == ['range 100', 'done 50 30', 'done 60 59', 'done 100 80', 'failed 60']
+
+    reloaded = CheckpointJournal(path)
+    assert reloaded.remaining_ranges(100, 0) == remaining
+    assert reloaded.failed == {60}
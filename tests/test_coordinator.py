@@ -0,0 +1,66 @@
+import logging
+import os
+
+from crawling.checkpoint_journal import CheckpointJournal
+from crawling.coordinator import LeaseCoordinator
+
+
+def _coordinator(tmp_path, top=100, end=0, **kwargs):
+    journal = CheckpointJournal(os.path.join(tmp_path, 'coordinator.journal'))
+    journal.begin(top)
+    return LeaseCoordinator(journal, end, logger=logging.getLogger('test'), **kwargs)
+
+
+def test_leases_cover_range(tmp_path):
+    coordinator = _coordinator(tmp_path, batch_size=40)
+    leases = [coordinator.lease('node', now=0) for _ in range(3)]
+    assert [(lease['start'], lease['end']) for lease in leases] == [(100, 60), (60, 20), (20, 0)]
+    assert coordinator.lease('node', now=0) is None
+
+    for lease in leases:
+        assert coordinator.complete(lease['lease'], lease['end'])
+    assert coordinator.is_done()
+    assert CheckpointJournal(coordinator.journal.path).remaining_ranges(100, 0) == []
+
+
+def test_expired_lease_is_given_out_from_its_progress(tmp_path):
+    coordinator = _coordinator(tmp_path, batch_size=100, lease_ttl=10.0)
+    lease = coordinator.lease('first', now=0)
+    assert coordinator.heartbeat(lease['lease'], 70, now=5)
+    assert coordinator.lease('second', now=14) is None
+
+    released = coordinator.lease('second', now=16)
+    assert (released['start'], released['end']) == (70, 0)
+    assert not coordinator.heartbeat(lease['lease'], 60, now=16)
+    assert not coordinator.complete(lease['lease'], 0)
+    assert CheckpointJournal(coordinator.journal.path).remaining_ranges(100, 0) == [(70, 0)]
+
+
+def test_unfinished_lease_is_given_out_again(tmp_path):
+    coordinator = _coordinator(tmp_path, batch_size=100)
+    lease = coordinator.lease('node', now=0)
+    assert coordinator.complete(lease['lease'], 50)
+    assert coordinator.stats()['remaining'] == 50
+
+    lease = coordinator.lease('node', now=0)
+    assert (lease['start'], lease['end']) == (50, 0)
+
+
+def test_post_failing_every_attempt_is_given_up(tmp_path):
+    coordinator = _coordinator(tmp_path, batch_size=100, max_attempts=3)
+    starts = []
+    for _ in range(3):
+        lease = coordinator.lease('node', now=0)
+        starts.append(lease['start'])
+        coordinator.complete(lease['lease'], 50)
+    assert starts == [100, 50, 50]
+
+    lease = coordinator.lease('node', now=0)
+    assert (lease['start'], lease['end']) == (49, 0)
+    coordinator.complete(lease['lease'], 0)
+    assert coordinator.is_done()
+    assert coordinator.stats()['failed'] == 1
+
+    journal = CheckpointJournal(coordinator.journal.path)
+    assert journal.failed == {50}
+    assert journal.remaining_ranges(100, 0) == []
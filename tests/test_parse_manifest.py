@@ -0,0 +1,90 @@
+import os
+
+from parsing.parse_manifest import ParseManifest, content_hash
+
+
+def _write_page(root, post_id, markup, mtime_ns=None):
+    path = os.path.join(root, f'{post_id}.html')
+    with open(path, 'w', encoding='UTF-8') as page_file:
+        page_file.write(markup)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def _pending(manifest, root):
+    manifest.scan_files(root)
+    unchanged = []
+    paths = [
+        path for batch in manifest.pending_batches(2, on_unchanged=unchanged.append)
+        for path in batch
+    ]
+    return sorted(os.path.basename(path) for path in paths), len(unchanged)
+
+
+def _complete(manifest, root):
+    manifest.scan_files(root)
+    for batch in manifest.pending_batches():
+        manifest.complete({
+            os.path.basename(path).split('.')[0]: content_hash(path) for path in batch
+        })
+
+
+def test_only_new_and_changed_pages_are_pending(tmp_path):
+    pages_root = os.path.join(tmp_path, 'posts')
+    os.makedirs(pages_root)
+    for post_id in ('a1', 'b2', 'c3'):
+        _write_page(pages_root, post_id, f'<p>{post_id}</p>', mtime_ns=10 ** 18)
+
+    with ParseManifest(os.path.join(tmp_path, 'manifest.sqlite')) as manifest:
+        assert _pending(manifest, pages_root) == (['a1.html', 'b2.html', 'c3.html'], 0)
+        _complete(manifest, pages_root)
+        assert len(manifest) == 3
+        assert _pending(manifest, pages_root) == ([], 0)
+
+        _write_page(pages_root, 'b2', '<p>b2 edited</p>', mtime_ns=2 * 10 ** 18)
+        _write_page(pages_root, 'd4', '<p>d4</p>')
+        assert _pending(manifest, pages_root) == (['b2.html', 'd4.html'], 0)
+
+
+def test_touched_page_is_recorded_without_parsing(tmp_path):
+    pages_root = os.path.join(tmp_path, 'posts')
+    os.makedirs(pages_root)
+    _write_page(pages_root, 'a1', '<p>a1</p>', mtime_ns=10 ** 18)
+
+    with ParseManifest(os.path.join(tmp_path, 'manifest.sqlite')) as manifest:
+        _complete(manifest, pages_root)
+        _write_page(pages_root, 'a1', '<p>a1</p>', mtime_ns=2 * 10 ** 18)
+        assert _pending(manifest, pages_root) == ([], 1)
+        assert _pending(manifest, pages_root) == ([], 0)
+
+
+def test_new_extractor_version_reparses_everything(tmp_path):
+    pages_root = os.path.join(tmp_path, 'posts')
+    os.makedirs(pages_root)
+    _write_page(pages_root, 'a1', '<p>a1</p>')
+    manifest_path = os.path.join(tmp_path, 'manifest.sqlite')
+
+    with ParseManifest(manifest_path, extractor_version=1) as manifest:
+        _complete(manifest, pages_root)
+    with ParseManifest(manifest_path, extractor_version=1) as manifest:
+        assert _pending(manifest, pages_root) == ([], 0)
+    with ParseManifest(manifest_path, extractor_version=2) as manifest:
+        assert _pending(manifest, pages_root) == (['a1.html'], 0)
+
+
+def test_moved_segment_page_is_pending(tmp_path):
+    segment_path = os.path.join(tmp_path, 'segment-00000.seg')
+    with open(segment_path, 'wb') as segment_file:
+        segment_file.write(b'first page' + b'second page')
+
+    with ParseManifest(os.path.join(tmp_path, 'manifest.sqlite')) as manifest:
+        manifest.scan_segments([('a1', segment_path, 0, 10)])
+        batches = list(manifest.pending_batches())
+        assert batches == [[('a1', segment_path, 0, 10)]]
+        manifest.complete({'a1': content_hash(segment_path, 0, 10)})
+
+        manifest.scan_segments([('a1', segment_path, 0, 10)])
+        assert manifest.pending_count() == 0
+        manifest.scan_segments([('a1', segment_path, 10, 11)])
+        assert list(manifest.pending_batches()) == [[('a1', segment_path, 10, 11)]]
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from crawling.post_bitmap import PostBitmap
+
+
+def test_add_and_contains(tmp_path):
+    with PostBitmap(os.path.join(tmp_path, 'fetched.bits'), 64) as bitmap:
+        for number in (0, 7, 8, 63):
+            bitmap.add(number)
+        assert all(number in bitmap for number in (0, 7, 8, 63))
+        assert not any(number in bitmap for number in (1, 9, 62))
+
+
+def test_numbers_outside_of_size(tmp_path):
+    with PostBitmap(os.path.join(tmp_path, 'fetched.bits'), 64) as bitmap:
+        assert 1000 not in bitmap
+        assert -1 not in bitmap
+        with pytest.raises(ValueError):
+            bitmap.add(-1)
+
+        bitmap.add(1000)
+        assert 1000 in bitmap
+        assert 999 not in bitmap
+        assert bitmap.size > 1000
+
+
+def test_bits_persist_and_grown_part_is_seen(tmp_path):
+    path = os.path.join(tmp_path, 'fetched.bits')
+    with PostBitmap(path, 64) as first, PostBitmap(path, 64) as second:
+        first.add(5)
+        first.add(first.growth_step * 3)
+        assert 5 in second
+        assert first.growth_step * 3 in second
+
+    with PostBitmap(path, 8) as reopened:
+        assert 5 in reopened
+        assert reopened.growth_step * 3 in reopened
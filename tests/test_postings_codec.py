@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+from indexing.postings_codec import (
+    SHORT_LIST_SIZE,
+    decode_postings,
+    decode_varints,
+    encode_postings,
+    encode_varints,
+)
+
+
+def _postings(count, seed=0):
+    rng = random.Random(seed)
+    doc_ids = sorted(rng.sample(range(count * 1000), count))
+    postings = []
+    for doc_id in doc_ids:
+        postings += [doc_id, rng.randint(0, 3), rng.randint(0, 1 << 20)]
+    return postings
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 255, 16383, 16384, (1 << 35) + 7, (1 << 63) - 1]
+    for size in (len(values), SHORT_LIST_SIZE * 4):
+        data = values * (size // len(values))
+        assert decode_varints(encode_varints(data)).tolist() == data
+
+
+def test_varints_short_and_vectorized_encodings_are_equal():
+    values = list(range(0, 1 << 22, 4099))
+    short = b''.join(encode_varints(values[start:start + 1]) for start in range(len(values)))
+    assert encode_varints(values) == short
+
+
+def test_postings_round_trip():
+    for count in (0, 1, SHORT_LIST_SIZE - 1, SHORT_LIST_SIZE, 1000):
+        postings = _postings(count, seed=count)
+        expected = np.array(postings, dtype='<u8').reshape(-1, 3)
+        for encoded in (encode_postings(postings), encode_postings(expected)):
+            assert np.array_equal(decode_postings(encoded), expected)
@@ -0,0 +1,112 @@
+import math
+import os
+import random
+
+import pytest
+
+from indexing.index_builder import build_index
+from indexing.query_engine import QueryEngine
+from parsing.text_cleaner import TextCleaner
+
+
+# skewed vocabulary gives both long lists which are pruned and short essential ones
+VOCABULARY = [f'term{number}' for number in range(60)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def _records(count, seed, first_id=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f'p{first_id + number}',
+            'title': ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(1, 6))),
+            'text': ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(0, 60))),
+            'score': rng.randint(-5, 5000),
+            'comments_count': rng.randint(0, 300),
+        }
+        for number in range(count)
+    ]
+
+
+def _queries(count, seed):
+    rng = random.Random(seed)
+    return [
+        ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(1, 5))) for _ in range(count)
+    ]
+
+
+def _exhaustive_bm25(records, query, k, k1=1.2, b=0.75, title_weight=2.0, score_weight=0.0):
+    '''scores every record containing query terms in plain python'''
+    cleaner = TextCleaner()
+    title_counts = [cleaner.term_counts(record['title']) for record in records]
+    text_counts = [cleaner.term_counts(record['text']) for record in records]
+    average_title = sum(sum(counts.values()) for counts in title_counts) / len(records)
+    average_text = sum(sum(counts.values()) for counts in text_counts) / len(records)
+
+    scores = []
+    for record, titles, texts in zip(records, title_counts, text_counts):
+        title_norm = 1 - b + b * sum(titles.values()) / average_title
+        text_norm = 1 - b + b * sum(texts.values()) / average_text
+        score = score_weight * math.log1p(max(record['score'], 0))
+        matched = False
+        for term in dict.fromkeys(cleaner.tokenize(query)):
+            documents = sum(1 for other, text in zip(title_counts, text_counts)
+                            if term in other or term in text)
+            if titles[term] == 0 and texts[term] == 0:
+                continue
+            matched = True
+            idf = math.log(1 + (len(records) - documents + 0.5) / (documents + 0.5))
+            frequency = title_weight * titles[term] / title_norm + texts[term] / text_norm
+            score += idf * frequency * (k1 + 1) / (k1 + frequency)
+        if matched:
+            scores.append((record['id'], score))
+    scores.sort(key=lambda entry: -entry[1])
+    return scores[:k]
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    root = tmp_path_factory.mktemp('search')
+    index_root = os.path.join(root, 'index')
+    records = _records(300, seed=1)
+    # two segments check doc id offsets of second one
+    build_index(records[:150], index_root)
+    build_index(records[150:], index_root)
+    return index_root, records
+
+
+@pytest.mark.parametrize('k', [1, 3, 10, 50])
+def test_maxscore_top_k_equals_exhaustive(index, k):
+    index_root, _ = index
+    with QueryEngine(index_root, score_weight=0.5, comments_weight=0.2) as engine:
+        for query in _queries(200, seed=k):
+            assert engine.search(query, k, prune=True) == engine.search(query, k, prune=False)
+
+
+def test_search_batch_equals_search(index):
+    index_root, _ = index
+    queries = _queries(100, seed=7)
+    with QueryEngine(index_root) as engine:
+        assert engine.search_batch(queries, 10, max_cached_terms=5) == [
+            engine.search(query, 10) for query in queries
+        ]
+
+
+def test_scores_are_bm25(index):
+    index_root, records = index
+    with QueryEngine(index_root, score_weight=0.5) as engine:
+        for query in _queries(20, seed=3):
+            results = engine.search(query, 10)
+            expected = _exhaustive_bm25(records, query, 10, score_weight=0.5)
+            assert [score for _, score in results] == pytest.approx(
+                [score for _, score in expected])
+            scores = dict(_exhaustive_bm25(records, query, len(records), score_weight=0.5))
+            for post_id, score in results:
+                assert scores[post_id] == pytest.approx(score)
+
+
+def test_unknown_terms_find_nothing(index):
+    index_root, _ = index
+    with QueryEngine(index_root) as engine:
+        assert engine.search('missingterm', 10) == []
+        assert engine.search('', 10) == []
@@ -0,0 +1,184 @@
+'''crawling metrics collected in workers and aggregated in main process'''
+
+import json
+import os
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, float('inf'))
+
+
+def _write_json_atomically(path, data):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as stats_file:
+        json.dump(data, stats_file)
+    os.replace(temp_path, path)
+
+
+def _bucket_name(bound):
+    return 'inf' if bound == float('inf') else str(bound)
+
+
+class CrawlMetrics:
+    '''counters of single crawling process, periodically dumped to stats directory'''
+
+    def __init__(self, stats_dir, flush_interval=2.0):
+        self.stats_dir = stats_dir
+        self.flush_interval = flush_interval
+        self.path = os.path.join(stats_dir, f'worker-{os.getpid()}.json')
+
+        self.requests = 0
+        self.errors = 0
+        self.saves = 0
+        self.status_codes = {}
+        self.latency_histogram = [0] * len(LATENCY_BUCKETS)
+        self.proxy_errors = {}
+        self.current_number = None
+
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        os.makedirs(stats_dir, exist_ok=True)
+
+    def record_response(self, status: int, latency: float):
+        '''counts response with its status code and latency'''
+        with self._lock:
+            self.requests += 1
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.latency_histogram[index] += 1
+                    break
+
+    def _count_proxy_error(self, proxy):
+        self.errors += 1
+        key = str(proxy)
+        self.proxy_errors[key] = self.proxy_errors.get(key, 0) + 1
+
+    def record_error(self, proxy):
+        '''counts request of proxy which failed by connection error'''
+        with self._lock:
+            self.requests += 1
+            self._count_proxy_error(proxy)
+
+    def record_ban(self, proxy):
+        '''counts ban of proxy, its response is already counted by record_response'''
+        with self._lock:
+            self._count_proxy_error(proxy)
+
+    def record_save(self):
+        '''counts saved post'''
+        with self._lock:
+            self.saves += 1
+
+    def set_current_number(self, number: int):
+        '''remembers post number worker is at'''
+        self.current_number = number
+        self.maybe_flush()
+
+    def snapshot(self):
+        '''current counters as json friendly map'''
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'requests': self.requests,
+                'errors': self.errors,
+                'saves': self.saves,
+                'status_codes': {str(status): count for status, count in self.status_codes.items()},
+                'latency_histogram': {
+                    _bucket_name(bound): count
+                    for bound, count in zip(LATENCY_BUCKETS, self.latency_histogram)
+                },
+                'proxy_errors': dict(self.proxy_errors),
+                'current_number': self.current_number,
+            }
+
+    def maybe_flush(self):
+        '''dumps counters if flush interval passed since last dump'''
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''dumps counters to worker stats file'''
+        self._last_flush = time.monotonic()
+        _write_json_atomically(self.path, self.snapshot())
+
+
+class MetricsAggregator:
+    '''merges worker stats files, computes rates and writes summary stats file'''
+
+    def __init__(self, stats_dir, summary_path):
+        self.stats_dir = stats_dir
+        self.summary_path = summary_path
+        self._previous = None
+
+        os.makedirs(stats_dir, exist_ok=True)
+        # stats left from previous crawl would be summed up with new ones
+        for name in os.listdir(stats_dir):
+            if name.startswith('worker-'):
+                os.remove(os.path.join(stats_dir, name))
+
+    def _read_workers(self):
+        workers = []
+        for name in os.listdir(self.stats_dir):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.stats_dir, name), 'r', encoding='UTF-8') as stats_file:
+                    workers.append(json.load(stats_file))
+            except (OSError, ValueError):
+                continue
+        return workers
+
+    def aggregate(self):
+        '''sums up workers counters, writes them to summary file and returns them'''
+        workers = self._read_workers()
+        now = time.time()
+
+        summary = {
+            'time': now,
+            'requests': 0,
+            'errors': 0,
+            'saves': 0,
+            'status_codes': {},
+            'latency_histogram': {_bucket_name(bound): 0 for bound in LATENCY_BUCKETS},
+            'proxy_errors': {},
+            'current_numbers': {},
+        }
+        for worker in workers:
+            summary['requests'] += worker['requests']
+            summary['errors'] += worker['errors']
+            summary['saves'] += worker['saves']
+            for key in ('status_codes', 'latency_histogram', 'proxy_errors'):
+                for name, count in worker[key].items():
+                    summary[key][name] = summary[key].get(name, 0) + count
+            summary['current_numbers'][str(worker['pid'])] = worker['current_number']
+
+        summary['requests_per_second'] = 0.0
+        summary['saves_per_second'] = 0.0
+        if self._previous is not None and now > self._previous['time']:
+            elapsed = now - self._previous['time']
+            summary['requests_per_second'] = \
+                (summary['requests'] - self._previous['requests']) / elapsed
+            summary['saves_per_second'] = \
+                (summary['saves'] - self._previous['saves']) / elapsed
+        self._previous = summary
+
+        _write_json_atomically(self.summary_path, summary)
+        return summary
+
+
+def format_summary(summary):
+    '''one line description of aggregated crawling stats'''
+    top_statuses = sorted(summary['status_codes'].items(), key=lambda item: -item[1])[:4]
+    statuses = ' '.join(f'{status}:{count}' for status, count in top_statuses)
+    return (
+        f'{summary["requests_per_second"]:.1f} req/s, '
+        f'{summary["saves_per_second"]:.2f} saves/s, '
+        f'requests: {summary["requests"]}, '
+        f'errors: {summary["errors"]}, '
+        f'saved: {summary["saves"]}, '
+        f'statuses: {statuses or "-"}'
+    )
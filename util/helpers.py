@@ -1,20 +1,21 @@
 '''miscellaneous helper functions'''
 
 import os
-import random
-from time import sleep
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from parsel import Selector
 
+from util.page_store import is_page_file
 from util.proxy_address import ProxyAddress
 
 
 def get_filenames_batched(root_dir, batch_size=1000):
-    '''yields filenames batch by batch'''
+    '''yields filenames of plain and compressed pages batch by batch'''
     batch = []
     for file in os.scandir(root_dir):
-        if file.name.endswith('.html'):
+        if is_page_file(file.name):
             batch.append(os.path.join(root_dir, file.name))
             if len(batch) == batch_size:
                 yield batch
@@ -57,13 +58,14 @@ def parse_proxies_from_rows(rows):
     return proxies
 
 
-def scrape_hydemyname_proxies(
+def fetch_hydemyname_page(
     max_ping=500,
     protocol_type='h',
     start=0,
     headers: dict = None,
+    timeout=15.0,
 ):
-    '''fetches proxy list from hidemy.name website'''
+    '''fetches single page of proxy list from hidemy.name website'''
 
     url = 'https://hidemy.name/ru/proxy-list/'
     params = {
@@ -74,17 +76,78 @@ def scrape_hydemyname_proxies(
     if start != 0:
         params['start'] = start
 
-    sleep(random.uniform(0.1, 0.3))
-    data = requests.get(url=url, params=params, headers=headers).text
-    proxies = parse_proxies_from_table(data)
+    data = requests.get(url=url, params=params, headers=headers, timeout=timeout).text
+    return parse_proxies_from_table(data)
+
+
+def scrape_hydemyname_proxies(
+    max_ping=500,
+    protocol_type='h',
+    headers: dict = None,
+    workers_count=8,
+):
+    '''fetches proxy list from hidemy.name website, several pages at once'''
 
-    proxy_count = len(proxies)
-    if proxy_count != 0:
-        return proxies + scrape_hydemyname_proxies(
-            start=start+proxy_count,
+    def fetch(start):
+        return fetch_hydemyname_page(
             max_ping=max_ping,
             protocol_type=protocol_type,
-            headers=headers
+            start=start,
+            headers=headers,
         )
 
+    proxies = fetch(0)
+    page_size = len(proxies)
+    if page_size == 0:
+        return proxies
+
+    next_start = page_size
+    with ThreadPoolExecutor(max_workers=workers_count) as pool:
+        is_last_page_reached = False
+        while not is_last_page_reached:
+            starts = [next_start + page_size * index for index in range(workers_count)]
+            next_start = starts[-1] + page_size
+            for page in pool.map(fetch, starts):
+                proxies += page
+                is_last_page_reached = is_last_page_reached or len(page) == 0
+
     return proxies
+
+
+def check_proxy(proxy: ProxyAddress, test_url='https://old.reddit.com', timeout=5.0, headers=None):
+    '''returns proxy latency in seconds or None if proxy doesn't work'''
+    started = time.monotonic()
+    try:
+        response = requests.get(
+            url=test_url,
+            proxies=proxy.as_map(),
+            headers=headers,
+            timeout=timeout,
+        )
+    except requests.RequestException:
+        return None
+
+    if response.status_code != 200:
+        return None
+    return time.monotonic() - started
+
+
+def validate_proxies(
+    proxies,
+    test_url='https://old.reddit.com',
+    timeout=5.0,
+    headers=None,
+    workers_count=64,
+):
+    '''checks all proxies in parallel, returns working ones with latency and check time set'''
+    def check(proxy):
+        return check_proxy(proxy, test_url=test_url, timeout=timeout, headers=headers)
+
+    working = []
+    with ThreadPoolExecutor(max_workers=workers_count) as pool:
+        for proxy, latency in zip(proxies, pool.map(check, proxies)):
+            if latency is not None:
+                proxy.latency = latency
+                proxy.checked_at = time.time()
+                working.append(proxy)
+    return working
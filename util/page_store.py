@@ -0,0 +1,80 @@
+'''storing crawled pages'''
+
+import gzip
+import hashlib
+import io
+import os
+from util.segment_store import SegmentWriter
+
+
+PAGE_EXTENSION = '.html'
+COMPRESSED_PAGE_EXTENSION = '.html.gz'
+
+
+def is_page_file(name: str):
+    '''whether file is saved page, plain or compressed'''
+    return name.endswith((PAGE_EXTENSION, COMPRESSED_PAGE_EXTENSION))
+
+
+def page_id_from_name(name: str):
+    '''post id of saved page file name'''
+    return os.path.basename(name).split('.')[0]
+
+
+def page_data_hash(data: bytes):
+    '''hash of stored page data, compressed as it was saved'''
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def decode_page_file(path, data: bytes):
+    '''page of saved page file data, decompressed if file is compressed'''
+    if path.endswith(COMPRESSED_PAGE_EXTENSION):
+        data = gzip.decompress(data)
+    # universal newlines like file opened in text mode
+    return io.TextIOWrapper(io.BytesIO(data), encoding='UTF-8').read()
+
+
+def read_page_file(path):
+    '''reads saved page, decompressing it if it is compressed'''
+    with open(path, 'rb') as file:
+        return decode_page_file(path, file.read())
+
+
+class HtmlFilesStore:
+    '''saves every page to its own html file, gzipped if compress is set'''
+
+    def __init__(self, root=os.path.join('.', 'posts'), compress=False, compression_level=6):
+        self.root = root
+        self.compress = compress
+        self.compression_level = compression_level
+
+    def save(self, post_id: str, markup: str):
+        '''saves page of post as <post_id>.html or <post_id>.html.gz'''
+        if self.compress:
+            save_path = os.path.join(self.root, f'{post_id}{COMPRESSED_PAGE_EXTENSION}')
+            with open(save_path, 'wb') as file:
+                file.write(gzip.compress(markup.encode('UTF-8'), self.compression_level))
+            return
+
+        save_path = os.path.join(self.root, f'{post_id}{PAGE_EXTENSION}')
+        with open(save_path, 'w', encoding='UTF-8') as file:
+            file.write(markup)
+
+    def close(self):
+        '''nothing to flush, every file is closed after save'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_page_store(storage, root=os.path.join('.', 'posts'), compress_files=False):
+    '''opens page store for "files" (html file per post) or "segments" storage,
+    segments are always compressed'''
+    if storage == 'files':
+        return HtmlFilesStore(root, compress=compress_files)
+    if storage == 'segments':
+        return SegmentWriter(root)
+    raise ValueError(f'unknown storage: {storage}')
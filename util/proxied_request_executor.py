@@ -1,13 +1,22 @@
 '''helpers to execute requests through proxy'''
 
 import logging
-import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
 from util.proxy_repository import ProxyRepository
+from util.proxy_scheduler import NoProxiesError, ProxyScheduler
+from util.session_pool import ProxySessionPool
+
+
+# statuses of pages which reddit doesn't show, retrying them through other proxies is useless
+MISSING_STATUSES = (403, 404)
+# returned by get_page for such pages, as opposed to None of failed request
+MISSING_PAGE = object()
 
 
 class ProxiedRequestExecutor:
-    '''executes requests through random proxy server'''
+    '''executes requests through proxy servers picked by their health'''
     dummy_user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'\
         ' AppleWebKit/537.36 (KHTML, like Gecko)'\
         ' Chrome/101.0.4951.64'\
@@ -17,22 +26,45 @@ class ProxiedRequestExecutor:
         self,
         user_agent=dummy_user_agent,
         logger: logging.Logger = logging.getLogger(),
-        retry_count=5
+        retry_count=5,
+        timeout=(5.0, 15.0),
+        pool_size=4,
+        idle_timeout=120.0,
+        rate_limiter=None,
+        metrics=None,
+        scheduler: ProxyScheduler = None,
+        max_proxy_skips=8,
+        max_rate_wait=60.0,
     ):
         self.headers = {'User-Agent': user_agent}
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
 
-        self.proxy_repository = ProxyRepository(
+        self.sessions = ProxySessionPool(
             headers=self.headers,
-            logger=logger,
+            pool_size=pool_size,
+            timeout=timeout,
+            idle_timeout=idle_timeout,
         )
 
         self.retry_count = retry_count
+        # backed off proxies skipped in a row before token of the next one is waited for
+        self.max_proxy_skips = max_proxy_skips
+        # seconds request may wait for rate limiter before it fails
+        self.max_rate_wait = max_rate_wait
 
-        self.available_proxies = self._pick_random_proxies()
+        if scheduler is None:
+            proxy_repository = ProxyRepository(
+                headers=self.headers,
+                logger=logger,
+            )
+            scheduler = ProxyScheduler(proxy_repository.proxies)
+            proxy_repository.serve(scheduler)
+        self.scheduler = scheduler
 
         self.logger = logger
         self.logger.info('number of proxies picked: %d',
-                         len(self.available_proxies),
+                         self.scheduler.available_count(),
                          )
 
     def get(self, url: str,  params: dict = None):
@@ -44,30 +76,135 @@ class ProxiedRequestExecutor:
 
     def unsafe_get(self, url: str,  params: dict = None):
         '''send proxied request'''
-        for _ in range(self.retry_count):
-            index = random.randrange(0, len(self.available_proxies)-1)
-            response = requests.get(
-                url=url,
-                proxies=self.available_proxies[index].as_map(),
-                headers=self.headers,
-                params=params
-            )
+        response = self._send(url, params)
+        return response.text if response is not None else None
+
+    def get_page(self, url: str):
+        '''sends proxied request ignoring exceptions.
+        returns page, MISSING_PAGE if page doesn't exist or is hidden
+        and None if request failed'''
+        try:
+            response = self._send(url, accepted_statuses=(200,) + MISSING_STATUSES)
+        except Exception:
+            return None
+        if response is None:
+            return None
+        return response.text if response.status_code == 200 else MISSING_PAGE
+
+    def get_if_modified(self, url: str, etag: str = None, last_modified: str = None):
+        '''sends conditional proxied request with validators of previous response.
+        returns (page, etag, last_modified), page is None if it wasn't modified,
+        returns None if request failed'''
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        try:
+            response = self._send(url, headers=headers, accepted_statuses=(200, 304))
+        except Exception:
+            return None
+        if response is None:
+            return None
+
+        return (
+            response.text if response.status_code == 200 else None,
+            response.headers.get('ETag', etag),
+            response.headers.get('Last-Modified', last_modified),
+        )
+
+    def _send(self, url: str, params: dict = None, headers: dict = None, accepted_statuses=(200,)):
+        # only requests which were sent count as attempts
+        attempts = 0
+        skips = 0
+        deadline = time.monotonic() + self.max_rate_wait
+        while attempts < self.retry_count:
+            try:
+                proxy = self.scheduler.pick()
+            except NoProxiesError as error:
+                self.logger.error('%s; url: %s', error, url)
+                return None
+            if self.rate_limiter is not None:
+                max_wait = deadline - time.monotonic()
+                timeout = 2.0 if skips < self.max_proxy_skips else max_wait
+                if not self.rate_limiter.acquire(proxy, timeout=timeout, max_wait=max_wait):
+                    if skips >= self.max_proxy_skips or time.monotonic() >= deadline:
+                        # failed request is retried by batch or left for resume
+                        self.logger.warning(
+                            'rate limiter allowed no request for %.0fs; url: %s',
+                            self.max_rate_wait, url)
+                        return None
+                    # proxy is backed off or exhausted, try another one
+                    skips += 1
+                    continue
+            attempts += 1
+            skips = 0
+
+            started = time.monotonic()
+            deadline = started + self.max_rate_wait
+            try:
+                response = self.sessions.get(proxy, url, params, headers)
+            except requests.RequestException as error:
+                self.logger.debug('proxy: %s; error: %s; url: %s', proxy, error, url)
+                if self.metrics is not None:
+                    self.metrics.record_error(proxy)
+                self.scheduler.report_failure(proxy)
+                self.sessions.discard(proxy)
+                continue
+
             status = response.status_code
-            if status == 200:
-                return response.text
+            latency = time.monotonic() - started
+            if self.rate_limiter is not None:
+                self.rate_limiter.report(proxy, status)
+            if self.metrics is not None:
+                self.metrics.record_response(status, latency)
 
-            if status not in (301, 302, 403, 404, 500, 503):
-                banned = self.available_proxies.pop(index)
-                self.logger.error(
-                    'status: %s; banned: %s; url: %s', status, banned, url)
+            if status in accepted_statuses:
+                self.scheduler.report_success(proxy, latency)
+                return response
 
-            if len(self.available_proxies) == 0:
-                self.available_proxies = self._pick_random_proxies()
+            if status in (301, 302, 403, 404, 500, 503):
+                # reddit answered, so proxy itself works
+                self.scheduler.report_success(proxy, latency)
+            else:
+                if self.metrics is not None:
+                    self.metrics.record_ban(proxy)
+                self.scheduler.report_failure(proxy, banned=True)
+                self.sessions.discard(proxy)
+                self.logger.error(
+                    'status: %s; banned: %s; url: %s', status, proxy, url)
 
         return None
 
-    def _pick_random_proxies(self):
-        return random.sample(
-            self.proxy_repository.proxies,
-            int(len(self.proxy_repository.proxies) * 0.1),
-        )
+    def get_many(self, urls, concurrency: int = 64, request=None):
+        '''sends proxied requests from thread pool keeping up to concurrency requests in flight.
+        yields (url, page) pairs in order of completion, page is None if request failed.
+        request is called with url instead of get if given'''
+        request = request if request is not None else self.get
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = {}
+
+            def submit_next():
+                url = next(urls, None)
+                if url is not None:
+                    in_flight[pool.submit(request, url)] = url
+
+            for _ in range(concurrency):
+                submit_next()
+
+            while len(in_flight) != 0:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    submit_next()
+                    yield url, future.result()
+
+    def proxy_stats(self):
+        '''success rate, latency and cooldown of every proxy in use'''
+        return self.scheduler.stats()
+
+    def close(self):
+        '''closes connections to all proxies'''
+        self.sessions.close()
@@ -6,11 +6,23 @@ class ProxyAddress:
     ip_address_key = 'ip_address'
     port_key = 'port'
     protocol_key = 'protocol'
+    latency_key = 'latency'
+    checked_at_key = 'checked_at'
 
-    def __init__(self, ip_address: str, port: int, protocol: str):
+    def __init__(
+        self,
+        ip_address: str,
+        port: int,
+        protocol: str,
+        latency: float = None,
+        checked_at: float = None,
+    ):
         self.ip_address = ip_address
         self.port = port
         self.protocol = protocol
+        # seconds of test request and unix time of check, None if never checked
+        self.latency = latency
+        self.checked_at = checked_at
 
     def as_map(self) -> map:
         '''transforms proxy address to map object wich can be used with requests package'''
@@ -22,6 +34,8 @@ class ProxyAddress:
             self.ip_address_key: self.ip_address,
             self.port_key: self.port,
             self.protocol_key: self.protocol,
+            self.latency_key: self.latency,
+            self.checked_at_key: self.checked_at,
         }
 
     @staticmethod
@@ -30,9 +44,18 @@ class ProxyAddress:
         return ProxyAddress(
             json[ProxyAddress.ip_address_key],
             json[ProxyAddress.port_key],
-            json[ProxyAddress.protocol_key]
+            json[ProxyAddress.protocol_key],
+            json.get(ProxyAddress.latency_key),
+            json.get(ProxyAddress.checked_at_key),
         )
 
+    @staticmethod
+    def from_str(address: str):
+        '''build proxy address from "protocol://ip:port" string'''
+        protocol, host = address.split('://', 1)
+        ip_address, port = host.rsplit(':', 1)
+        return ProxyAddress(ip_address, int(port), protocol)
+
     def __str__(self) -> str:
         return f'{self.protocol}://{self.ip_address}:{self.port}'
 
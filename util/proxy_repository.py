@@ -2,17 +2,46 @@
 import logging
 import os
 import json
-from util.helpers import scrape_hydemyname_proxies
+import threading
+import time
+from util.helpers import scrape_hydemyname_proxies, validate_proxies
 from util.proxy_address import ProxyAddress
 
 
 class ProxyRepository:
-    '''proxy repo with caching capabilities'''
+    '''proxy repo with caching capabilities.
+    cached proxies are verified against test url, entries older than ttl are considered stale.
+    with refresh enabled stale entries are rechecked at once and then in background thread
+    every ttl/2 seconds, proxies are scraped from network again when fewer than min_proxies
+    or less than half of them work. refreshed proxies are pushed to pools served by repository'''
     cache_path = os.path.join('.', 'proxy.cache')
 
-    def __init__(self, headers: dict = None, logger: logging.Logger = logging.getLogger()):
+    def __init__(
+        self,
+        headers: dict = None,
+        logger: logging.Logger = logging.getLogger(),
+        refresh=False,
+        ttl=3600.0,
+        test_url='https://old.reddit.com',
+        check_timeout=5.0,
+        cache_path=None,
+        min_proxies=10,
+    ):
+        if cache_path is not None:
+            self.cache_path = cache_path
         self.headers = headers
         self.logger = logger
+        self.ttl = ttl
+        self.test_url = test_url
+        self.check_timeout = check_timeout
+        self.min_proxies = min_proxies
+        self._refresh_thread = None
+        self._stop_refreshing = threading.Event()
+        self._schedulers = []
+        self._serve_thread = None
+        self._last_refill = float('-inf')
+        # refresh and refill may run in different threads
+        self._update_lock = threading.Lock()
 
         logger.info('Retrieving proxies from cache...')
         cached_proxies = self.retrieve_from_cache()
@@ -20,7 +49,7 @@ class ProxyRepository:
             logger.info('No cached proxies found')
 
             logger.info('Retrieving proxies from network...')
-            proxies = self.fetch_from_net()
+            proxies = self.validate(self.fetch_from_net())
             logger.info('Proxies retrieved: %d', len(proxies))
             self.proxies = proxies
 
@@ -28,13 +57,120 @@ class ProxyRepository:
             self.cache_proxies()
         else:
             logger.info('Proxies retrieved: %d', len(cached_proxies))
-            self.proxies = cached_proxies
+            self.proxies = self._sorted_by_latency(cached_proxies)
+
+            # workers start with verified pool, so stale entries are checked right away
+            if refresh and len(self.fresh_proxies()) < len(self.proxies):
+                logger.info('Some cached proxies are stale, validating them...')
+                self.refresh()
+
+        if refresh:
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_periodically,
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+    @staticmethod
+    def _sorted_by_latency(proxies):
+        return sorted(
+            proxies,
+            key=lambda proxy: proxy.latency if proxy.latency is not None else float('inf'),
+        )
 
     def fetch_from_net(self):
         '''crawl proxies from hidemy.name proxy list'''
         proxies = scrape_hydemyname_proxies(headers=self.headers)
         return proxies
 
+    def validate(self, proxies):
+        '''checks proxies against test url, returns working ones fastest first'''
+        working = validate_proxies(
+            proxies,
+            test_url=self.test_url,
+            timeout=self.check_timeout,
+            headers=self.headers,
+        )
+        self.logger.info('Proxies validated: %d of %d work', len(working), len(proxies))
+        return self._sorted_by_latency(working)
+
+    def fresh_proxies(self):
+        '''proxies checked less than ttl seconds ago'''
+        now = time.time()
+        return [
+            proxy for proxy in self.proxies
+            if proxy.checked_at is not None and now - proxy.checked_at < self.ttl
+        ]
+
+    def refresh(self):
+        '''rechecks stale proxies, scrapes new ones if too few work,
+        rewrites cache and pushes proxies to served pools'''
+        with self._update_lock:
+            fresh = self.fresh_proxies()
+            fresh_set = set(fresh)
+            stale = [proxy for proxy in self.proxies if proxy not in fresh_set]
+            proxies = fresh + self.validate(stale)
+
+            # empty or tiny pool is refilled even though half of it still works
+            if len(proxies) < max(self.min_proxies, len(self.proxies) // 2):
+                self.logger.info('Too few proxies work, retrieving proxies from network...')
+                known = set(proxies)
+                proxies += self.validate(
+                    [proxy for proxy in self.fetch_from_net() if proxy not in known])
+
+            self.proxies = self._sorted_by_latency(proxies)
+            self.cache_proxies()
+            self._push_to_pools()
+
+    def serve(self, scheduler, check_interval=1.0, min_refill_interval=60.0):
+        '''puts proxies into pool of scheduler and refills the pool with proxies
+        from network whenever it asks for more, at most once per min_refill_interval'''
+        scheduler.update(self.proxies)
+        self._schedulers.append(scheduler)
+        if self._serve_thread is None:
+            self._serve_thread = threading.Thread(
+                target=self._serve_refills,
+                args=(check_interval, min_refill_interval),
+                daemon=True,
+            )
+            self._serve_thread.start()
+
+    def _serve_refills(self, check_interval, min_refill_interval):
+        while not self._stop_refreshing.wait(check_interval):
+            if time.monotonic() - self._last_refill < min_refill_interval:
+                continue
+            if any(scheduler.needs_refill() for scheduler in self._schedulers):
+                self._last_refill = time.monotonic()
+                try:
+                    self.refill()
+                except Exception as error:
+                    self.logger.error('Proxies refill failed: %s', error)
+
+    def refill(self):
+        '''adds working proxies from network to cached ones and to served pools'''
+        self.logger.info('Proxy pool runs low, retrieving proxies from network...')
+        with self._update_lock:
+            known = set(self.proxies)
+            self.proxies = self._sorted_by_latency(self.proxies + self.validate(
+                [proxy for proxy in self.fetch_from_net() if proxy not in known]))
+            self.cache_proxies()
+            self._push_to_pools()
+
+    def _push_to_pools(self):
+        for scheduler in self._schedulers:
+            scheduler.update(self.proxies)
+
+    def _refresh_periodically(self):
+        while not self._stop_refreshing.wait(self.ttl / 2):
+            try:
+                self.refresh()
+            except Exception as error:
+                self.logger.error('Proxies refresh failed: %s', error)
+
+    def stop_refreshing(self):
+        '''stops background refresh and refill threads'''
+        self._stop_refreshing.set()
+
     def retrieve_from_cache(self):
         '''gets cached proxies'''
         proxies = []
@@ -48,6 +184,8 @@ class ProxyRepository:
 
     def cache_proxies(self):
         '''saves proxies to file'''
-        with open(self.cache_path, 'w', encoding='UTF-8') as cache_file:
+        temp_path = f'{self.cache_path}.tmp'
+        with open(temp_path, 'w', encoding='UTF-8') as cache_file:
             for proxy in self.proxies:
                 cache_file.write(f'{json.dumps(proxy.to_json())}\n')
+        os.replace(temp_path, self.cache_path)
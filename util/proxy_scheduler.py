@@ -0,0 +1,321 @@
+'''picking proxies by their health'''
+
+import multiprocessing
+import random
+import threading
+import time
+from util.proxy_address import ProxyAddress
+
+
+# bytes of "protocol://ip:port" proxy address in shared proxies table
+ADDRESS_SIZE = 64
+
+
+class NoProxiesError(Exception):
+    '''raised when proxy pool stays empty longer than scheduler waits for its refill'''
+
+
+class ProxyScheduler:
+    '''picks proxies weighted by success rate and latency moving averages.
+    failing proxies are put into cooldown (circuit breaker) instead of being dropped,
+    after cooldown a proxy gets one probe request which closes or reopens the breaker.
+    pool is changed by update, e.g. by ProxyRepository serving the scheduler,
+    which refills it when scheduler asks for more proxies'''
+
+    def __init__(
+        self,
+        proxies: list,
+        active_share=0.1,
+        min_available=10,
+        smoothing=0.2,
+        failures_to_trip=3,
+        cooldown=30.0,
+        max_cooldown=900.0,
+        empty_timeout=30.0,
+    ):
+        self.min_available = min_available
+        self.smoothing = smoothing
+        self.failures_to_trip = failures_to_trip
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        # seconds pick waits for refill of empty pool before giving up
+        self.empty_timeout = empty_timeout
+
+        # proxy of every slot, None for free slot
+        self.proxies = []
+        self.indexes = {}
+        self._allocate(len(proxies))
+        self.update(proxies)
+
+        present = [index for index, proxy in enumerate(self.proxies) if proxy is not None]
+        active_count = max(int(len(present) * active_share), 1)
+        for index in random.sample(present, min(active_count, len(present))):
+            self._active[index] = 1
+
+    def _allocate(self, size):
+        '''creates lock and per proxy stats arrays'''
+        self._lock = threading.Lock()
+        self.proxies = [None] * size
+        self._active = [0] * size
+        self._success_rate = [1.0] * size
+        self._latency = [0.0] * size
+        self._consecutive_failures = [0] * size
+        self._trips = [0] * size
+        self._cooldown_until = [0.0] * size
+        self._requests = [0] * size
+        self._errors = [0] * size
+        self._refill_request = [0]
+
+    def _stats_arrays(self):
+        return (
+            self._active,
+            self._success_rate,
+            self._latency,
+            self._consecutive_failures,
+            self._trips,
+            self._cooldown_until,
+            self._requests,
+            self._errors,
+        )
+
+    def _grow(self):
+        '''adds free slot, returns its index or None if pool can't grow'''
+        for values in self._stats_arrays():
+            values.append(0)
+        self.proxies.append(None)
+        return len(self.proxies) - 1
+
+    def _occupy(self, index, proxy: ProxyAddress):
+        self.proxies[index] = proxy
+        self.indexes[str(proxy)] = index
+        self._active[index] = 0
+        self._success_rate[index] = 1.0
+        self._latency[index] = 0.0
+        self._consecutive_failures[index] = 0
+        self._trips[index] = 0
+        self._cooldown_until[index] = 0.0
+        self._requests[index] = 0
+        self._errors[index] = 0
+
+    def _vacate(self, index):
+        del self.indexes[str(self.proxies[index])]
+        self.proxies[index] = None
+        self._active[index] = 0
+
+    def _sync(self):
+        '''makes proxies of slots up to date, pool of this scheduler is changed in place'''
+
+    def _index(self, proxy: ProxyAddress):
+        '''slot of proxy, None if proxy left the pool while its request was in flight'''
+        self._sync()
+        return self.indexes.get(str(proxy))
+
+    def update(self, proxies: list):
+        '''makes pool consist of given proxies: keeps stats of the ones already in it,
+        frees slots of missing ones and puts new ones into free slots'''
+        with self._lock:
+            self._sync()
+            wanted = {str(proxy): proxy for proxy in proxies}
+            for index, proxy in enumerate(self.proxies):
+                if proxy is not None and str(proxy) not in wanted:
+                    self._vacate(index)
+
+            free = [index for index, proxy in enumerate(self.proxies) if proxy is None]
+            free.reverse()
+            for key, proxy in wanted.items():
+                if key in self.indexes:
+                    continue
+                index = free.pop() if len(free) != 0 else self._grow()
+                if index is None:
+                    # pool is full, proxies come fastest first, so the slowest are left out
+                    break
+                self._occupy(index, proxy)
+            self._refill_request[0] = 0
+
+    def needs_refill(self):
+        '''whether too few proxies are left available and pool asks for more'''
+        return bool(self._refill_request[0])
+
+    def _is_available(self, index, now):
+        return self._active[index] and self._cooldown_until[index] <= now
+
+    def _weight(self, index):
+        # proxies without latency samples yet are treated as fast to try them early
+        latency = self._latency[index] or 0.5
+        return self._success_rate[index] ** 2 / max(latency, 0.05)
+
+    def _refill(self, now):
+        '''activates more proxies of pool when few of them are available,
+        asks for refill when most of pool is cooling down or gone'''
+        present = [index for index, proxy in enumerate(self.proxies) if proxy is not None]
+        available = sum(1 for index in present if self._is_available(index, now))
+        if available >= self.min_available:
+            return
+
+        inactive = [index for index in present if not self._active[index]]
+        activated = random.sample(inactive, min(len(inactive), self.min_available - available))
+        for index in activated:
+            self._active[index] = 1
+
+        if available + len(activated) < min(self.min_available, max(len(present) // 2, 1)):
+            self._refill_request[0] = 1
+
+    def _pick_index(self):
+        now = time.time()
+        self._refill(now)
+
+        candidates = [index for index, proxy in enumerate(self.proxies)
+                      if proxy is not None and self._is_available(index, now)]
+        if len(candidates) != 0:
+            weights = [self._weight(index) for index in candidates]
+            return random.choices(candidates, weights=weights)[0]
+
+        # every proxy is cooling down, probe the one which recovers first
+        cooling = [index for index, proxy in enumerate(self.proxies)
+                   if proxy is not None and self._active[index]]
+        if len(cooling) == 0:
+            return None
+        return min(cooling, key=lambda index: self._cooldown_until[index])
+
+    def pick(self) -> ProxyAddress:
+        '''picks available proxy, prefers fast and healthy ones.
+        waits for refill while pool is empty, raises NoProxiesError if it isn't refilled'''
+        deadline = time.monotonic() + self.empty_timeout
+        while True:
+            with self._lock:
+                self._sync()
+                index = self._pick_index()
+                if index is not None:
+                    self._requests[index] += 1
+                    return self.proxies[index]
+
+            if time.monotonic() >= deadline:
+                raise NoProxiesError(
+                    f'proxy pool is empty for {self.empty_timeout:g}s')
+            time.sleep(min(1.0, self.empty_timeout))
+
+    def report_success(self, proxy: ProxyAddress, latency: float):
+        '''records proxy response time, closes its breaker'''
+        with self._lock:
+            index = self._index(proxy)
+            if index is None:
+                return
+            self._success_rate[index] += self.smoothing * \
+                (1.0 - self._success_rate[index])
+            if self._latency[index] == 0.0:
+                self._latency[index] = latency
+            else:
+                self._latency[index] += self.smoothing * \
+                    (latency - self._latency[index])
+            self._consecutive_failures[index] = 0
+            self._trips[index] = 0
+
+    def report_failure(self, proxy: ProxyAddress, banned=False):
+        '''records failed request, opens breaker after several failures or on ban'''
+        with self._lock:
+            index = self._index(proxy)
+            if index is None:
+                return
+            self._success_rate[index] -= self.smoothing * self._success_rate[index]
+            self._consecutive_failures[index] += 1
+            self._errors[index] += 1
+
+            if banned or self._consecutive_failures[index] >= self.failures_to_trip:
+                cooldown = min(self.cooldown * 2 ** self._trips[index], self.max_cooldown)
+                self._trips[index] += 1
+                self._consecutive_failures[index] = 0
+                self._cooldown_until[index] = time.time() + cooldown
+
+    def available_count(self):
+        '''number of active proxies which are not cooling down'''
+        with self._lock:
+            self._sync()
+            now = time.time()
+            return sum(1 for index, proxy in enumerate(self.proxies)
+                       if proxy is not None and self._is_available(index, now))
+
+    def stats(self):
+        '''per proxy stats of active proxies'''
+        with self._lock:
+            self._sync()
+            now = time.time()
+            return [
+                {
+                    'proxy': str(proxy),
+                    'available': bool(self._is_available(index, now)),
+                    'success_rate': round(self._success_rate[index], 3),
+                    'latency': round(self._latency[index], 3),
+                    'requests': self._requests[index],
+                    'errors': self._errors[index],
+                    'cooldown_left': round(max(self._cooldown_until[index] - now, 0.0), 1),
+                }
+                for index, proxy in enumerate(self.proxies)
+                if proxy is not None and self._active[index]
+            ]
+
+
+class SharedProxyScheduler(ProxyScheduler):
+    '''proxy scheduler which keeps proxies table and stats in shared memory arrays.
+    created once in main process and passed to worker processes on their start,
+    so bans, cooldowns and health scores are seen by all workers at once.
+    pool has fixed capacity, proxies which main process puts into it or removes
+    from it with update reach workers on their next pick'''
+
+    def __init__(self, proxies: list, capacity=1024, **kwargs):
+        self.capacity = capacity
+        super().__init__(proxies, **kwargs)
+
+    def _allocate(self, size):
+        size = max(size, self.capacity)
+        self._lock = multiprocessing.Lock()
+        self.proxies = [None] * size
+        self._active = multiprocessing.RawArray('b', size)
+        self._success_rate = multiprocessing.RawArray('d', [1.0] * size)
+        self._latency = multiprocessing.RawArray('d', size)
+        self._consecutive_failures = multiprocessing.RawArray('l', size)
+        self._trips = multiprocessing.RawArray('l', size)
+        self._cooldown_until = multiprocessing.RawArray('d', size)
+        self._requests = multiprocessing.RawArray('q', size)
+        self._errors = multiprocessing.RawArray('q', size)
+        self._refill_request = multiprocessing.RawArray('b', 1)
+        # "protocol://ip:port" of every slot, empty for free slot
+        self._addresses = multiprocessing.RawArray('c', size * ADDRESS_SIZE)
+        # bumped on every change of addresses, processes compare it with the one they read
+        self._version = multiprocessing.RawArray('q', 1)
+        self._synced_version = 0
+
+    def _grow(self):
+        # shared arrays can't grow
+        return None
+
+    def _write_address(self, index, address: str):
+        encoded = address.encode('UTF-8')
+        if len(encoded) > ADDRESS_SIZE:
+            raise ValueError(f'proxy address is too long: {address}')
+        start = index * ADDRESS_SIZE
+        self._addresses[start:start + ADDRESS_SIZE] = encoded.ljust(ADDRESS_SIZE, b'\0')
+        self._version[0] += 1
+        self._synced_version = self._version[0]
+
+    def _occupy(self, index, proxy: ProxyAddress):
+        self._write_address(index, str(proxy))
+        super()._occupy(index, proxy)
+
+    def _vacate(self, index):
+        super()._vacate(index)
+        self._write_address(index, '')
+
+    def _sync(self):
+        '''rereads proxies table if another process changed it'''
+        version = self._version[0]
+        if version == self._synced_version:
+            return
+
+        self.indexes = {}
+        for index in range(len(self.proxies)):
+            start = index * ADDRESS_SIZE
+            address = self._addresses[start:start + ADDRESS_SIZE].rstrip(b'\0').decode('UTF-8')
+            self.proxies[index] = ProxyAddress.from_str(address) if address else None
+            if address:
+                self.indexes[address] = index
+        self._synced_version = version
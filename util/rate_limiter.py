@@ -0,0 +1,116 @@
+'''token bucket rate limiting shared by crawling processes'''
+
+import multiprocessing
+import time
+import zlib
+
+
+class SharedRateLimiter:
+    '''global token bucket plus token bucket per proxy kept in shared memory.
+    proxies are hashed into fixed number of slots, so memory doesn't depend on proxy count.
+    429 responses back proxy off, 503 responses back everyone off, backoff grows exponentially
+    and halves on every successful response'''
+    # fields of every bucket in shared array
+    _tokens, _updated, _blocked_until, _backoff = range(4)
+    _fields_count = 4
+
+    def __init__(
+        self,
+        global_rate=0.0,
+        proxy_rate=1.0,
+        global_burst=None,
+        proxy_burst=None,
+        proxy_slots=4096,
+        min_backoff=5.0,
+        max_backoff=300.0,
+    ):
+        # rate is requests per second, zero means no limit
+        self.global_rate = global_rate
+        self.proxy_rate = proxy_rate
+        self.global_burst = global_burst or max(global_rate, 1.0)
+        self.proxy_burst = proxy_burst or max(proxy_rate, 1.0)
+        self.proxy_slots = proxy_slots
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = multiprocessing.Lock()
+        self._buckets = multiprocessing.RawArray(
+            'd', (proxy_slots + 1) * self._fields_count)
+
+        now = time.monotonic()
+        for bucket in range(proxy_slots + 1):
+            burst = self.global_burst if bucket == 0 else self.proxy_burst
+            self._set(bucket, self._tokens, burst)
+            self._set(bucket, self._updated, now)
+
+    def _get(self, bucket, field):
+        return self._buckets[bucket * self._fields_count + field]
+
+    def _set(self, bucket, field, value):
+        self._buckets[bucket * self._fields_count + field] = value
+
+    def _slot(self, proxy):
+        # builtin hash of str differs between processes
+        return zlib.crc32(str(proxy).encode('UTF-8')) % self.proxy_slots + 1
+
+    def _refill(self, bucket, rate, burst, now):
+        tokens = self._get(bucket, self._tokens)
+        elapsed = now - self._get(bucket, self._updated)
+        self._set(bucket, self._tokens, min(burst, tokens + elapsed * rate))
+        self._set(bucket, self._updated, now)
+
+    def _wait_time(self, bucket, rate, now):
+        '''seconds until bucket can give a token, zero if it can right now'''
+        blocked = self._get(bucket, self._blocked_until) - now
+        if blocked > 0:
+            return blocked
+        if rate <= 0:
+            return 0.0
+        missing = 1.0 - self._get(bucket, self._tokens)
+        return missing / rate if missing > 0 else 0.0
+
+    def acquire(self, proxy, timeout=2.0, max_sleep=1.0, max_wait=float('inf')):
+        '''blocks until request through proxy is allowed.
+        returns False at once if proxy would be available only after timeout seconds,
+        so caller can pick another proxy; global limit is waited for,
+        but not longer than max_wait seconds in total'''
+        slot = self._slot(proxy)
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(0, self.global_rate, self.global_burst, now)
+                self._refill(slot, self.proxy_rate, self.proxy_burst, now)
+
+                proxy_wait = self._wait_time(slot, self.proxy_rate, now)
+                if proxy_wait > timeout:
+                    return False
+
+                wait = max(self._wait_time(0, self.global_rate, now), proxy_wait)
+                if wait == 0.0:
+                    if self.global_rate > 0:
+                        self._set(0, self._tokens, self._get(0, self._tokens) - 1.0)
+                    if self.proxy_rate > 0:
+                        self._set(slot, self._tokens, self._get(slot, self._tokens) - 1.0)
+                    return True
+                if now + wait > deadline:
+                    return False
+            time.sleep(min(wait, max_sleep))
+
+    def _back_off(self, bucket):
+        backoff = min(max(self._get(bucket, self._backoff) * 2, self.min_backoff),
+                      self.max_backoff)
+        self._set(bucket, self._backoff, backoff)
+        self._set(bucket, self._blocked_until, time.monotonic() + backoff)
+
+    def report(self, proxy, status: int):
+        '''adapts to response status: backs off on 429 and 503, recovers on success'''
+        slot = self._slot(proxy)
+        with self._lock:
+            if status == 429:
+                self._back_off(slot)
+            elif status == 503:
+                self._back_off(0)
+            elif status < 400:
+                for bucket in (0, slot):
+                    self._set(bucket, self._backoff, self._get(bucket, self._backoff) / 2)
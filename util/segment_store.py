@@ -0,0 +1,254 @@
+'''packed storage of crawled pages in large compressed segment files'''
+
+import mmap
+import os
+import re
+import time
+import zlib
+import numpy as np
+
+
+INDEX_RECORD = np.dtype([
+    ('post_number', '<u8'),
+    ('segment', '<u4'),
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    # nanoseconds since epoch, the latest page of post wins whichever writer saved it
+    ('written_at', '<u8'),
+])
+
+SEGMENT_PATTERN = re.compile(r'segment-([0-9a-z]+)-(\d+)\.seg$')
+INDEX_PATTERN = re.compile(r'index-([0-9a-z]+)\.idx$')
+
+
+def segment_path(root, writer_id, segment):
+    '''path of segment file of writer'''
+    return os.path.join(root, f'segment-{writer_id}-{segment:05d}.seg')
+
+
+def index_path(root, writer_id):
+    '''path of index file of writer'''
+    return os.path.join(root, f'index-{writer_id}.idx')
+
+
+def decompress_page(data: bytes):
+    '''page of compressed data read from segment'''
+    return zlib.decompress(data).decode('UTF-8')
+
+
+class SegmentReader:
+    '''reads compressed pages of entries going in segment order,
+    segment stays open until page of another segment is read'''
+
+    def __init__(self):
+        self._path = None
+        self._segment_file = None
+
+    def read(self, path, offset: int, length: int):
+        '''compressed data of page at offset of segment'''
+        if path != self._path:
+            self.close()
+            self._segment_file = open(path, 'rb')
+            self._path = path
+        self._segment_file.seek(offset)
+        return self._segment_file.read(length)
+
+    def close(self):
+        '''closes current segment'''
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+            self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class SegmentWriter:
+    '''appends compressed pages to segments of single writer and indexes them.
+    every process should use its own writer id, by default it is process id'''
+
+    def __init__(self, root, writer_id=None, segment_size=1024 * 1024 * 1024, compression_level=6):
+        self.root = root
+        self.writer_id = writer_id if writer_id is not None else str(os.getpid())
+        self.segment_size = segment_size
+        self.compression_level = compression_level
+
+        os.makedirs(root, exist_ok=True)
+
+        segments = [
+            int(match.group(2)) for match in
+            (SEGMENT_PATTERN.match(name) for name in os.listdir(root))
+            if match is not None and match.group(1) == self.writer_id
+        ]
+        self.segment = max(segments, default=0)
+
+        self._segment_file = None
+        self._index_file = open(index_path(root, self.writer_id), 'ab')
+
+    def _open_segment(self):
+        self._segment_file = open(
+            segment_path(self.root, self.writer_id, self.segment), 'ab')
+        if self._segment_file.tell() >= max(self.segment_size, 1):
+            self._segment_file.close()
+            self.segment += 1
+            self._segment_file = open(
+                segment_path(self.root, self.writer_id, self.segment), 'ab')
+
+    def save(self, post_id: str, markup: str):
+        '''appends page of post to current segment'''
+        if self._segment_file is None:
+            self._open_segment()
+
+        data = zlib.compress(markup.encode('UTF-8'), self.compression_level)
+        offset = self._segment_file.tell()
+        self._segment_file.write(data)
+
+        record = np.array(
+            [(int(post_id, 36), self.segment, offset, len(data), time.time_ns())],
+            dtype=INDEX_RECORD,
+        )
+        self._index_file.write(record.tobytes())
+
+        if self._segment_file.tell() >= self.segment_size:
+            self._segment_file.close()
+            self._segment_file = None
+            self.segment += 1
+
+    def close(self):
+        '''flushes segment and index'''
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class SegmentStore:
+    '''reads pages from segments, by post id through mmap or sequentially'''
+
+    def __init__(self, root):
+        self.root = root
+        self.writer_ids = []
+        self._maps = {}
+
+        indexes = []
+        for name in sorted(os.listdir(root)):
+            match = INDEX_PATTERN.match(name)
+            if match is None:
+                continue
+            with open(os.path.join(root, name), 'rb') as index_file:
+                data = index_file.read()
+            # record may be cut if writer crashed
+            data = data[:len(data) - len(data) % INDEX_RECORD.itemsize]
+            records = np.frombuffer(data, dtype=INDEX_RECORD)
+            writers = np.full(len(records), len(self.writer_ids), dtype='<u4')
+            indexes.append((records, writers))
+            self.writer_ids.append(match.group(1))
+
+        if len(indexes) == 0:
+            self.index = np.zeros(0, dtype=INDEX_RECORD)
+            self.writers = np.zeros(0, dtype='<u4')
+        else:
+            self.index = np.concatenate([records for records, _ in indexes])
+            self.writers = np.concatenate([writers for _, writers in indexes])
+
+        # the latest written record of the same post wins
+        order = np.lexsort((self.index['written_at'], self.index['post_number']))
+        self.index = self.index[order]
+        self.writers = self.writers[order]
+        is_last = np.ones(len(self.index), dtype=bool)
+        is_last[:-1] = self.index['post_number'][1:] != self.index['post_number'][:-1]
+        self.index = self.index[is_last]
+        self.writers = self.writers[is_last]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, post_id: str):
+        return self._position(post_id) is not None
+
+    def _position(self, post_id):
+        post_number = int(post_id, 36)
+        position = np.searchsorted(self.index['post_number'], post_number)
+        if position < len(self.index) and self.index['post_number'][position] == post_number:
+            return position
+        return None
+
+    def _segment_path(self, position):
+        return segment_path(
+            self.root,
+            self.writer_ids[self.writers[position]],
+            int(self.index['segment'][position]),
+        )
+
+    def _map(self, path):
+        segment_map = self._maps.get(path)
+        if segment_map is None:
+            with open(path, 'rb') as segment_file:
+                segment_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = segment_map
+        return segment_map
+
+    def get(self, post_id: str):
+        '''returns page of post or None if it isn't stored'''
+        position = self._position(post_id)
+        if position is None:
+            return None
+
+        offset = int(self.index['offset'][position])
+        length = int(self.index['length'][position])
+        return decompress_page(self._map(self._segment_path(position))[offset:offset + length])
+
+    def entries(self):
+        '''(post_id, segment path, offset, length) of every page in segment order'''
+        order = np.lexsort((
+            self.index['offset'],
+            self.index['segment'],
+            self.writers,
+        ))
+        for position in order:
+            yield (
+                np.base_repr(int(self.index['post_number'][position]), 36).lower(),
+                self._segment_path(position),
+                int(self.index['offset'][position]),
+                int(self.index['length'][position]),
+            )
+
+    def entries_batched(self, batch_size=1000):
+        '''yields entries batch by batch'''
+        batch = []
+        for entry in self.entries():
+            batch.append(entry)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if len(batch) != 0:
+            yield batch
+
+    def iter_pages(self):
+        '''yields (post_id, page) reading segments sequentially'''
+        with SegmentReader() as reader:
+            for post_id, path, offset, length in self.entries():
+                yield post_id, decompress_page(reader.read(path, offset, length))
+
+    def close(self):
+        '''unmaps segments'''
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
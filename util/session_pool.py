@@ -0,0 +1,102 @@
+'''keep-alive sessions for proxy servers'''
+
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from util.proxy_address import ProxyAddress
+
+
+class ProxySessionPool:
+    '''keeps reusable session with connection pool for every proxy'''
+
+    def __init__(
+        self,
+        headers: dict = None,
+        pool_size=4,
+        timeout=(5.0, 15.0),
+        idle_timeout=120.0,
+    ):
+        self.headers = headers
+        self.pool_size = pool_size
+        # connect and read timeouts in seconds
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._last_used = {}
+        self._last_eviction = time.monotonic()
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.headers is not None:
+            session.headers.update(self.headers)
+        return session
+
+    def session_for(self, proxy: ProxyAddress) -> requests.Session:
+        '''returns session of proxy creating it if needed'''
+        now = time.monotonic()
+        if now - self._last_eviction > self.idle_timeout:
+            self.evict_idle()
+
+        with self._lock:
+            session = self._sessions.get(proxy)
+            if session is None:
+                session = self._create_session()
+                self._sessions[proxy] = session
+            self._last_used[proxy] = now
+            return session
+
+    def get(
+        self,
+        proxy: ProxyAddress,
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+    ) -> requests.Response:
+        '''sends request through proxy reusing its open connections,
+        headers are added to headers of session'''
+        return self.session_for(proxy).get(
+            url=url,
+            proxies=proxy.as_map(),
+            params=params,
+            headers=headers,
+            timeout=self.timeout,
+        )
+
+    def discard(self, proxy: ProxyAddress):
+        '''closes connections of proxy, e.g. when it is banned'''
+        with self._lock:
+            session = self._sessions.pop(proxy, None)
+            self._last_used.pop(proxy, None)
+        if session is not None:
+            session.close()
+
+    def evict_idle(self):
+        '''closes sessions which were not used for idle_timeout seconds'''
+        now = time.monotonic()
+        with self._lock:
+            self._last_eviction = now
+            idle_proxies = [
+                proxy for proxy, last_used in self._last_used.items()
+                if now - last_used > self.idle_timeout
+            ]
+        for proxy in idle_proxies:
+            self.discard(proxy)
+
+    def close(self):
+        '''closes all sessions'''
+        with self._lock:
+            proxies = list(self._sessions)
+        for proxy in proxies:
+            self.discard(proxy)
+
+    def __len__(self):
+        return len(self._sessions)